@@ -0,0 +1,176 @@
+import re
+import threading
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, union_all
+from config import db
+from models import ArchivedMeeting, Attendee, CheckIn, Meeting, Registration
+
+DEFAULT_ARCHIVE_AFTER_DAYS = 30
+ARCHIVE_INFIX = '_archive_'
+
+# Archive tables are created on demand, one set per partition, so they live outside
+# db.metadata; migrations/env.py keeps autogenerate away from them
+archive_metadata = MetaData()
+_archive_metadata_lock = threading.Lock()
+
+ArchiveTables = namedtuple('ArchiveTables', 'registrations attendees check_ins')
+LIVE = ArchiveTables(Registration.__table__, Attendee.__table__, CheckIn.__table__)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def partition_for(meeting_date):
+    """Meetings are archived by the year they took place in"""
+    return str(meeting_date.year)
+
+
+def archive_table(table, partition, *indexed):
+    """The archive copy of a live table: same columns, no foreign keys or unique constraints"""
+    name = f"{table.name}{ARCHIVE_INFIX}{partition}"
+    if name in archive_metadata.tables:
+        return archive_metadata.tables[name]
+    archive = Table(name, archive_metadata, *(
+        Column(column.name, column.type, primary_key=column.primary_key, nullable=column.nullable,
+               autoincrement=False)
+        for column in table.columns
+    ))
+    for column in indexed:
+        Index(f"ix_{name}_{column}", archive.c[column])
+    return archive
+
+
+def archive_tables(partition):
+    if not re.fullmatch(r'\w+', partition):
+        raise ArchiveError(f"Invalid archive partition {partition!r}")
+    with _archive_metadata_lock:
+        return ArchiveTables(
+            archive_table(LIVE.registrations, partition, 'meeting_id', 'invoice_number'),
+            archive_table(LIVE.attendees, partition, 'registration_id'),
+            archive_table(LIVE.check_ins, partition),
+        )
+
+
+def move_rows(source, target, meeting_id):
+    """Move a meeting's registrations, attendees and check-ins between two sets of tables
+
+    Runs in the caller's transaction with one INSERT ... SELECT and one DELETE
+    per table. Parents are copied first, so the live tables' triggers (search
+    index, check-in change log) see the registration when its attendees arrive;
+    children are deleted first, since their filters go through the parents.
+    """
+    registration_ids = select(source.registrations.c.id).where(source.registrations.c.meeting_id == meeting_id)
+    attendee_ids = select(source.attendees.c.id).where(source.attendees.c.registration_id.in_(registration_ids))
+    steps = (
+        ("registrations", source.registrations.c.meeting_id == meeting_id),
+        ("attendees", source.attendees.c.registration_id.in_(registration_ids)),
+        ("check_ins", source.check_ins.c.attendee_id.in_(attendee_ids)),
+    )
+    for name, where in steps:
+        source_table, target_table = getattr(source, name), getattr(target, name)
+        columns = [column.name for column in target_table.columns]
+        db.session.execute(insert(target_table).from_select(
+            columns, select(*(source_table.c[column] for column in columns)).where(where)))
+    return {name: db.session.execute(delete(getattr(source, name)).where(where)).rowcount
+            for name, where in reversed(steps)}
+
+
+# -------------------------------
+# ARCHIVE AND RESTORE
+# -------------------------------
+
+def archive_meeting(meeting_id, meeting_date):
+    """Move one meeting's rows out of the live tables into its partition, then commit
+
+    Rollups are left alone, so dashboard totals still include archived meetings.
+    Archived attendees drop out of the attendee search index. Registrations
+    added after a meeting was archived join it in the same partition.
+    """
+    record = db.session.get(ArchivedMeeting, meeting_id)
+    partition = record.partition if record is not None else partition_for(meeting_date)
+    tables = archive_tables(partition)
+    connection = db.session.connection()
+    for table in tables:
+        table.create(connection, checkfirst=True)
+
+    moved = move_rows(LIVE, tables, meeting_id)
+    if record is None:
+        record = ArchivedMeeting(meeting_id=meeting_id, partition=partition, registrations=0, attendees=0,
+                                 check_ins=0)
+        db.session.add(record)
+    record.registrations += moved["registrations"]
+    record.attendees += moved["attendees"]
+    record.check_ins += moved["check_ins"]
+    record.archived_at = datetime.utcnow()
+    db.session.commit()
+    return {"meeting_id": meeting_id, "partition": partition, **moved}
+
+
+def archive_past_meetings(older_than_days=DEFAULT_ARCHIVE_AFTER_DAYS, dry_run=False):
+    """Archive every meeting that took place more than ``older_than_days`` ago and still has live registrations
+
+    Each meeting is its own transaction. The grace period leaves time for late
+    payment callbacks, which only match live registrations.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    live_registrations = (
+        select(func.count(Registration.id)).where(Registration.meeting_id == Meeting.id).scalar_subquery()
+    )
+    meetings = db.session.execute(
+        select(Meeting.id, Meeting.date, live_registrations)
+        .where(Meeting.date < cutoff, live_registrations > 0)
+        .order_by(Meeting.date, Meeting.id)
+    ).all()
+    if dry_run:
+        return [{"meeting_id": meeting_id, "partition": partition_for(date), "registrations": count}
+                for meeting_id, date, count in meetings]
+    return [archive_meeting(meeting_id, date) for meeting_id, date, _ in meetings]
+
+
+def restore_meeting(meeting_id):
+    """Move an archived meeting's rows back into the live tables, then commit; None if it is not archived
+
+    Raises IntegrityError, with nothing restored, if an archived invoice number
+    or id has been taken in the live tables since.
+    """
+    record = db.session.get(ArchivedMeeting, meeting_id)
+    if record is None:
+        return None
+    moved = move_rows(archive_tables(record.partition), LIVE, meeting_id)
+    db.session.delete(record)
+    db.session.commit()
+    return {"meeting_id": meeting_id, "partition": record.partition, **moved}
+
+
+# -------------------------------
+# ARCHIVE-AWARE READS
+# -------------------------------
+
+def archived_partitions(meeting_id=None):
+    query = select(ArchivedMeeting.partition).distinct()
+    if meeting_id is not None:
+        query = query.where(ArchivedMeeting.meeting_id == meeting_id)
+    return sorted(db.session.scalars(query))
+
+
+def registration_tables(meeting_id=None):
+    """(registrations, attendees) selectables covering live and archived rows
+
+    Use ``.c`` on them as on the live tables. They are the live tables
+    themselves when nothing relevant is archived, so reads of the current season
+    pay nothing; otherwise each is a UNION ALL of the live table and the
+    archive partitions involved (only the meeting's own, given ``meeting_id``).
+    """
+    partitions = archived_partitions(meeting_id)
+    if not partitions:
+        return LIVE.registrations, LIVE.attendees
+    archives = [archive_tables(partition) for partition in partitions]
+
+    def combined(name):
+        live = getattr(LIVE, name)
+        parts = [select(*live.columns)]
+        parts += [select(*(getattr(archive, name).c[column.name] for column in live.columns)) for archive in archives]
+        return union_all(*parts).subquery(f"all_{live.name}")
+    return combined("registrations"), combined("attendees")
@@ -0,0 +1,13 @@
+"""Production entry point: the app under an ASGI server
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+app.py's app.run() stays the development server. ASGI_THREADS bounds the
+threads running Flask views; open event streams and CSV exports do not count
+against it.
+"""
+import os
+from async_bridge import AsgiBridge, DEFAULT_THREADS
+from app import app as flask_app
+
+app = AsgiBridge(flask_app, threads=int(os.environ.get('ASGI_THREADS', DEFAULT_THREADS)))
@@ -0,0 +1,255 @@
+"""Serve the Flask app under an ASGI server
+
+A local adapter rather than asgiref's WsgiToAsgi or a2wsgi: both keep a
+worker thread on each request until its last byte is sent, so every open
+event stream or long export would pin one. Here a view hands an async body
+back with stream_async() and the event loop sends it, which is what lets one
+process hold thousands of live dashboards (benchmarks/connections.py). The
+environ otherwise follows PEP 3333 as those adapters build it;
+benchmarks/bridge.py checks streaming, disconnects and header handling.
+"""
+import asyncio
+import itertools
+import sys
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from flask import request
+from async_db import dispose_async_engine
+
+LOOP_KEY = 'asgi_bridge.loop'
+BODY_KEY = 'asgi_bridge.body'
+DEFAULT_THREADS = 32
+BODY_SPOOL_SIZE = 1024 * 1024
+
+
+# --------------- View helpers -----------------
+def bridge_loop():
+    """The event loop serving this request when it came in through AsgiBridge, else None"""
+    return request.environ.get(LOOP_KEY)
+
+
+def stream_async(body):
+    """Hand an async iterable of bytes to AsgiBridge as the response body
+
+    Returns an empty iterable to build the Response with. Status, headers and
+    after_request hooks apply as usual; the bridge then sends ``body`` from the
+    event loop, so a response that mostly waits holds no worker thread. Clean
+    up with Response.call_on_close, which runs whether or not ``body`` started.
+    """
+    request.environ[BODY_KEY] = body
+    return iter(())
+
+
+def build_environ(scope, body):
+    """A WSGI environ for an ASGI http scope and its buffered body"""
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope['query_string'].decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        # The body is buffered whole, so it can be read to EOF even when a chunked upload has no Content-Length
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+    headers = defaultdict(list)
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if '_' in name:
+            # X_Forwarded_For would land on the same key as X-Forwarded-For; drop it as gunicorn does
+            continue
+        name = name.upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = f"HTTP_{name}"
+        headers[name].append(value.decode('latin1'))
+    for name, values in headers.items():
+        # Cookie pairs are separated by semicolons (RFC 6265); other repeated headers by commas
+        environ[name] = ('; ' if name == 'HTTP_COOKIE' else ',').join(values)
+    return environ
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class AsgiBridge:
+    """Serve the Flask app under an ASGI server (uvicorn asgi:app)
+
+    Blueprints, hooks and error handlers run unchanged on a bounded thread
+    pool. The waiting around them stays on the event loop: a request body is
+    received before a thread is taken, and bodies handed over with
+    stream_async() are sent without one.
+    """
+
+    def __init__(self, app, threads=DEFAULT_THREADS):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi-bridge')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        elif scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        else:
+            # No websocket routes; refuse the handshake
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1000})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await dispose_async_engine(self.app)
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive, limit):
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                raise ClientDisconnected()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit is not None and size > limit:
+                body.close()
+                return None
+            body.write(chunk)
+            if not message.get('more_body'):
+                body.seek(0)
+                return body
+
+    async def http(self, scope, receive, send):
+        try:
+            body = await self.read_body(receive, self.app.config.get('MAX_CONTENT_LENGTH'))
+        except ClientDisconnected:
+            return
+        if body is None:
+            await send({'type': 'http.response.start', 'status': 413,
+                        'headers': [(b'content-type', b'text/plain')]})
+            await send({'type': 'http.response.body', 'body': b'Request body too large'})
+            return
+
+        loop = asyncio.get_running_loop()
+        environ = build_environ(scope, body)
+        environ[LOOP_KEY] = loop
+        disconnected = loop.create_task(self.wait_for_disconnect(receive))
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['message'] = {
+                'type': 'http.response.start',
+                'status': int(status.split(' ', 1)[0]),
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            }
+
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            """In a pool thread: call the app and, unless it was handed to the loop, its body
+
+            A body of one chunk, which is every non-streamed response, goes back
+            to the loop whole; longer ones are sent from here as they come.
+            """
+            result = self.app(environ, start_response)
+            if BODY_KEY in environ:
+                return 'async', result
+            try:
+                chunks = iter(result)
+                first, second = next(chunks, b''), next(chunks, None)
+                if second is None:
+                    return 'whole', first
+                call(started['message'])
+                for chunk in itertools.chain((first, second), chunks):
+                    if disconnected.done():
+                        return 'sent', None
+                    if chunk:
+                        call({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                call({'type': 'http.response.body', 'body': b''})
+                return 'sent', None
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        try:
+            kind, result = await loop.run_in_executor(self.executor, run)
+            if kind == 'whole':
+                await send(started['message'])
+                await send({'type': 'http.response.body', 'body': result})
+            elif kind == 'async':
+                close = once(lambda: loop.run_in_executor(self.executor, result.close))
+                try:
+                    await send(started['message'])
+                    await self.send_async_body(environ[BODY_KEY], send, disconnected, close)
+                finally:
+                    # Runs the response's call_on_close callbacks
+                    await close()
+        finally:
+            disconnected.cancel()
+            body.close()
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_async_body(self, body, send, disconnected, close):
+        """Send a stream_async() body until it ends or the client goes away
+
+        On a disconnect the response is closed first, so its call_on_close
+        callbacks can end the body (an event stream unsubscribes, which wakes
+        it); the chunk being produced is then let finish rather than cancelled
+        in the middle of a database fetch.
+        """
+        chunks = aiter(body)
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(anext(chunks))
+                await asyncio.wait((next_chunk, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if not next_chunk.done():
+                    await close()
+                    with suppress(StopAsyncIteration):
+                        await next_chunk
+                    return
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(chunks, 'aclose'):
+                await chunks.aclose()
+
+
+def once(coroutine_function):
+    """Wrap a coroutine function so that only its first call runs it"""
+    called = []
+
+    async def call():
+        if not called:
+            called.append(True)
+            await coroutine_function()
+    return call
@@ -0,0 +1,57 @@
+import importlib.util
+import threading
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from config import engine_options, is_memory_sqlite, sqlite_pragma_listener
+
+# Async drivers for the sync URLs the app is configured with
+ASYNC_DRIVERS = {
+    "sqlite": ("sqlite+aiosqlite", "aiosqlite"),
+    "postgresql": ("postgresql+asyncpg", "asyncpg"),
+}
+_engine_lock = threading.Lock()
+
+
+def async_url(url):
+    """The async-driver form of a database URL; None when there is no async driver for it here"""
+    if is_memory_sqlite(url):
+        # A second engine would open a different, empty database
+        return None
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None or importlib.util.find_spec(driver[1]) is None:
+        return None
+    return url.set(drivername=driver[0])
+
+
+def async_engine(app):
+    """The app's AsyncEngine for the primary database, created on first use; None if unavailable
+
+    It shares the pool settings and SQLite pragmas of the sync engine, and is
+    only used from the ASGI server's event loop.
+    """
+    if 'async_db' in app.extensions:
+        return app.extensions['async_db']
+    with _engine_lock:
+        if 'async_db' not in app.extensions:
+            url = async_url(app.config['SQLALCHEMY_DATABASE_URI'])
+            engine = None
+            if url is not None:
+                from sqlalchemy.ext.asyncio import create_async_engine
+                engine = create_async_engine(url, **engine_options(app.config))
+                if url.get_backend_name() == 'sqlite':
+                    event.listen(engine.sync_engine, 'connect', sqlite_pragma_listener(app.config))
+            app.extensions['async_db'] = engine
+    return app.extensions['async_db']
+
+
+def async_session(app):
+    """A new AsyncSession on the app's async engine: ``async with async_session(app) as session: ...``"""
+    from sqlalchemy.ext.asyncio import AsyncSession
+    return AsyncSession(async_engine(app), expire_on_commit=False)
+
+
+async def dispose_async_engine(app):
+    engine = app.extensions.pop('async_db', None)
+    if engine is not None:
+        await engine.dispose()
@@ -0,0 +1,207 @@
+"""Behaviour checks for the ASGI bridge in async_bridge.py.
+
+Drives AsgiBridge in-process with scripted ASGI messages, against the app on
+a throwaway SQLite database plus a few probe routes, and exits non-zero when
+any check fails:
+
+- headers: repeated Cookie headers arrive as separate cookies, other repeated
+  headers are comma-joined, header names with underscores are dropped
+- request bodies: a body sent in several messages and without Content-Length,
+  as chunked uploads arrive, reaches the view whole; one over
+  MAX_CONTENT_LENGTH gets a 413 without running the view
+- streaming: a generator response goes out chunk by chunk, a stream_async()
+  body is sent from the event loop
+- disconnects: a client leaving mid-stream closes the response, so a generator
+  stops and the live event stream unsubscribes
+
+    python -m benchmarks.bridge
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Response, jsonify, request  # noqa: E402
+from async_bridge import AsgiBridge, stream_async  # noqa: E402
+from config import create_app  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from models import Admin  # noqa: E402
+from routes.admin_auth import issue_tokens  # noqa: E402
+
+MAX_CONTENT_LENGTH = 64 * 1024
+
+
+def add_probe_routes(app, closed):
+    """Routes that report what the view saw; ``closed`` collects generators that were closed"""
+
+    @app.route('/_bridge/headers')
+    def probe_headers():
+        return jsonify({"cookies": request.cookies.to_dict(), "accept": request.headers.get('Accept'),
+                        "forwarded_for": request.environ.get('HTTP_X_FORWARDED_FOR')})
+
+    @app.route('/_bridge/echo', methods=['POST'])
+    def probe_echo():
+        return jsonify({"length": len(request.get_data()), "content_type": request.content_type})
+
+    @app.route('/_bridge/generator')
+    def probe_generator():
+        count = request.args.get('chunks', 3, type=int)
+
+        def generate():
+            try:
+                for i in range(count):
+                    time.sleep(0.01)
+                    yield f"chunk {i}\n".encode()
+            finally:
+                closed.append('generator')
+        return Response(generate(), mimetype='text/plain')
+
+    @app.route('/_bridge/async')
+    def probe_async():
+        async def generate():
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield f"chunk {i}\n".encode()
+        return Response(stream_async(generate()), mimetype='text/plain')
+
+
+async def call(bridge, method, target, headers=(), body=(b'',), disconnect_after=None, timeout=10):
+    """Send one request through the bridge; returns the ASGI messages it sent back
+
+    ``body`` is the list of request body messages. With ``disconnect_after``
+    the client goes away once that many response body messages arrived.
+    """
+    path, _, query = target.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': method, 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'query_string': query.encode(), 'root_path': '',
+        'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+        'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 8000),
+    }
+    pending = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(body) - 1} for i, chunk in enumerate(body)]
+    gone = asyncio.Event()
+    sent = []
+
+    async def receive():
+        if pending:
+            return pending.pop(0)
+        await gone.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+        bodies = sum(m['type'] == 'http.response.body' for m in sent)
+        if disconnect_after is not None and bodies >= disconnect_after:
+            gone.set()
+
+    await asyncio.wait_for(bridge(scope, receive, send), timeout)
+    gone.set()
+    return sent
+
+
+def status_of(sent):
+    return sent[0]['status'] if sent and sent[0]['type'] == 'http.response.start' else None
+
+
+def body_of(sent):
+    return b''.join(m.get('body', b'') for m in sent if m['type'] == 'http.response.body')
+
+
+async def run_checks(bridge, app, token, closed):
+    """(name, passed, detail) for every check"""
+    checks = []
+
+    sent = await call(bridge, 'GET', '/_bridge/headers', headers=[
+        ('Cookie', 'a=1'), ('Cookie', 'b=2; c=3'), ('Accept', 'text/html'), ('Accept', 'application/json'),
+        ('X-Forwarded-For', '10.0.0.1'), ('X_Forwarded_For', '6.6.6.6'),
+    ])
+    seen = json.loads(body_of(sent))
+    checks.append(("repeated cookies", seen["cookies"] == {"a": "1", "b": "2", "c": "3"}, seen["cookies"]))
+    checks.append(("repeated headers comma-joined", seen["accept"] == "text/html,application/json", seen["accept"]))
+    checks.append(("underscore header names dropped", seen["forwarded_for"] == "10.0.0.1", seen["forwarded_for"]))
+
+    payload = b'x' * 40000
+    sent = await call(bridge, 'POST', '/_bridge/echo', headers=[('Content-Type', 'application/octet-stream')],
+                      body=[payload[:10000], payload[10000:30000], payload[30000:]])
+    seen = json.loads(body_of(sent))
+    checks.append(("chunked request body", seen == {"length": len(payload), "content_type": "application/octet-stream"},
+                   seen))
+    sent = await call(bridge, 'POST', '/_bridge/echo', body=[b'x' * MAX_CONTENT_LENGTH, b'x'])
+    checks.append(("oversized body refused", status_of(sent) == 413, status_of(sent)))
+
+    sent = await call(bridge, 'GET', '/_bridge/generator?chunks=3')
+    chunks = [m['body'] for m in sent if m['type'] == 'http.response.body' and m.get('body')]
+    checks.append(("generator streamed", chunks == [b"chunk 0\n", b"chunk 1\n", b"chunk 2\n"]
+                   and sent[-1] == {'type': 'http.response.body', 'body': b''}, chunks))
+    sent = await call(bridge, 'GET', '/_bridge/async')
+    checks.append(("stream_async body", status_of(sent) == 200 and body_of(sent) == b"chunk 0\nchunk 1\nchunk 2\n",
+                   body_of(sent)))
+
+    del closed[:]
+    sent = await call(bridge, 'GET', '/_bridge/generator?chunks=100000', disconnect_after=2)
+    checks.append(("generator closed on disconnect", closed == ['generator'] and len(sent) < 100, len(sent)))
+
+    broker = app.extensions['events']
+    sent = await call(bridge, 'GET', '/api/admin/events', headers=[('Authorization', f'Bearer {token}')],
+                      disconnect_after=1)
+    # The broker is released from the pool thread that closes the response
+    for _ in range(100):
+        if broker.stats()["subscribers"] == 0:
+            break
+        await asyncio.sleep(0.01)
+    checks.append(("event stream unsubscribed on disconnect",
+                   status_of(sent) == 200 and broker.stats()["subscribers"] == 0, broker.stats()))
+    return checks
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='registration-bridge-check-')
+    try:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "JWT_SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+            "BCRYPT_LOG_ROUNDS": 4,
+            "RATE_LIMIT_ENABLED": False,
+            "PAYMENT_WORKER_ENABLED": False,
+            "JOB_WORKER_ENABLED": False,
+            "MAX_CONTENT_LENGTH": MAX_CONTENT_LENGTH,
+        })
+        closed = []
+        add_probe_routes(app, closed)
+        with app.app_context():
+            seed({"stations": 1, "districts": 1, "churches": 1, "meetings": 0, "registrations": 0, "attendees": 0})
+            token = issue_tokens(Admin.query.first())["access_token"]
+
+        bridge = AsgiBridge(app, threads=args.threads)
+        try:
+            checks = asyncio.run(run_checks(bridge, app, token, closed))
+        finally:
+            bridge.executor.shutdown(wait=True, cancel_futures=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "checks": {name: passed for name, passed, _ in checks},
+        "problems": [f"{name}: got {detail!r}" for name, passed, detail in checks if not passed],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=4, help="bridge thread pool size")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if results["problems"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
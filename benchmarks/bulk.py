@@ -0,0 +1,115 @@
+"""Statements sent per bulk registration request.
+
+Seeds a throwaway SQLite database and posts --requests bulk bodies of --rows
+registrations each through the Flask test client, counting the SQL statements
+every request sends. Each batch of up to BULK_BATCH_SIZE rows should reach the
+registrations table as one multi-row INSERT and the attendees table as another;
+exits non-zero when a request sends more of either, or more than
+--max-statements statements in all.
+
+    python -m benchmarks.bulk --rows 50 --requests 20
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+from config import create_app, db  # noqa: E402
+from benchmarks.seed import seed, ADMIN_EMAIL, ADMIN_PASSWORD  # noqa: E402
+from routes.registration import DEFAULT_BULK_BATCH_SIZE  # noqa: E402
+
+
+def bulk_body(request_number, rows):
+    return [{
+        "station": "Station 1", "district": "District 1", "church": "Church 1",
+        "leader_name": "Bulk", "leader_phone": "0700000000", "amount": 1000,
+        "invoice_number": f"BULK-{request_number}-{i}",
+        "attendees": [{"name": "A", "age": 30}, {"name": "B", "age": 12}],
+    } for i in range(rows)]
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='registration-bulk-bench-')
+    try:
+        app = create_app({
+            "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "JWT_SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+            "RATE_LIMIT_ENABLED": False,
+            "PAYMENT_WORKER_ENABLED": False,
+            "JOB_WORKER_ENABLED": False,
+            "BULK_BATCH_SIZE": args.batch_size,
+        })
+        statements = []
+        with app.app_context():
+            seed({"stations": 5, "districts": 3, "churches": 3, "meetings": 0, "registrations": 0, "attendees": 0})
+            event.listen(db.engine, 'before_cursor_execute',
+                         lambda conn, cursor, statement, *rest: statements.append(statement))
+
+        client = app.test_client()
+        token = client.post('/api/admin/auth/admin/login',
+                            json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD}).get_json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        batches = math.ceil(args.rows / args.batch_size)
+        per_request, latencies, problems = [], [], []
+        for n in range(args.requests):
+            del statements[:]
+            start = time.perf_counter()
+            response = client.post('/api/registrations/bulk', json=bulk_body(n, args.rows), headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200 or response.get_json()["created"] != args.rows:
+                problems.append(f"request {n}: status {response.status_code}, {response.get_json()}")
+                continue
+            inserts = {table: sum(s.lstrip().startswith(f"INSERT INTO {table} ") for s in statements)
+                       for table in ("registrations", "attendees")}
+            per_request.append(len(statements))
+            for table, count in inserts.items():
+                if count > batches:
+                    problems.append(f"request {n}: {count} INSERTs into {table} for {batches} batch(es)")
+            if len(statements) > args.max_statements:
+                problems.append(f"request {n}: {len(statements)} statements (budget {args.max_statements})")
+
+        with app.app_context():
+            db.engine.dispose()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "rows": args.rows,
+        "batch_size": args.batch_size,
+        "requests": args.requests,
+        "statements_per_request": max(per_request) if per_request else None,
+        "p50_ms": round(statistics.median(latencies), 2) if latencies else None,
+        "problems": problems[:20],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50, help="registrations per bulk request")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BULK_BATCH_SIZE)
+    parser.add_argument("--max-statements", type=int, default=20, help="statement budget per request")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if results["problems"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
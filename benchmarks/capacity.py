@@ -0,0 +1,182 @@
+"""Concurrent registration stress test for meeting capacity.
+
+Serves the app on a threaded local HTTP server against a throwaway SQLite
+database, then fires --requests registrations for one meeting from --clients
+concurrent clients while some of the confirmed ones are cancelled. Afterwards
+it checks that the meeting was never oversold, that its counters match its
+registrations and that no waitlisted group was left behind while its seats
+were free. Exits non-zero if any check fails.
+
+    python -m benchmarks.capacity --clients 200 --requests 2000 --capacity 500
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+from config import create_app, db  # noqa: E402
+from benchmarks.seed import seed, ADMIN_EMAIL, ADMIN_PASSWORD  # noqa: E402
+from models import Meeting, Registration  # noqa: E402
+from seats import CONFIRMED, WAITLISTED  # noqa: E402
+
+
+def post(base_url, path, body, token=None):
+    """POST JSON; returns (status, body, seconds)"""
+    request = urllib.request.Request(base_url + path, data=json.dumps(body).encode(), method='POST',
+                                     headers={"Content-Type": "application/json"})
+    if token:
+        request.add_header("Authorization", f"Bearer {token}")
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status, payload = response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, json.loads(e.read() or b'{}')
+    return status, payload, time.perf_counter() - start
+
+
+def check_meeting(meeting_id):
+    """Return a list of invariant violations for one meeting"""
+    meeting = db.session.get(Meeting, meeting_id)
+    counts = dict(db.session.query(Registration.status, func.count()).filter(
+        Registration.meeting_id == meeting_id).group_by(Registration.status).all())
+    confirmed_seats = db.session.query(func.coalesce(func.sum(Registration.seats), 0)).filter(
+        Registration.meeting_id == meeting_id, Registration.status == CONFIRMED).scalar()
+    head = db.session.query(Registration.seats).filter(
+        Registration.meeting_id == meeting_id, Registration.status == WAITLISTED
+    ).order_by(Registration.id).first()
+
+    problems = []
+    if confirmed_seats > meeting.capacity:
+        problems.append(f"oversold: {confirmed_seats} seats confirmed for capacity {meeting.capacity}")
+    if confirmed_seats != meeting.seats_taken:
+        problems.append(f"seats_taken is {meeting.seats_taken} but confirmed registrations hold {confirmed_seats}")
+    if counts.get(WAITLISTED, 0) != meeting.waitlist_count:
+        problems.append(f"waitlist_count is {meeting.waitlist_count} but {counts.get(WAITLISTED, 0)} are waitlisted")
+    if head is not None and confirmed_seats + head.seats <= meeting.capacity:
+        problems.append(f"waitlist head needs {head.seats} seats but {meeting.capacity - confirmed_seats} are free")
+    return problems, counts, confirmed_seats
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='registration-capacity-bench-')
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "BCRYPT_LOG_ROUNDS": 4,
+        "PAYMENT_WORKER_ENABLED": False,
+        "JOB_WORKER_ENABLED": False,
+        "RATE_LIMIT_ENABLED": False,
+        # Every server thread holds a connection, and invoice allocation briefly takes a second
+        "DB_POOL_SIZE": args.clients,
+        "DB_MAX_OVERFLOW": args.clients,
+    })
+    with app.app_context():
+        seed({"stations": 2, "districts": 2, "churches": 2, "meetings": 0, "registrations": 0, "attendees": 0})
+        now = datetime.utcnow()
+        meeting = Meeting(title="Capacity test", date=now + timedelta(days=30), deadline=now + timedelta(days=20),
+                          registration_amount=500.0, capacity=args.capacity)
+        db.session.add(meeting)
+        db.session.commit()
+        meeting_id = meeting.id
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/api"
+    token = post(base_url, '/admin/auth/admin/login', {"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})[1]["access_token"]
+
+    rng = random.Random(args.seed)
+    confirmed_ids = []
+    lock = threading.Lock()
+    latencies = {"register": [], "cancel": []}
+    outcomes = {}
+
+    def register(n):
+        body = {"meeting_id": meeting_id, "station": "Station 1", "district": "District 1", "church": "Church 1",
+                "leader_name": f"Leader {n}", "leader_phone": f"07{n:08d}",
+                "attendees": [{"name": f"Attendee {n}-{a}", "age": 30} for a in range(rng.randint(1, 3))]}
+        status, payload, seconds = post(base_url, '/registrations', body, token)
+        with lock:
+            latencies["register"].append(seconds)
+            key = payload.get("status") if status == 201 else f"http {status}"
+            outcomes[key] = outcomes.get(key, 0) + 1
+            if payload.get("status") == CONFIRMED:
+                confirmed_ids.append(payload["id"])
+        # Every few requests, cancel an earlier confirmed registration to exercise promotion
+        if n % args.cancel_every == 0:
+            with lock:
+                victim = confirmed_ids.pop(rng.randrange(len(confirmed_ids))) if confirmed_ids else None
+            if victim is not None:
+                status, _, seconds = post(base_url, f'/registrations/{victim}/cancel', {}, token)
+                with lock:
+                    latencies["cancel"].append(seconds)
+                    outcomes["cancelled" if status == 200 else f"cancel http {status}"] = \
+                        outcomes.get("cancelled" if status == 200 else f"cancel http {status}", 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        list(pool.map(register, range(1, args.requests + 1)))
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    with app.app_context():
+        problems, counts, confirmed_seats = check_meeting(meeting_id)
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    def summary(values):
+        values = sorted(values)
+        if not values:
+            return {}
+        return {"count": len(values), "p50_ms": round(statistics.median(values) * 1000, 1),
+                "p99_ms": round(values[min(len(values) - 1, int(0.99 * len(values)))] * 1000, 1)}
+
+    return {
+        "clients": args.clients,
+        "requests": args.requests,
+        "capacity": args.capacity,
+        "seconds": round(elapsed, 2),
+        "requests_per_second": round((args.requests + len(latencies["cancel"])) / elapsed, 1),
+        "register": summary(latencies["register"]),
+        "cancel": summary(latencies["cancel"]),
+        "outcomes": outcomes,
+        "final": {"confirmed_seats": confirmed_seats, **counts},
+        "problems": problems,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--capacity", type=int, default=500)
+    parser.add_argument("--cancel-every", type=int, default=10, help="Cancel one confirmed registration every N requests.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if results["problems"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
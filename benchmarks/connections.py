@@ -0,0 +1,245 @@
+"""Concurrent connection capacity: the threaded sync server against the ASGI entry point.
+
+Each deployment is started in its own process on a small seeded SQLite
+database:
+
+- sync: app.py's server, Werkzeug with a thread per connection
+- asgi: ``uvicorn asgi:app``
+
+--connections live event streams (GET /api/admin/events) are opened against it,
+then the benchmark reports how many connected, the server's resident memory
+and thread count before and after (from /proc, so Linux only), the latency of
+plain GETs while the streams are open, and how long one registration takes to
+reach every stream.
+
+Exits non-zero when the ASGI deployment does not hold every connection, an
+event does not reach every connected stream, or memory per ASGI connection is
+over --max-kb-per-connection.
+
+    python -m benchmarks.connections --connections 1000 --output connections.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import create_app, db  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from models import Admin, Meeting  # noqa: E402
+from routes.admin_auth import issue_tokens  # noqa: E402
+
+# Access logs are off in both servers
+SYNC_SERVER = """
+import logging, sys
+from werkzeug.serving import make_server
+from app import app
+logging.getLogger('werkzeug').setLevel(logging.WARNING)
+make_server('127.0.0.1', int(sys.argv[1]), app, threaded=True).serve_forever()
+"""
+SERVERS = {
+    "sync": lambda port: [sys.executable, '-c', SYNC_SERVER, str(port)],
+    "asgi": lambda port: [sys.executable, '-m', 'uvicorn', 'asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                          '--log-level', 'warning', '--no-access-log'],
+}
+
+
+def prepare(workdir):
+    """Seed a small database; returns (url, access token, id of a meeting open for registration)"""
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    app = create_app({"SQLALCHEMY_DATABASE_URI": url, "BCRYPT_LOG_ROUNDS": 4,
+                      "PAYMENT_WORKER_ENABLED": False, "JOB_WORKER_ENABLED": False})
+    with app.app_context():
+        seed({"stations": 5, "districts": 3, "churches": 3, "meetings": 5, "registrations": 500, "attendees": 2})
+        now = datetime.utcnow()
+        meeting = Meeting(title="Connections", date=now + timedelta(days=30), deadline=now + timedelta(days=20),
+                          registration_amount=500.0)
+        db.session.add(meeting)
+        db.session.commit()
+        return url, issue_tokens(Admin.query.first())["access_token"], meeting.id
+
+
+def proc_status(pid):
+    """(resident memory in kB, thread count) of a process"""
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(':')
+            fields[name] = value.split()
+    return int(fields['VmRSS'][0]), int(fields['Threads'][0])
+
+
+async def http_request(port, method, path, token, body=None, timeout=30):
+    """One request on its own connection; returns (status, seconds)"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        payload = json.dumps(body).encode() if body is not None else b''
+        writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n"
+                      f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                      f"Connection: close\r\n\r\n").encode() + payload)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), timeout)
+        return int(response.split(b' ', 2)[1]), time.perf_counter() - start
+    finally:
+        writer.close()
+
+
+async def open_stream(port, token, timeout):
+    """Open an event stream and wait for its first frame; returns (reader, writer) or None"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    writer.write((f"GET /api/admin/events HTTP/1.1\r\nHost: localhost\r\nAuthorization: Bearer {token}\r\n"
+                  f"Accept: text/event-stream\r\n\r\n").encode())
+    try:
+        await asyncio.wait_for(reader.readuntil(b"retry: 3000"), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        writer.close()
+        return None
+    return reader, writer
+
+
+async def wait_for_event(reader, event_type, started, timeout):
+    try:
+        await asyncio.wait_for(reader.readuntil(f"event: {event_type}".encode()), timeout)
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+        return None
+    return time.perf_counter() - started
+
+
+def start_server(mode, port, env, token):
+    server = subprocess.Popen(SERVERS[mode](port), cwd=ROOT, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"{mode} server exited with {server.returncode}")
+        try:
+            if asyncio.run(http_request(port, 'GET', '/api/stations', token, timeout=2))[0] == 200:
+                return server
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+async def measure(mode, port, server, args, token, meeting_id):
+    rss_idle, threads_idle = proc_status(server.pid)
+    opening = asyncio.Semaphore(args.open_concurrency)
+
+    async def opened():
+        async with opening:
+            return await open_stream(port, token, args.timeout)
+    streams = [s for s in await asyncio.gather(*(opened() for _ in range(args.connections))) if s is not None]
+    await asyncio.sleep(1)
+    rss_connected, threads_connected = proc_status(server.pid)
+
+    probes = []
+    for _ in range(args.probes):
+        status, seconds = await http_request(port, 'GET', '/api/stations', token, timeout=args.timeout)
+        if status == 200:
+            probes.append(seconds * 1000)
+
+    body = {"meeting_id": meeting_id, "station": "Station 1", "district": "District 1", "church": "Church 1",
+            "leader_name": "Connections", "leader_phone": "0700000000", "attendees": [{"name": "A", "age": 30}]}
+    started = time.perf_counter()
+    waits = [asyncio.ensure_future(wait_for_event(reader, "registration.created", started, args.timeout))
+             for reader, _ in streams]
+    status, _ = await http_request(port, 'POST', '/api/registrations', token, body, timeout=args.timeout)
+    delivered = sorted(seconds * 1000 for seconds in await asyncio.gather(*waits) if seconds is not None)
+
+    for _, writer in streams:
+        writer.close()
+    connected = len(streams)
+    return {
+        "mode": mode,
+        "connections": args.connections,
+        "connected": connected,
+        "rss_idle_mb": round(rss_idle / 1024, 1),
+        "rss_connected_mb": round(rss_connected / 1024, 1),
+        "kb_per_connection": round((rss_connected - rss_idle) / connected, 1) if connected else None,
+        "threads_idle": threads_idle,
+        "threads_connected": threads_connected,
+        "probe_p50_ms": round(statistics.median(probes), 2) if probes else None,
+        "probe_p95_ms": round(statistics.quantiles(probes, n=20)[18], 2) if len(probes) >= 2 else None,
+        "register_status": status,
+        "events_delivered": len(delivered),
+        "fanout_p50_ms": round(statistics.median(delivered), 1) if delivered else None,
+        "fanout_max_ms": round(delivered[-1], 1) if delivered else None,
+    }
+
+
+def run(args):
+    # Both ends of every stream are in this machine's file table
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    workdir = tempfile.mkdtemp(prefix='registration-connections-bench-')
+    try:
+        url, token, meeting_id = prepare(workdir)
+        env = {**os.environ, "DATABASE_URL": url, "PAYMENT_WORKER_ENABLED": "0", "JOB_WORKER_ENABLED": "0",
+               "EVENT_STREAM_MAX_CLIENTS": str(args.connections + 100)}
+        results = []
+        for offset, mode in enumerate(args.modes):
+            port = args.port + offset
+            server = start_server(mode, port, env, token)
+            try:
+                results.append(asyncio.run(measure(mode, port, server, args, token, meeting_id)))
+            finally:
+                server.terminate()
+                try:
+                    server.wait(10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    problems = []
+    for result in results:
+        if result["events_delivered"] < result["connected"]:
+            problems.append(f"{result['mode']}: the event reached {result['events_delivered']} "
+                            f"of {result['connected']} streams")
+        if result["mode"] == "asgi":
+            if result["connected"] < result["connections"]:
+                problems.append(f"asgi: {result['connected']} of {result['connections']} streams connected")
+            if result["kb_per_connection"] is not None and result["kb_per_connection"] > args.max_kb_per_connection:
+                problems.append(f"asgi: {result['kb_per_connection']} kB per connection "
+                                f"(budget {args.max_kb_per_connection})")
+    return {"results": results, "problems": problems}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--modes', nargs='+', choices=sorted(SERVERS), default=["sync", "asgi"])
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--open-concurrency', type=int, default=50, help="streams being opened at once")
+    parser.add_argument('--probes', type=int, default=50, help="GET requests timed while the streams are open")
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--max-kb-per-connection', type=float, default=100.0)
+    parser.add_argument('--output', help="also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 1 if report["problems"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
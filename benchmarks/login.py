@@ -0,0 +1,155 @@
+"""Login storm benchmark, with and without the auth rate limiter.
+
+Starts the app on a threaded WSGI server, then for --duration seconds fires
+logins from --attackers threads (wrong passwords, one source address, a
+handful of emails) while a probe thread keeps requesting GET /api/meetings.
+Reports login throughput and latency, status codes, and the probe's p99 so the
+effect of bcrypt saturation on unrelated traffic is visible.
+
+    python -m benchmarks.login --attackers 32 --duration 10 --output login.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.serving import make_server  # noqa: E402
+from config import create_app, db  # noqa: E402
+from benchmarks.run import summarize  # noqa: E402
+from benchmarks.seed import ADMIN_EMAIL, ADMIN_PASSWORD, seed  # noqa: E402
+
+SIZES = {"stations": 2, "districts": 2, "churches": 2, "meetings": 50, "registrations": 100, "attendees": 2}
+
+
+def request(conn_holder, host, port, method, path, body=None, headers=None):
+    headers = dict(headers or {})
+    payload = None
+    if body is not None:
+        payload = json.dumps(body).encode()
+        headers["Content-Type"] = "application/json"
+    for attempt in range(2):
+        if conn_holder.get("conn") is None:
+            conn_holder["conn"] = http.client.HTTPConnection(host, port, timeout=120)
+        try:
+            conn_holder["conn"].request(method, path, body=payload, headers=headers)
+            response = conn_holder["conn"].getresponse()
+            data = response.read()
+            return response.status, data
+        except (http.client.HTTPException, ConnectionError):
+            conn_holder["conn"].close()
+            conn_holder["conn"] = None
+            if attempt:
+                raise
+
+
+def run_storm(rate_limited, args):
+    workdir = tempfile.mkdtemp(prefix='registration-login-bench-')
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "JWT_SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+        "BCRYPT_LOG_ROUNDS": args.rounds,
+        "PASSWORD_HASH_WORKERS": args.hash_workers,
+        "PASSWORD_HASH_QUEUE_LIMIT": args.hash_queue,
+        "RATE_LIMIT_ENABLED": rate_limited,
+        "PAYMENT_WORKER_ENABLED": False,
+        "JOB_WORKER_ENABLED": False,
+    })
+    with app.app_context():
+        seed(SIZES)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    logging.getLogger('registration.perf').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = '127.0.0.1', server.server_port
+
+    status, body = request({}, host, port, 'POST', '/api/admin/auth/admin/login',
+                           {"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+    token = json.loads(body)["access_token"]
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    login_latencies, login_statuses = [], {}
+    probe_latencies, probe_statuses = [], {}
+
+    def attacker(n):
+        holder = {}
+        i = 0
+        while not stop.is_set():
+            email = f"victim{(n + i) % 5}@example.com" if i % 4 else ADMIN_EMAIL
+            start = time.perf_counter()
+            status, _ = request(holder, host, port, 'POST', '/api/admin/auth/admin/login',
+                                {"email": email, "password": f"guess-{n}-{i}"})
+            elapsed = time.perf_counter() - start
+            with lock:
+                login_latencies.append(elapsed)
+                login_statuses[str(status)] = login_statuses.get(str(status), 0) + 1
+            i += 1
+
+    def probe():
+        holder = {}
+        while not stop.is_set():
+            start = time.perf_counter()
+            status, _ = request(holder, host, port, 'GET', '/api/meetings?limit=20',
+                                headers={"Authorization": f"Bearer {token}"})
+            elapsed = time.perf_counter() - start
+            with lock:
+                probe_latencies.append(elapsed)
+                probe_statuses[str(status)] = probe_statuses.get(str(status), 0) + 1
+            time.sleep(0.01)
+
+    threads = [threading.Thread(target=attacker, args=(n,)) for n in range(args.attackers)]
+    threads.append(threading.Thread(target=probe))
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    server.shutdown()
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "login": summarize(login_latencies, login_statuses, wall, 0),
+        "probe_get_meetings": summarize(probe_latencies, probe_statuses, wall, 0),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attackers", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--hash-workers", type=int, default=None)
+    parser.add_argument("--hash-queue", type=int, default=None)
+    parser.add_argument("--output", default="bench_login.json")
+    args = parser.parse_args(argv)
+
+    report = {"meta": {k: v for k, v in vars(args).items() if k != "output"}, "results": {}}
+    for label, limited in (("without_limiter", False), ("with_limiter", True)):
+        report["results"][label] = result = run_storm(limited, args)
+        login, probe = result["login"], result["probe_get_meetings"]
+        print(f"[{label}] logins {login['requests']} ({login['rps']}/s) p50 {login['p50_ms']} ms "
+              f"p99 {login['p99_ms']} ms statuses {login['status_codes']}")
+        print(f"[{label}] probe GET /api/meetings p50 {probe['p50_ms']} ms p99 {probe['p99_ms']} ms")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+"""Latency benchmark for every blueprint.
+
+Seeds a throwaway SQLite database, builds the app with ``create_app()`` and
+drives each endpoint through the Flask test client and/or a real threaded WSGI
+server, reporting p50/p95/p99 latency, requests per second and SQL queries per
+request.
+
+    python -m benchmarks.run --registrations 20000 --output bench.json
+    python -m benchmarks.run --output new.json --compare bench.json
+
+``--compare`` exits non-zero when any endpoint's p95 regressed by more than
+``--max-regression`` percent against the previous run.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event  # noqa: E402
+from werkzeug.serving import make_server  # noqa: E402
+from config import create_app, db  # noqa: E402
+from benchmarks.seed import DEFAULT_SIZES, ADMIN_EMAIL, ADMIN_PASSWORD, seed  # noqa: E402
+
+
+class QueryCounter:
+    """Counts statements on an engine; read before and after a run of requests"""
+
+    def __init__(self, engine):
+        self.count = 0
+        self._lock = threading.Lock()
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+
+def build_scenarios(ids):
+    """(name, method, path factory, body factory, auth) for every benchmarked endpoint"""
+    invoice_counter = itertools.count(1)
+    cycle = lambda values: itertools.cycle(values or [0])  # noqa: E731
+    meetings = cycle(ids["meeting_ids"])
+    stations = cycle(ids["station_ids"])
+    districts = cycle(ids["district_ids"])
+
+    def bulk_body():
+        n = next(invoice_counter)
+        return [{
+            "station": "Station 1", "district": "District 1", "church": "Church 1",
+            "leader_name": "Bench", "leader_phone": "0700000000", "amount": 1000,
+            "invoice_number": f"BENCH-{os.getpid()}-{n}-{i}",
+            "attendees": [{"name": "A", "age": 30}, {"name": "B", "age": 12}],
+        } for i in range(10)]
+
+    return [
+        ("meeting.list", "GET", lambda: "/api/meetings?limit=20", None, "jwt"),
+        ("meeting.list_projected", "GET", lambda: "/api/meetings?limit=20&fields=title,date&upcoming=1", None, "jwt"),
+        ("meeting.get", "GET", lambda: f"/api/meetings/{next(meetings)}", None, "jwt"),
+        ("locations.stations", "GET", lambda: "/api/stations", None, "jwt"),
+        ("locations.districts", "GET", lambda: f"/api/stations/{next(stations)}/districts", None, "jwt"),
+        ("locations.churches", "GET", lambda: f"/api/districts/{next(districts)}/churches", None, "jwt"),
+        ("locations.tree", "GET", lambda: "/api/locations/tree", None, "jwt"),
+        ("admin_auth.login", "POST", lambda: "/api/admin/auth/admin/login",
+         lambda: {"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD}, None),
+        ("admin_auth.profile", "GET", lambda: "/api/admin/auth/admin/profile", None, "jwt"),
+        ("admin_auth.all", "GET", lambda: "/api/admin/auth/admin/all", None, "jwt"),
+        ("admin.stats", "GET", lambda: "/api/admin/stats?by=district", None, "jwt"),
+        ("registration.bulk_10", "POST", lambda: "/api/registrations/bulk", bulk_body, "jwt"),
+    ]
+
+
+def auth_headers(app):
+    """Log the seeded super admin in once and reuse its access token"""
+    response = app.test_client().post('/api/admin/auth/admin/login',
+                                      json={"email": ADMIN_EMAIL, "password": ADMIN_PASSWORD})
+    token = response.get_json()["access_token"]
+    return {
+        "jwt": {"Authorization": f"Bearer {token}"},
+        None: {},
+    }
+
+
+def summarize(latencies, statuses, wall_time, queries):
+    latencies = sorted(latencies)
+    n = len(latencies)
+
+    def pct(p):
+        return round(latencies[min(n - 1, int(round(p / 100 * (n - 1))))] * 1000, 3) if n else None
+
+    return {
+        "requests": n,
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 400),
+        "status_codes": statuses,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if n else None,
+        "rps": round(n / wall_time, 1) if wall_time else None,
+        "queries_per_request": round(queries / n, 2) if n else None,
+    }
+
+
+def run_scenario(send, scenario, headers, requests, concurrency, counter):
+    name, method, path_factory, body_factory, auth = scenario
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def one(_):
+        body = body_factory() if body_factory else None
+        start = time.perf_counter()
+        status = send(method, path_factory(), body, headers[auth])
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    queries_before = counter.count
+    wall_start = time.perf_counter()
+    if concurrency <= 1:
+        for i in range(requests):
+            one(i)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(requests)))
+    wall_time = time.perf_counter() - wall_start
+    return summarize(latencies, statuses, wall_time, counter.count - queries_before)
+
+
+def test_client_sender(app):
+    local = threading.local()
+
+    def send(method, path, body, headers):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client(use_cookies=False)
+        response = local.client.open(path, method=method, json=body, headers=headers)
+        response.close()
+        return response.status_code
+
+    return send
+
+
+def wsgi_sender(host, port):
+    local = threading.local()
+
+    def send(method, path, body, headers):
+        if not hasattr(local, 'conn'):
+            local.conn = http.client.HTTPConnection(host, port, timeout=60)
+        payload = json.dumps(body).encode() if body is not None else None
+        request_headers = dict(headers)
+        if payload is not None:
+            request_headers["Content-Type"] = "application/json"
+        try:
+            local.conn.request(method, path, body=payload, headers=request_headers)
+            response = local.conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            local.conn.close()
+            local.conn = http.client.HTTPConnection(host, port, timeout=60)
+            local.conn.request(method, path, body=payload, headers=request_headers)
+            response = local.conn.getresponse()
+        response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            local.conn.close()
+            del local.conn
+        return response.status
+
+    return send
+
+
+def run(args):
+    sizes = {key: getattr(args, key) for key in DEFAULT_SIZES}
+    workdir = tempfile.mkdtemp(prefix='registration-bench-')
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "JWT_SECRET_KEY": "benchmark-secret-key-benchmark-secret-key",
+        # Every benchmark request comes from one address; see benchmarks.login for the limiter
+        "RATE_LIMIT_ENABLED": False,
+        "PAYMENT_WORKER_ENABLED": False,
+        "JOB_WORKER_ENABLED": False,
+    })
+
+    with app.app_context():
+        seed_start = time.perf_counter()
+        ids = seed(sizes)
+        seed_time = time.perf_counter() - seed_start
+        counter = QueryCounter(db.engine)
+
+    headers = auth_headers(app)
+    scenarios = [s for s in build_scenarios(ids) if not args.only or any(s[0].startswith(o) for o in args.only)]
+
+    results = {}
+    if args.server in ('testclient', 'both'):
+        send = test_client_sender(app)
+        results["testclient"] = {
+            s[0]: run_scenario(send, s, headers, args.requests, args.concurrency, counter) for s in scenarios
+        }
+
+    if args.server in ('wsgi', 'both'):
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        logging.getLogger('registration.perf').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            send = wsgi_sender('127.0.0.1', server.server_port)
+            results["wsgi"] = {
+                s[0]: run_scenario(send, s, headers, args.requests, args.concurrency, counter) for s in scenarios
+            }
+        finally:
+            server.shutdown()
+
+    with app.app_context():
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "requests_per_endpoint": args.requests,
+            "concurrency": args.concurrency,
+            "seed_seconds": round(seed_time, 2),
+        },
+        "results": results,
+    }
+
+
+def compare(current, previous, max_regression):
+    """Print p95 changes per endpoint; return True when nothing regressed past the limit"""
+    ok = True
+    for mode, endpoints in current["results"].items():
+        for name, stats in endpoints.items():
+            before = previous.get("results", {}).get(mode, {}).get(name)
+            if not before or not before.get("p95_ms") or stats["p95_ms"] is None:
+                continue
+            change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+            flag = ""
+            if change > max_regression:
+                flag = "  REGRESSION"
+                ok = False
+            print(f"{mode:10} {name:28} p95 {before['p95_ms']:9.2f} -> {stats['p95_ms']:9.2f} ms "
+                  f"({change:+6.1f}%)  queries {before['queries_per_request']} -> {stats['queries_per_request']}{flag}")
+    return ok
+
+
+def print_table(report):
+    for mode, endpoints in report["results"].items():
+        print(f"\n[{mode}]")
+        print(f"{'endpoint':28} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8} {'queries':>8} {'errors':>7}")
+        for name, s in endpoints.items():
+            print(f"{name:28} {s['p50_ms']:8.2f} {s['p95_ms']:8.2f} {s['p99_ms']:8.2f} "
+                  f"{s['rps']:8.1f} {s['queries_per_request']:8.2f} {s['errors']:7}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    for key, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{key}", type=int, default=default)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--server", choices=("testclient", "wsgi", "both"), default="both")
+    parser.add_argument("--only", nargs="*", help="endpoint name prefixes to run, e.g. meeting locations.tree")
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="previous results file to compare p95 against")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="allowed p95 regression in percent")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    print_table(report)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print()
+        if not compare(report, previous, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
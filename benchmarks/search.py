@@ -0,0 +1,111 @@
+"""Attendee search latency benchmark.
+
+Seeds --attendees attendees (three per registration) into a throwaway SQLite
+database, whose triggers fill the FTS5 index as rows are inserted, builds the
+typo table, then times search_attendees() for prefix, exact, phone, invoice
+and misspelled queries drawn from the seeded data.
+
+    python -m benchmarks.search --attendees 1000000 --queries 200
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import create_app, db  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from models import Attendee, Registration  # noqa: E402
+from search import refresh_search_terms, search_attendees  # noqa: E402
+
+
+def misspell(word, rng):
+    """Swap one inner letter for another, keeping the first letter"""
+    position = rng.randrange(1, len(word))
+    letter = rng.choice([c for c in 'aeiourtnk' if c != word[position]])
+    return word[:position] + letter + word[position + 1:]
+
+
+def make_queries(samples, rng, count):
+    kinds = {
+        "name_prefix": lambda a, r: f"{a.name.split()[0][:4]} {a.name.split()[1][:3]}",
+        "full_name": lambda a, r: a.name,
+        "leader_name": lambda a, r: r.leader_name,
+        "phone_prefix": lambda a, r: r.leader_phone[:7],
+        "invoice": lambda a, r: r.invoice_number,
+        "typo": lambda a, r: f"{misspell(a.name.split()[0].lower(), rng)} {a.name.split()[1].lower()}",
+    }
+    return {kind: [build(*rng.choice(samples)) for _ in range(count)] for kind, build in kinds.items()}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='registration-search-bench-')
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "BCRYPT_LOG_ROUNDS": 4,
+        "PAYMENT_WORKER_ENABLED": False,
+        "JOB_WORKER_ENABLED": False,
+    })
+    rng = random.Random(args.seed)
+    results = {}
+    with app.app_context():
+        started = time.perf_counter()
+        seed({"stations": 10, "districts": 5, "churches": 5, "meetings": 10,
+              "registrations": max(1, args.attendees // 3), "attendees": 3})
+        print(f"Seeded {args.attendees} attendees in {time.perf_counter() - started:.1f}s")
+        started = time.perf_counter()
+        terms = refresh_search_terms()
+        print(f"Indexed {terms} words for typo matching in {time.perf_counter() - started:.1f}s")
+
+        sample_ids = rng.sample(range(1, args.attendees + 1), min(500, args.attendees))
+        samples = db.session.query(Attendee, Registration).join(Registration, Registration.id == Attendee.registration_id) \
+            .filter(Attendee.id.in_(sample_ids)).all()
+        queries = make_queries(samples, rng, args.queries)
+
+        for kind, texts in queries.items():
+            search_attendees(texts[0])  # warm the page cache
+            latencies, hits, modes = [], 0, {}
+            for query in texts:
+                start = time.perf_counter()
+                found, mode = search_attendees(query)
+                latencies.append(time.perf_counter() - start)
+                hits += bool(found)
+                modes[mode] = modes.get(mode, 0) + 1
+            latencies.sort()
+            results[kind] = {
+                "queries": len(texts),
+                "hit_rate": round(hits / len(texts), 3),
+                "modes": modes,
+                "p50_ms": round(statistics.median(latencies) * 1000, 2),
+                "p99_ms": round(latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))] * 1000, 2),
+            }
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attendees", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    for kind, r in results.items():
+        print(f"{kind:<13} p50 {r['p50_ms']:>7} ms  p99 {r['p99_ms']:>7} ms  hit rate {r['hit_rate']}  {r['modes']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
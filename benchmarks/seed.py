@@ -0,0 +1,116 @@
+"""Seed a benchmark database with a synthetic conference.
+
+Sizes are per parent: ``districts`` is districts per station, ``churches`` is
+churches per district and ``attendees`` is attendees per registration.
+"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from config import db
+from models import Station, District, Church, Meeting, Registration, Attendee, Admin
+
+DEFAULT_SIZES = {
+    "stations": 10,
+    "districts": 5,
+    "churches": 5,
+    "meetings": 200,
+    "registrations": 5000,
+    "attendees": 3,
+}
+
+ADMIN_EMAIL = "bench@example.com"
+ADMIN_PASSWORD = "bench-password"
+CHUNK = 1000
+SYLLABLES = ("ka", "ki", "mu", "wa", "nje", "ri", "to", "ma", "che", "ro", "ne", "ja", "bi", "lo", "sa", "ng", "ti", "we")
+
+
+def fake_name(rng):
+    """Pronounceable 'First Last' names, so search benchmarks see a realistic vocabulary"""
+    def word():
+        return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    return f"{word()} {word()}"
+
+
+def chunked_insert(model, rows):
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model), rows[start:start + CHUNK])
+
+
+def seed(sizes, seed_value=1234):
+    """Create the schema and fill it; returns the ids the benchmark needs"""
+    from passwords import hash_password
+    from rollups import rebuild_rollups
+    from seats import recount_seats
+
+    rng = random.Random(seed_value)
+    db.drop_all()
+    db.create_all()
+
+    stations = [{"id": s + 1, "name": f"Station {s + 1}"} for s in range(sizes["stations"])]
+    districts = []
+    churches = []
+    for station in stations:
+        for _ in range(sizes["districts"]):
+            district_id = len(districts) + 1
+            districts.append({"id": district_id, "name": f"District {district_id}", "station_id": station["id"]})
+            for _ in range(sizes["churches"]):
+                church_id = len(churches) + 1
+                churches.append({"id": church_id, "name": f"Church {church_id}", "district_id": district_id,
+                                 "_station": station["name"], "_district": f"District {district_id}"})
+
+    chunked_insert(Station, stations)
+    chunked_insert(District, districts)
+    chunked_insert(Church, [{k: v for k, v in c.items() if not k.startswith('_')} for c in churches])
+
+    now = datetime.utcnow()
+    meetings = []
+    for m in range(sizes["meetings"]):
+        date = now + timedelta(days=m - sizes["meetings"] // 2)
+        meetings.append({
+            "id": m + 1,
+            "title": f"Meeting {m + 1}",
+            "date": date,
+            "deadline": date - timedelta(days=7),
+            "registration_amount": 500.0,
+            "poster_url": f"https://example.com/posters/{m + 1}.jpg",
+            "description": "Lorem ipsum dolor sit amet. " * 40,
+        })
+    chunked_insert(Meeting, meetings)
+
+    registrations = []
+    attendees = []
+    for r in range(sizes["registrations"]):
+        church = rng.choice(churches) if churches else {"name": "", "_station": "", "_district": ""}
+        registrations.append({
+            "id": r + 1,
+            "timestamp": now,
+            "station": church["_station"],
+            "district": church["_district"],
+            "church": church["name"],
+            "church_id": church.get("id"),
+            "leader_name": fake_name(rng),
+            "leader_phone": f"07{r:08d}",
+            "amount": 500.0 * sizes["attendees"],
+            "invoice_number": f"SEED-{r + 1:08d}",
+            "paid": rng.random() < 0.6,
+            "meeting_id": rng.choice(meetings)["id"] if meetings else None,
+            "seats": max(1, sizes["attendees"]),
+        })
+        for a in range(sizes["attendees"]):
+            attendees.append({"name": fake_name(rng), "age": rng.randint(1, 80), "registration_id": r + 1})
+    chunked_insert(Registration, registrations)
+    chunked_insert(Attendee, attendees)
+
+    admin = Admin(username="bench", email=ADMIN_EMAIL, role="super_admin", is_active=True,
+                  password_hash=hash_password(ADMIN_PASSWORD))
+    db.session.add(admin)
+    db.session.commit()
+    rebuild_rollups()
+    recount_seats()
+
+    return {
+        "admin_id": admin.id,
+        "station_ids": [s["id"] for s in stations],
+        "district_ids": [d["id"] for d in districts],
+        "meeting_ids": [m["id"] for m in meetings],
+    }
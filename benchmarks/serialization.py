@@ -0,0 +1,124 @@
+"""Encoding microbenchmark: Flask's default JSON provider against FastJSONProvider.
+
+Loads real model rows from a seeded throwaway database and, for each payload,
+times building the dicts (hand-written literals / ``to_dict()`` against the
+precomputed serializers) and encoding them, then reports the bytes that would
+go on the wire with identity, gzip and, when installed, brotli encoding.
+
+    python -m benchmarks.serialization --meetings 100 --admins 200 --repeat 200
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask.json.provider import DefaultJSONProvider  # noqa: E402
+from config import create_app, db  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from compression import brotli  # noqa: E402
+from models import Admin, Meeting, Station  # noqa: E402
+from serialization import FastJSONProvider, serialize_admin, serialize_location, serialize_meeting  # noqa: E402
+
+
+def best_of(fn, repeat):
+    """Best wall time of ``repeat`` calls, in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 4)
+
+
+def meeting_literal(m):
+    return {
+        "id": m.id,
+        "title": m.title,
+        "date": m.date,
+        "deadline": m.deadline,
+        "registration_amount": m.registration_amount,
+        "poster_url": m.poster_url,
+        "description": m.description
+    }
+
+
+def wire_sizes(body):
+    sizes = {"identity": len(body), "gzip": len(gzip.compress(body, compresslevel=6, mtime=0))}
+    if brotli is not None:
+        sizes["br"] = len(brotli.compress(body, quality=4))
+    return sizes
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='registration-json-bench-')
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "BCRYPT_LOG_ROUNDS": 4,
+        "PAYMENT_WORKER_ENABLED": False,
+        "JOB_WORKER_ENABLED": False,
+    })
+    results = {}
+    with app.app_context():
+        seed({"stations": 20, "districts": 1, "churches": 1, "meetings": args.meetings,
+              "registrations": 0, "attendees": 0})
+        db.session.add_all(Admin(username=f"admin{i}", email=f"admin{i}@example.com", password_hash="x")
+                           for i in range(args.admins))
+        db.session.commit()
+
+        meetings = Meeting.query.limit(args.meetings).all()
+        admins = Admin.query.all()
+        stations = Station.query.all()
+        payloads = {
+            "meetings": (lambda: [meeting_literal(m) for m in meetings],
+                         lambda: [serialize_meeting(m) for m in meetings]),
+            "admins": (lambda: [a.to_dict() for a in admins],
+                       lambda: [serialize_admin(a) for a in admins]),
+            "stations": (lambda: [{"id": s.id, "name": s.name} for s in stations],
+                         lambda: [serialize_location(s) for s in stations]),
+        }
+
+        default_provider = DefaultJSONProvider(app)
+        fast_provider = FastJSONProvider(app)
+        for name, (build_old, build_new) in payloads.items():
+            old_obj, new_obj = build_old(), build_new()
+            old_body = default_provider.response(old_obj).get_data()
+            new_body = fast_provider.response(new_obj).get_data()
+            results[name] = {
+                "rows": len(new_obj),
+                "build_ms": {"before": best_of(build_old, args.repeat), "after": best_of(build_new, args.repeat)},
+                "encode_ms": {"before": best_of(lambda: default_provider.response(old_obj), args.repeat),
+                              "after": best_of(lambda: fast_provider.response(new_obj), args.repeat)},
+                "bytes": {"before": wire_sizes(old_body), "after": wire_sizes(new_body)},
+            }
+        db.engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meetings", type=int, default=100)
+    parser.add_argument("--admins", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    for name, r in results.items():
+        print(f"{name:<10} rows {r['rows']:>5}  build {r['build_ms']['before']:>8} -> {r['build_ms']['after']:<8} ms"
+              f"  encode {r['encode_ms']['before']:>8} -> {r['encode_ms']['after']:<8} ms"
+              f"  bytes {r['bytes']['before']} -> {r['bytes']['after']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+"""Cold-start benchmark: import time and time to first response.
+
+Every measurement runs in a fresh interpreter against a small seeded SQLite
+database:
+
+- ``python -X importtime -c "import app"`` gives the import time of the app
+  module, the slowest top-level imports, and whether any module that should
+  only load on first use (alembic, bcrypt, smtplib, Pillow) was imported.
+- A child process imports app and sends one authenticated GET through the test
+  client; the parent times it from spawn to exit, so interpreter startup is
+  included.
+
+Exits non-zero when a median is over its budget or a deferred module was
+imported at startup.
+
+    python -m benchmarks.startup --runs 5 --import-budget-ms 1000 --cold-start-budget-ms 1500
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import create_app  # noqa: E402
+from benchmarks.seed import seed  # noqa: E402
+from models import Admin  # noqa: E402
+from routes.admin_auth import issue_tokens  # noqa: E402
+
+# Only needed by CLI commands or on first use; importing them at startup is a regression
+DEFERRED_MODULES = ("alembic", "flask_migrate", "mako", "bcrypt", "smtplib", "PIL")
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+CHILD = """
+import json, os, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get('/api/stations', headers={"Authorization": "Bearer " + os.environ["STARTUP_BENCH_TOKEN"]})
+answered = time.perf_counter()
+print(json.dumps({"status": response.status_code, "import_ms": (imported - started) * 1000,
+                  "first_response_ms": (answered - imported) * 1000}))
+"""
+
+
+def prepare(workdir):
+    """Seed a small database and return the environment for the child processes"""
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    app = create_app({"SQLALCHEMY_DATABASE_URI": url, "BCRYPT_LOG_ROUNDS": 4,
+                      "PAYMENT_WORKER_ENABLED": False, "JOB_WORKER_ENABLED": False})
+    with app.app_context():
+        seed({"stations": 10, "districts": 5, "churches": 5, "meetings": 20, "registrations": 200, "attendees": 3})
+        token = issue_tokens(Admin.query.first())["access_token"]
+    return {**os.environ, "DATABASE_URL": url, "STARTUP_BENCH_TOKEN": token}
+
+
+def parse_importtime(stderr):
+    """[(name, self_us, cumulative_us, depth)] from -X importtime output"""
+    imports = []
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imports.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return imports
+
+
+def measure_imports(env):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    imports = parse_importtime(result.stderr)
+    total = next(cumulative for name, _, cumulative, _ in imports if name == 'app')
+    return total / 1000, imports
+
+
+def measure_cold_start(env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    if timings["status"] != 200:
+        raise RuntimeError(f"First request returned {timings['status']}")
+    return {"cold_start_ms": elapsed, **timings}
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='registration-startup-bench-')
+    try:
+        env = prepare(workdir)
+        # One untimed run each so .pyc files exist, as they would in a deployed image
+        measure_imports(env)
+        measure_cold_start(env)
+
+        import_totals, cold_starts, imports = [], [], []
+        for _ in range(args.runs):
+            total, imports = measure_imports(env)
+            import_totals.append(total)
+            cold_starts.append(measure_cold_start(env))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    imported = {name for name, _, _, _ in imports}
+    deferred = sorted(module for module in DEFERRED_MODULES if module in imported)
+    slowest = sorted(((name, cumulative) for name, _, cumulative, depth in imports if depth in (1, 2)),
+                     key=lambda item: item[1], reverse=True)[:args.top]
+
+    def median(key):
+        return round(statistics.median(run[key] for run in cold_starts), 1)
+
+    results = {
+        "runs": args.runs,
+        "import_ms": round(statistics.median(import_totals), 1),
+        "cold_start_ms": median("cold_start_ms"),
+        "in_process_import_ms": median("import_ms"),
+        "first_response_ms": median("first_response_ms"),
+        "slowest_imports_ms": {name: round(cumulative / 1000, 1) for name, cumulative in slowest},
+        "deferred_modules_imported": deferred,
+        "budgets": {"import_ms": args.import_budget_ms, "cold_start_ms": args.cold_start_budget_ms},
+    }
+    problems = []
+    if results["import_ms"] > args.import_budget_ms:
+        problems.append(f"import took {results['import_ms']} ms, budget {args.import_budget_ms} ms")
+    if results["cold_start_ms"] > args.cold_start_budget_ms:
+        problems.append(f"cold start took {results['cold_start_ms']} ms, budget {args.cold_start_budget_ms} ms")
+    if deferred:
+        problems.append(f"imported at startup: {', '.join(deferred)}")
+    results["problems"] = problems
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="How many of the slowest imports to list.")
+    parser.add_argument("--import-budget-ms", type=float, default=1000)
+    parser.add_argument("--cold-start-budget-ms", type=float, default=1500)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if results["problems"]:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+from datetime import datetime, timezone
+from sqlalchemy import DDL, delete, event, func, select
+from config import db
+from models import Attendee, CheckIn, Registration, SyncChange
+
+DEFAULT_CHANGES_LIMIT = 1000
+MAX_CHANGES_LIMIT = 5000
+MAX_PUSH_BATCH = 1000
+LOOKUP_CHUNK = 500
+
+# Compact wire format: each entity is sent as {"columns": [...], "rows": [[...], ...]}
+SYNC_ENTITIES = {
+    "registration": (Registration, "registrations",
+                     ("id", "invoice_number", "leader_name", "leader_phone", "church", "paid", "meeting_id", "status")),
+    "attendee": (Attendee, "attendees", ("id", "registration_id", "name", "age")),
+    "check_in": (CheckIn, "check_ins", ("attendee_id", "checked_in_at", "device_id")),
+}
+
+# (table, key column, columns whose updates tablets care about)
+TRACKED_TABLES = (
+    ("registrations", "id", "registration",
+     ("invoice_number", "leader_name", "leader_phone", "church", "paid", "meeting_id", "status")),
+    ("attendees", "id", "attendee", ("name", "age", "registration_id")),
+    ("check_ins", "attendee_id", "check_in", ("checked_in_at", "device_id")),
+)
+
+
+def change_log_ddl():
+    """Triggers that append to sync_changes, so ORM writes, Core bulk inserts and the
+    payment worker's UPDATEs all reach the change log the same way"""
+    statements = []
+    for table, key, entity, columns in TRACKED_TABLES:
+        log = f"INSERT INTO sync_changes (entity, entity_id, op) VALUES ('{entity}', %s, '%s');"
+        statements += [
+            f"""CREATE TRIGGER IF NOT EXISTS sync_{table}_insert AFTER INSERT ON {table} BEGIN
+                {log % ('new.' + key, 'upsert')}
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS sync_{table}_update AFTER UPDATE OF {', '.join(columns)} ON {table} BEGIN
+                {log % ('new.' + key, 'upsert')}
+            END""",
+        ]
+        body = log % ('old.' + key, 'delete')
+        if table == "attendees":
+            # SQLite only enforces ON DELETE CASCADE with foreign_keys on, so attendees clear their own check-ins
+            body = "DELETE FROM check_ins WHERE attendee_id = old.id;\n                " + body
+        statements.append(
+            f"""CREATE TRIGGER IF NOT EXISTS sync_{table}_delete AFTER DELETE ON {table} BEGIN
+                {body}
+            END"""
+        )
+    return tuple(statements)
+
+
+def change_log_pg_ddl():
+    """The same change log on PostgreSQL, through one trigger function
+
+    Writers lock the log until they commit, so versions become visible in
+    order, as they do under SQLite's single writer; otherwise a client could
+    pull past a version whose transaction had not committed yet and never see
+    it. Readers are not blocked. Check-ins of a deleted attendee go with it by
+    the foreign key's ON DELETE CASCADE, which PostgreSQL enforces.
+    """
+    statements = [
+        """CREATE OR REPLACE FUNCTION sync_changes_log() RETURNS trigger AS $$
+        BEGIN
+            LOCK TABLE sync_changes IN EXCLUSIVE MODE;
+            IF TG_OP = 'DELETE' THEN
+                INSERT INTO sync_changes (entity, entity_id, op)
+                VALUES (TG_ARGV[0], (to_jsonb(old) ->> TG_ARGV[1])::integer, 'delete');
+                RETURN old;
+            END IF;
+            INSERT INTO sync_changes (entity, entity_id, op)
+            VALUES (TG_ARGV[0], (to_jsonb(new) ->> TG_ARGV[1])::integer, 'upsert');
+            RETURN new;
+        END
+        $$ LANGUAGE plpgsql"""
+    ]
+    for table, key, entity, columns in TRACKED_TABLES:
+        for suffix, timing in (("insert", "INSERT"), ("update", f"UPDATE OF {', '.join(columns)}"),
+                               ("delete", "DELETE")):
+            statements += [
+                f"DROP TRIGGER IF EXISTS sync_{table}_{suffix} ON {table}",
+                f"""CREATE TRIGGER sync_{table}_{suffix} AFTER {timing} ON {table}
+                FOR EACH ROW EXECUTE FUNCTION sync_changes_log('{entity}', '{key}')""",
+            ]
+    return tuple(statements)
+
+
+CHANGE_LOG_DDL = change_log_ddl()
+CHANGE_LOG_PG_DDL = change_log_pg_ddl()
+# Dialects whose triggers fill sync_changes; elsewhere delta sync would silently report nothing
+CHANGE_LOG_DIALECTS = ('sqlite', 'postgresql')
+
+# Triggers need every tracked table to exist, so they follow the whole create_all
+for statement in CHANGE_LOG_DDL:
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in CHANGE_LOG_PG_DDL:
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def change_log_supported():
+    return db.engine.dialect.name in CHANGE_LOG_DIALECTS
+
+
+def parse_timestamp(value, now):
+    """Device timestamps as naive UTC; missing ones are now and future ones are clamped to now"""
+    if value in (None, ''):
+        return now
+    parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(parsed, now)
+
+
+def current_version():
+    return db.session.query(func.max(SyncChange.version)).scalar() or 0
+
+
+def oldest_version():
+    return db.session.query(func.min(SyncChange.version)).scalar()
+
+
+def meeting_scope(entity, meeting_id):
+    """Filter limiting an entity to one meeting's registrations, or None for everything"""
+    if meeting_id is None:
+        return None
+    registration_ids = select(Registration.id).where(Registration.meeting_id == meeting_id)
+    if entity == "registration":
+        return Registration.meeting_id == meeting_id
+    if entity == "attendee":
+        return Attendee.registration_id.in_(registration_ids)
+    return CheckIn.attendee_id.in_(select(Attendee.id).where(Attendee.registration_id.in_(registration_ids)))
+
+
+def compact(model, columns, *where):
+    query = select(*(getattr(model, column) for column in columns))
+    where = [clause for clause in where if clause is not None]
+    if where:
+        query = query.where(*where)
+    return {"columns": list(columns), "rows": [tuple(row) for row in db.session.execute(query)]}
+
+
+def build_snapshot(meeting_id=None):
+    """Every registration, attendee and check-in (of one meeting, if given) plus
+    the version they are current as of
+
+    The version is read first: a write that lands between the two reads shows up
+    in the snapshot and again in the next pull, which clients apply idempotently.
+    """
+    version = current_version()
+    snapshot = {"version": version}
+    for entity, (model, key, columns) in SYNC_ENTITIES.items():
+        snapshot[key] = compact(model, columns, meeting_scope(entity, meeting_id))
+    return snapshot
+
+
+def rows_by_id(model, columns, ids, scope=None):
+    key = getattr(model, columns[0])
+    rows = []
+    ids = sorted(ids)
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        rows += compact(model, columns, key.in_(ids[start:start + LOOKUP_CHUNK]), scope)["rows"]
+    return rows
+
+
+def changes_since(since, limit=DEFAULT_CHANGES_LIMIT, meeting_id=None):
+    """Current state of whatever changed after ``since``, or None if that version was pruned
+
+    Several changes to one row collapse into its latest state; rows that no longer
+    exist, or have left the requested meeting, are reported as deleted.
+    """
+    oldest = oldest_version()
+    if oldest is not None and since < oldest - 1:
+        return None
+
+    entries = db.session.query(SyncChange.version, SyncChange.entity, SyncChange.entity_id).filter(
+        SyncChange.version > since
+    ).order_by(SyncChange.version).limit(limit).all()
+
+    touched = {entity: set() for entity in SYNC_ENTITIES}
+    for _, entity, entity_id in entries:
+        if entity in touched:
+            touched[entity].add(entity_id)
+
+    result = {"version": entries[-1].version if entries else since, "has_more": len(entries) == limit, "deleted": {}}
+    for entity, (model, key, columns) in SYNC_ENTITIES.items():
+        rows = rows_by_id(model, columns, touched[entity], meeting_scope(entity, meeting_id))
+        result[key] = {"columns": list(columns), "rows": rows}
+        result["deleted"][key] = sorted(touched[entity] - {row[0] for row in rows})
+    return result
+
+
+def record_check_ins(items, device_id=None, admin_id=None):
+    """Apply a batch of check-ins pushed by a device
+
+    ``items`` are dicts with attendee_id, checked_in_at and an optional undo flag.
+    The last item per attendee wins within a batch; across batches the earliest
+    arrival is kept, so replaying a batch after a dropped response changes nothing.
+    """
+    now = datetime.utcnow()
+    latest = {}
+    for item in items:
+        latest[item["attendee_id"]] = item
+
+    ids = sorted(latest)
+    known, already = set(), set()
+    for start in range(0, len(ids), LOOKUP_CHUNK):
+        chunk = ids[start:start + LOOKUP_CHUNK]
+        known.update(db.session.scalars(select(Attendee.id).where(Attendee.id.in_(chunk))))
+        already.update(db.session.scalars(select(CheckIn.attendee_id).where(CheckIn.attendee_id.in_(chunk))))
+
+    undo = [attendee_id for attendee_id in ids if attendee_id in known and latest[attendee_id].get("undo")]
+    arrivals = [
+        {"attendee_id": attendee_id, "checked_in_at": latest[attendee_id]["checked_in_at"],
+         "recorded_at": now, "device_id": device_id, "admin_id": admin_id}
+        for attendee_id in ids if attendee_id in known and not latest[attendee_id].get("undo")
+    ]
+
+    if undo:
+        db.session.execute(delete(CheckIn).where(CheckIn.attendee_id.in_(undo)),
+                           execution_options={"synchronize_session": False})
+    if arrivals:
+        upsert = dialect_insert()(CheckIn)
+        excluded = upsert.excluded
+        db.session.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[CheckIn.attendee_id],
+                set_={"checked_in_at": excluded.checked_in_at, "device_id": excluded.device_id,
+                      "admin_id": excluded.admin_id, "recorded_at": excluded.recorded_at},
+                where=excluded.checked_in_at < CheckIn.checked_in_at,
+            ),
+            arrivals,
+        )
+    db.session.commit()
+
+    return {
+        "checked_in": sum(1 for row in arrivals if row["attendee_id"] not in already),
+        "already_checked_in": sum(1 for row in arrivals if row["attendee_id"] in already),
+        "undone": sum(1 for attendee_id in undo if attendee_id in already),
+        "unknown_attendees": [attendee_id for attendee_id in ids if attendee_id not in known],
+    }
+
+
+def dialect_insert():
+    """INSERT construct with ON CONFLICT support for the bound database"""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def prune_changes(before):
+    """Delete change log entries older than ``before``; the newest entry is always kept
+    so the current version survives. Clients behind the pruned range must re-snapshot."""
+    newest = current_version()
+    result = db.session.execute(
+        delete(SyncChange).where(SyncChange.changed_at < before, SyncChange.version < newest),
+        execution_options={"synchronize_session": False}
+    )
+    db.session.commit()
+    return result.rowcount
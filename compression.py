@@ -0,0 +1,90 @@
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'text/csv',
+    'text/plain',
+    'text/html',
+}
+
+
+def accepted_encodings(header):
+    """Parse Accept-Encoding into {coding: q}"""
+    encodings = {}
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[coding.strip().lower()] = q
+    return encodings
+
+
+def choose_encoding(header):
+    """Pick br or gzip from Accept-Encoding, preferring br on a tie"""
+    encodings = accepted_encodings(header)
+    wildcard = encodings.get('*', 0.0)
+    candidates = [('br', 1)] if brotli is not None else []
+    candidates.append(('gzip', 0))
+    best = None
+    for coding, preference in candidates:
+        q = encodings.get(coding, wildcard)
+        if q > 0 and (best is None or (q, preference) > best[0]):
+            best = ((q, preference), coding)
+    return best[1] if best else None
+
+
+def compress(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+def init_compression(app):
+    """Compress buffered text responses above COMPRESS_MIN_SIZE bytes"""
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_QUALITY', 4)
+
+    @app.after_request
+    def compress_response(response):
+        config = app.config
+        if not config['COMPRESS_ENABLED']:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        # Streamed exports and file passthroughs are sent as they are
+        if (response.is_streamed or response.direct_passthrough
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES
+                or not 200 <= response.status_code < 300 or response.status_code == 206
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.set_data(compress(data, encoding, config))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ from the identity ones, so a strong validator becomes weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
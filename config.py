@@ -1,19 +1,206 @@
-from flask import Flask 
-from flask_sqlalchemy import SQLAlchemy 
-from flask_migrate import Migrate 
+import os
+from datetime import timedelta
+import click
+from flask import Flask, current_app, has_request_context, request
+from flask_cors import CORS
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from flask_jwt_extended import JWTManager
+from sqlalchemy import event
 
-db = SQLAlchemy()
-migrate = Migrate()
 
+class RoutingSession(Session):
+    """Sends reads from GET-only blueprints to the 'replica' bind when one is configured"""
 
-def create_app():
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and use_replica():
+            replica = self._db.engines.get('replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class MigrateCommands(click.Group):
+    """`flask db`, importing Flask-Migrate (and with it alembic) only when a migration command runs
+
+    Alembic is the largest import in the app; web workers never need it.
+    """
+
+    def load(self):
+        from flask_migrate import Migrate
+        app = current_app._get_current_object()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db)
+        return app.cli.commands['db']
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        return self.load().make_context(info_name, args, parent=parent, **extra)
+
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+jwt = JWTManager()
+
+
+def use_replica():
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    return request.blueprint in current_app.config['DB_REPLICA_BLUEPRINTS']
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def normalize_database_url(url):
+    # Heroku-style URLs use the scheme SQLAlchemy dropped in 1.4
+    if url and url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def database_config_from_env():
+    """Database settings read from the environment; create_app overrides win"""
+    replica_url = normalize_database_url(os.environ.get('DATABASE_REPLICA_URL'))
+    return {
+        'SQLALCHEMY_DATABASE_URI': normalize_database_url(os.environ.get('DATABASE_URL', 'sqlite:///database.db')),
+        'SQLALCHEMY_BINDS': {'replica': replica_url} if replica_url else {},
+        'DB_REPLICA_BLUEPRINTS': tuple(
+            name.strip() for name in os.environ.get('DB_REPLICA_BLUEPRINTS', 'locations,meeting').split(',')
+            if name.strip()
+        ),
+        'DB_POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 5)),
+        'DB_MAX_OVERFLOW': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+        'DB_POOL_TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        'DB_POOL_RECYCLE': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+        'DB_POOL_PRE_PING': env_bool('DB_POOL_PRE_PING', True),
+        'SQLITE_JOURNAL_MODE': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'SQLITE_SYNCHRONOUS': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'SQLITE_BUSY_TIMEOUT_MS': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'SQLITE_MMAP_SIZE': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    }
+
+
+def is_memory_sqlite(url):
+    return url.startswith('sqlite') and (url in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in url)
+
+
+def engine_options(config):
+    """Pool settings for the engines; in-memory SQLite keeps Flask-SQLAlchemy's static pool"""
+    if is_memory_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def sqlite_pragma_listener(config):
+    """'connect' listener setting WAL, synchronous, busy_timeout and mmap_size on a new SQLite connection"""
+    pragmas = (
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+    )
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def apply_sqlite_pragmas(app):
+    """Set the SQLite pragmas on every new connection of the app's engines"""
+    on_connect = sqlite_pragma_listener(app.config)
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', on_connect)
+
+
+def create_app(config_overrides=None):
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+    app.config.update(database_config_from_env())
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'supersecretkey'
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=int(os.environ.get('JWT_ACCESS_TOKEN_MINUTES', 15)))
+    app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=int(os.environ.get('JWT_REFRESH_TOKEN_DAYS', 30)))
+    app.config['ADMIN_CACHE_TTL'] = int(os.environ.get('ADMIN_CACHE_TTL', 30))
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    app.config['PAYMENT_WEBHOOK_SECRET'] = os.environ.get('PAYMENT_WEBHOOK_SECRET')
+    app.config['PAYMENT_WORKER_ENABLED'] = env_bool('PAYMENT_WORKER_ENABLED', True)
+    app.config['USE_X_SENDFILE'] = env_bool('USE_X_SENDFILE', False)
+    app.config['JOB_WORKER_ENABLED'] = env_bool('JOB_WORKER_ENABLED', True)
+    app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 30))
+    app.config['PASSWORD_RESET_URL'] = os.environ.get('PASSWORD_RESET_URL',
+                                                      'http://localhost:5000/admin/reset_password/{token}')
+    if config_overrides:
+        app.config.update(config_overrides)
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
 
     db.init_app(app)
-    migrate.init_app(app, db)
+    app.cli.add_command(MigrateCommands('db', help='Perform database migrations.'))
+    jwt.init_app(app)
+    CORS(app, expose_headers=['Server-Timing'])
+    apply_sqlite_pragmas(app)
+
+    from compression import init_compression
+    from events import init_events
+    from instrumentation import init_instrumentation
+    from invoices import init_invoice_allocator
+    from jobs import init_jobs
+    from mailer import init_mail
+    from passwords import init_password_hasher
+    from posters import init_posters
+    from ratelimit import init_rate_limits
+    from reconciliation import init_reconciliation
+    from response_cache import init_response_cache
+    from serialization import init_json
+    from storage import init_storage
+    init_json(app)
+    init_compression(app)
+    init_instrumentation(app)
+    init_password_hasher(app)
+    init_rate_limits(app)
+    init_invoice_allocator(app)
+    init_reconciliation(app)
+    init_storage(app)
+    init_posters(app)
+    init_response_cache(app)
+    init_events(app)
+    init_mail(app)
+    init_jobs(app)
+
+    register_blueprints(app)
+
+    return app
+
 
+def register_blueprints(app):
+    from routes.meeting import meeting_bp
+    from routes.registration import registration_bp
+    from routes.admin import admin_bp
+    from routes.locations import locations_bp
+    from routes.admin_auth import admin_auth_bp
+    from routes.payments import payments_bp
+    from routes.checkin import checkin_bp
+    from routes.jobs import jobs_bp
 
-    return app 
\ No newline at end of file
+    app.register_blueprint(meeting_bp, url_prefix='/api')
+    app.register_blueprint(registration_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
+    app.register_blueprint(locations_bp, url_prefix='/api')
+    app.register_blueprint(admin_auth_bp, url_prefix='/api/admin/auth')
+    app.register_blueprint(payments_bp, url_prefix='/api')
+    app.register_blueprint(checkin_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api/admin')
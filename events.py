@@ -0,0 +1,276 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from config import db
+from models import Registration
+
+PENDING_EVENTS = 'live_events'
+
+# Registration columns sent with registration events; enough for a dashboard row without a lookup
+REGISTRATION_EVENT_FIELDS = ("id", "invoice_number", "meeting_id", "status", "seats", "amount", "paid",
+                             "station", "district", "church", "leader_name")
+
+
+class Subscriber:
+    """One connected stream: a bounded buffer of encoded events
+
+    When a client reads slower than events arrive, the oldest events are dropped
+    and counted, so a stalled dashboard costs at most ``maxlen`` events of memory.
+    """
+
+    def __init__(self, maxlen, meeting_id=None):
+        self.meeting_id = meeting_id
+        self.dropped = 0
+        self.closed = False
+        self._buffer = deque(maxlen=maxlen)
+        self._ready = threading.Condition(threading.Lock())
+
+    def push(self, meeting_id, frame):
+        """Buffer a frame if it is for this subscriber's meeting; True if it was"""
+        if self.meeting_id is not None and meeting_id != self.meeting_id:
+            return False
+        with self._ready:
+            if len(self._buffer) == self._buffer.maxlen:
+                self.dropped += 1
+            self._buffer.append(frame)
+            self._ready.notify()
+        return True
+
+    def close(self):
+        """Mark the subscriber closed and wake its stream so it ends"""
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+
+    def take(self):
+        """Empty the buffer: (frames, dropped since the last take)"""
+        with self._ready:
+            frames = list(self._buffer)
+            self._buffer.clear()
+            dropped, self.dropped = self.dropped, 0
+        return frames, dropped
+
+    def drain(self, timeout):
+        """Wait up to ``timeout`` seconds for events; returns (frames, dropped since the last drain)"""
+        with self._ready:
+            if not self._buffer and not self.closed:
+                self._ready.wait(timeout)
+        return self.take()
+
+
+class AsyncSubscriber(Subscriber):
+    """A Subscriber read from an event loop: waiting for events holds no thread
+
+    Publishing happens in request and worker threads, so they wake the loop
+    with call_soon_threadsafe.
+    """
+
+    def __init__(self, maxlen, meeting_id=None, loop=None):
+        super().__init__(maxlen, meeting_id)
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+
+    def push(self, meeting_id, frame):
+        if not super().push(meeting_id, frame):
+            return False
+        # RuntimeError: the loop has shut down, and the stream with it
+        with suppress(RuntimeError):
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return True
+
+    def close(self):
+        super().close()
+        with suppress(RuntimeError):
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def drain_async(self, timeout):
+        with suppress(TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        self._wakeup.clear()
+        return self.take()
+
+
+class EventBroker:
+    """In-process fan-out of committed registration and payment events
+
+    Each event is encoded once, whatever the number of subscribers. The last
+    ``replay`` events are kept so a client reconnecting with Last-Event-ID
+    picks up what it missed.
+    """
+
+    def __init__(self, buffer_size=256, replay=1000, max_subscribers=500):
+        self.buffer_size = buffer_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._recent = deque(maxlen=replay)
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._published = 0
+
+    def subscribe(self, meeting_id=None, last_event_id=None, loop=None):
+        """A new Subscriber primed with the events after ``last_event_id``; None when full
+
+        Given an event loop, the subscriber is an AsyncSubscriber read from that loop.
+        """
+        if loop is None:
+            subscriber = Subscriber(self.buffer_size, meeting_id)
+        else:
+            subscriber = AsyncSubscriber(self.buffer_size, meeting_id, loop)
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if last_event_id is not None:
+                for event_id, event_meeting_id, frame in self._recent:
+                    if event_id > last_event_id:
+                        subscriber.push(event_meeting_id, frame)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+        subscriber.close()
+
+    def publish(self, events):
+        """Encode and deliver (type, data) pairs to every matching subscriber"""
+        dumps = current_app.json.dumps
+        with self._lock:
+            for event_type, data in events:
+                event_id = self._next_id
+                self._next_id += 1
+                frame = f"id: {event_id}\nevent: {event_type}\ndata: {dumps(data)}\n\n".encode()
+                meeting_id = data.get("meeting_id")
+                self._recent.append((event_id, meeting_id, frame))
+                for subscriber in self._subscribers:
+                    subscriber.push(meeting_id, frame)
+            self._published += len(events)
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self._published,
+                    "last_event_id": self._next_id - 1}
+
+
+# --------------- Publishing -----------------
+def publish(event_type, data):
+    """Send an event to live dashboards once the current transaction commits
+
+    Like response_cache.invalidate(), nothing goes out for a rolled-back write.
+    """
+    db.session.info.setdefault(PENDING_EVENTS, []).append((event_type, data))
+
+
+def registration_event(registration, **changes):
+    """Event data from a Registration instance or a row dict, with ``changes`` applied"""
+    if isinstance(registration, dict):
+        data = {field: registration.get(field) for field in REGISTRATION_EVENT_FIELDS}
+    else:
+        data = {field: getattr(registration, field) for field in REGISTRATION_EVENT_FIELDS}
+    data.update(changes)
+    return data
+
+
+def registration_status_changed(registration_ids, meeting_id, status):
+    """Publish registration.updated for rows whose status was changed with a Core UPDATE"""
+    for registration_id in registration_ids:
+        publish("registration.updated", {"id": registration_id, "meeting_id": meeting_id, "status": status})
+
+
+def _after_flush(session, flush_context):
+    """Registrations written through the ORM; Core INSERT/UPDATE paths call publish() themselves"""
+    for obj in session.new:
+        if isinstance(obj, Registration):
+            session.info.setdefault(PENDING_EVENTS, []).append(("registration.created", registration_event(obj)))
+    for obj in session.dirty:
+        if isinstance(obj, Registration) and session.is_modified(obj, include_collections=False):
+            session.info.setdefault(PENDING_EVENTS, []).append(("registration.updated", registration_event(obj)))
+    for obj in session.deleted:
+        if isinstance(obj, Registration):
+            state = inspect(obj)
+            meeting_id = state.attrs.meeting_id.loaded_value
+            session.info.setdefault(PENDING_EVENTS, []).append(
+                ("registration.deleted", {"id": obj.id, "meeting_id": meeting_id}))
+
+
+def _after_commit(session):
+    events = session.info.pop(PENDING_EVENTS, None)
+    broker = current_app.extensions.get('events') if events else None
+    if broker is not None:
+        broker.publish(events)
+
+
+def _after_rollback(session):
+    session.info.pop(PENDING_EVENTS, None)
+
+
+# --------------- Streaming -----------------
+RETRY_FRAME = b"retry: 3000\n\n"
+KEEPALIVE_FRAME = b": keepalive\n\n"
+
+
+def overflow_frame(dropped):
+    # The client should refetch whatever it is showing
+    return f"event: overflow\ndata: {{\"dropped\": {dropped}}}\n\n".encode()
+
+
+def stream(subscriber, heartbeat):
+    """Yield SSE frames for a subscriber until the client goes away
+
+    Runs outside the request context, so an open stream holds no database
+    connection; a comment line every ``heartbeat`` seconds keeps proxies from
+    closing an idle stream and lets the server notice a client that has gone.
+    It ends once the subscriber is closed: the caller unsubscribes when the
+    response closes.
+    """
+    yield RETRY_FRAME
+    last_write = time.monotonic()
+    while not subscriber.closed:
+        frames, dropped = subscriber.drain(heartbeat)
+        if dropped:
+            yield overflow_frame(dropped)
+        if frames:
+            yield b"".join(frames)
+            last_write = time.monotonic()
+        elif time.monotonic() - last_write >= heartbeat:
+            yield KEEPALIVE_FRAME
+            last_write = time.monotonic()
+
+
+async def async_stream(subscriber, heartbeat):
+    """stream() for an AsyncSubscriber, sent from the ASGI bridge's event loop"""
+    yield RETRY_FRAME
+    last_write = time.monotonic()
+    while not subscriber.closed:
+        frames, dropped = await subscriber.drain_async(heartbeat)
+        if dropped:
+            yield overflow_frame(dropped)
+        if frames:
+            yield b"".join(frames)
+            last_write = time.monotonic()
+        elif time.monotonic() - last_write >= heartbeat:
+            yield KEEPALIVE_FRAME
+            last_write = time.monotonic()
+
+
+def init_events(app):
+    app.config.setdefault('EVENT_STREAM_BUFFER', int(os.environ.get('EVENT_STREAM_BUFFER', 256)))
+    app.config.setdefault('EVENT_STREAM_REPLAY', int(os.environ.get('EVENT_STREAM_REPLAY', 1000)))
+    app.config.setdefault('EVENT_STREAM_MAX_CLIENTS', int(os.environ.get('EVENT_STREAM_MAX_CLIENTS', 500)))
+    app.config.setdefault('EVENT_STREAM_HEARTBEAT', float(os.environ.get('EVENT_STREAM_HEARTBEAT', 15)))
+    if not event.contains(Session, 'after_flush', _after_flush):
+        event.listen(Session, 'after_flush', _after_flush)
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+
+    app.extensions['events'] = EventBroker(
+        buffer_size=app.config['EVENT_STREAM_BUFFER'],
+        replay=app.config['EVENT_STREAM_REPLAY'],
+        max_subscribers=app.config['EVENT_STREAM_MAX_CLIENTS'],
+    )
@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, jsonify, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from config import db
+from models import IdempotencyKey
+
+STREAMING_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+MAX_KEY_LENGTH = 255
+DEFAULT_LEASE = 120
+
+_purge_lock = threading.Lock()
+_last_purge = [0.0]
+
+
+def request_fingerprint():
+    """Hash of what the key is allowed to stand for; streamed bodies are not buffered to hash them"""
+    digest = hashlib.sha256(f"{request.method} {request.path}?{request.query_string.decode()}".encode())
+    if request.mimetype in STREAMING_MIMETYPES:
+        digest.update(str(request.content_length).encode())
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def replay(record):
+    response = current_app.response_class(record.response_body, status=record.status_code,
+                                          content_type=record.content_type)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired_keys(force=False):
+    """Delete expired keys, at most once per IDEMPOTENCY_PURGE_INTERVAL seconds per worker"""
+    now = time.monotonic()
+    with _purge_lock:
+        if not force and now - _last_purge[0] < current_app.config.get('IDEMPOTENCY_PURGE_INTERVAL', 300):
+            return 0
+        _last_purge[0] = now
+    deleted = db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow()))
+    db.session.commit()
+    return deleted.rowcount
+
+
+def reclaim(scoped_key, now):
+    """Take over a key whose request never finished, e.g. its worker died; True if this request now holds it
+
+    Conditional on the lease having run out, so of several retries only one wins.
+    """
+    lease = timedelta(seconds=current_app.config.get('IDEMPOTENCY_LEASE', DEFAULT_LEASE))
+    taken = db.session.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.key == scoped_key, IdempotencyKey.status_code.is_(None),
+               or_(IdempotencyKey.started_at.is_(None), IdempotencyKey.started_at <= now - lease))
+        .values(started_at=now),
+        execution_options={"synchronize_session": False}
+    ).rowcount == 1
+    db.session.commit()
+    return taken
+
+
+def idempotent(f):
+    """Replay the stored response when a request repeats its Idempotency-Key header
+
+    Keys are scoped to the endpoint and the caller, so put the decorator under
+    jwt_required.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({"error": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters"}), 400
+
+        scoped_key = f"{request.endpoint}:{get_jwt_identity()}:{key}"
+        fingerprint = request_fingerprint()
+        now = datetime.utcnow()
+
+        record = db.session.get(IdempotencyKey, scoped_key)
+        if record is not None and record.expires_at <= now:
+            db.session.delete(record)
+            db.session.commit()
+            record = None
+
+        if record is None:
+            ttl = timedelta(seconds=current_app.config.get('IDEMPOTENCY_TTL', 24 * 3600))
+            db.session.add(IdempotencyKey(key=scoped_key, fingerprint=fingerprint, started_at=now,
+                                          expires_at=now + ttl))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # A concurrent retry claimed the key between our lookup and insert
+                db.session.rollback()
+                record = db.session.get(IdempotencyKey, scoped_key)
+
+        if record is not None:
+            if record.fingerprint != fingerprint:
+                return jsonify({"error": "Idempotency-Key was already used with a different request"}), 422
+            if record.status_code is not None:
+                return replay(record)
+            if not reclaim(scoped_key, now):
+                return jsonify({"error": "A request with this Idempotency-Key is still in progress"}), 409
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == scoped_key))
+            db.session.commit()
+            raise
+
+        if response.status_code >= 500 or response.is_streamed:
+            # Let the client retry a failure; streamed bodies are not stored
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == scoped_key))
+        else:
+            db.session.execute(
+                IdempotencyKey.__table__.update()
+                .where(IdempotencyKey.key == scoped_key)
+                .values(status_code=response.status_code, response_body=response.get_data(as_text=True),
+                        content_type=response.content_type)
+            )
+        db.session.commit()
+        purge_expired_keys()
+        return response
+    return decorated_function
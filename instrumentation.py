@@ -0,0 +1,138 @@
+import json
+import logging
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('registration.perf')
+
+DEFAULT_SLOW_REQUEST_MS = 500
+DEFAULT_SLOW_REQUEST_QUERIES = 20
+DEFAULT_SLOW_QUERY_MS = 100
+
+
+class RouteStats:
+    """Per-route aggregates of request time and SQL activity"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, elapsed_ms, queries, db_ms, slowest):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    "requests": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "queries": 0, "max_queries": 0, "db_ms": 0.0,
+                    "slowest_query_ms": 0.0, "slowest_query": None,
+                }
+            stats["requests"] += 1
+            stats["total_ms"] += elapsed_ms
+            stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+            stats["queries"] += queries
+            stats["max_queries"] = max(stats["max_queries"], queries)
+            stats["db_ms"] += db_ms
+            if slowest and slowest[0] > stats["slowest_query_ms"]:
+                stats["slowest_query_ms"], stats["slowest_query"] = slowest
+
+    def snapshot(self):
+        with self._lock:
+            routes = {route: dict(stats) for route, stats in self._routes.items()}
+        for stats in routes.values():
+            n = stats["requests"]
+            stats["avg_ms"] = round(stats["total_ms"] / n, 3)
+            stats["avg_queries"] = round(stats["queries"] / n, 2)
+            stats["avg_db_ms"] = round(stats["db_ms"] / n, 3)
+            for key in ("total_ms", "max_ms", "db_ms", "slowest_query_ms"):
+                stats[key] = round(stats[key], 3)
+        return routes
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_start')
+    if not started:
+        return
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+    if not has_request_context() or 'sql_stats' not in g:
+        return
+
+    sql = g.sql_stats
+    sql["count"] += 1
+    sql["db_ms"] += elapsed_ms
+    if elapsed_ms > sql["slowest"][0]:
+        sql["slowest"] = (elapsed_ms, statement)
+    if elapsed_ms >= sql["slow_query_ms"]:
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "path": request.path,
+            "duration_ms": round(elapsed_ms, 3),
+            "statement": statement,
+        }))
+
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its start so the stack does not grow
+    started = context.connection.info.get('query_start') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def init_instrumentation(app):
+    """Count queries and DB time per request, add Server-Timing and log slow requests"""
+    app.config.setdefault('SLOW_REQUEST_MS', DEFAULT_SLOW_REQUEST_MS)
+    app.config.setdefault('SLOW_REQUEST_QUERIES', DEFAULT_SLOW_REQUEST_QUERIES)
+    app.config.setdefault('SLOW_QUERY_MS', DEFAULT_SLOW_QUERY_MS)
+
+    stats = app.extensions['route_stats'] = RouteStats()
+    if not app.config.get('INSTRUMENTATION_ENABLED', True):
+        return
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_stats = {"count": 0, "db_ms": 0.0, "slowest": (0.0, None),
+                       "slow_query_ms": app.config['SLOW_QUERY_MS']}
+
+    @app.after_request
+    def record_request_stats(response):
+        if 'request_started' not in g:
+            return response
+        elapsed_ms = (time.perf_counter() - g.request_started) * 1000
+        sql = g.sql_stats
+        route = f"{request.method} {request.url_rule.rule if request.url_rule else '<unmatched>'}"
+
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={sql["db_ms"]:.2f};desc="{sql["count"]} queries", app;dur={elapsed_ms:.2f}'
+        )
+        stats.record(route, elapsed_ms, sql["count"], sql["db_ms"], sql["slowest"] if sql["count"] else None)
+
+        if elapsed_ms >= app.config['SLOW_REQUEST_MS'] or sql["count"] >= app.config['SLOW_REQUEST_QUERIES']:
+            logger.warning(json.dumps({
+                "event": "slow_request",
+                "route": route,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round(elapsed_ms, 3),
+                "queries": sql["count"],
+                "db_ms": round(sql["db_ms"], 3),
+                "slowest_query_ms": round(sql["slowest"][0], 3),
+                "slowest_query": sql["slowest"][1],
+            }))
+        return response
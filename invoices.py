@@ -0,0 +1,93 @@
+import os
+import re
+import threading
+from flask import current_app
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from config import db
+from models import InvoiceSequence
+
+DEFAULT_SEQUENCE = 'registration'
+
+
+class InvoiceAllocator:
+    """Hands out invoice numbers from blocks reserved with one atomic UPDATE per block
+
+    Numbers are unique but not gapless: a block that a worker never finishes
+    using is simply skipped. The prefix followed by digits is reserved for
+    allocated numbers, so client-supplied numbers must not take that form.
+    """
+
+    def __init__(self, prefix='INV-', block_size=50, sequence=DEFAULT_SEQUENCE):
+        self.prefix = prefix
+        self.block_size = block_size
+        self.sequence = sequence
+        self._reserved = re.compile(re.escape(prefix) + '[0-9]+')
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+        self._pid = None
+
+    def _reserve_block(self):
+        """Claim [start, start + block_size) on its own short transaction"""
+        with db.engine.begin() as connection:
+            end = connection.execute(
+                update(InvoiceSequence)
+                .where(InvoiceSequence.name == self.sequence)
+                .values(next_value=InvoiceSequence.next_value + self.block_size)
+                .returning(InvoiceSequence.next_value)
+            ).scalar()
+            if end is None:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(insert(InvoiceSequence).values(
+                            name=self.sequence, next_value=1 + self.block_size
+                        ))
+                    end = 1 + self.block_size
+                except IntegrityError:
+                    # Another worker created the row first; take the next block instead
+                    end = connection.execute(
+                        update(InvoiceSequence)
+                        .where(InvoiceSequence.name == self.sequence)
+                        .values(next_value=InvoiceSequence.next_value + self.block_size)
+                        .returning(InvoiceSequence.next_value)
+                    ).scalar()
+        return end - self.block_size, end
+
+    def allocate(self, count=1):
+        """Return ``count`` fresh invoice numbers"""
+        numbers = []
+        with self._lock:
+            # A block reserved before a fork must not be shared with the child
+            if self._pid != os.getpid():
+                self._next = self._end = 0
+                self._pid = os.getpid()
+            while len(numbers) < count:
+                if self._next >= self._end:
+                    self._next, self._end = self._reserve_block()
+                take = min(count - len(numbers), self._end - self._next)
+                numbers.extend(f"{self.prefix}{n:08d}" for n in range(self._next, self._next + take))
+                self._next += take
+        return numbers
+
+    def is_reserved(self, number):
+        """Whether ``number`` has the form of an allocated number"""
+        return self._reserved.fullmatch(number) is not None
+
+
+def init_invoice_allocator(app):
+    app.config.setdefault('INVOICE_PREFIX', 'INV-')
+    app.config.setdefault('INVOICE_BLOCK_SIZE', 50)
+    app.extensions['invoice_allocator'] = InvoiceAllocator(
+        prefix=app.config['INVOICE_PREFIX'],
+        block_size=app.config['INVOICE_BLOCK_SIZE'],
+    )
+
+
+def allocate_invoice_numbers(count=1):
+    return current_app.extensions['invoice_allocator'].allocate(count)
+
+
+def reserved_invoice_number(number):
+    return current_app.extensions['invoice_allocator'].is_reserved(number)
+
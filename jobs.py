@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, delete, or_, select, update
+from config import db
+from models import Job
+
+logger = logging.getLogger('registration.jobs')
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+DEFAULT_MAX_ATTEMPTS = 5
+UNSYNCED = {"synchronize_session": False}
+
+
+class Task:
+    def __init__(self, name, func, max_attempts, admin):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.admin = admin
+
+
+TASKS = {}
+
+
+def task(name=None, max_attempts=DEFAULT_MAX_ATTEMPTS, admin=False):
+    """Register a function as a job; ``admin`` tasks may be started from the admin API
+
+    Jobs are called with their JSON payload as keyword arguments, and whatever
+    they return (if JSON-serializable) is stored as the job's result.
+    """
+    def register(func):
+        TASKS[name or func.__name__] = Task(name or func.__name__, func, max_attempts, admin)
+        return func
+    return register
+
+
+def get_task(name):
+    if name not in TASKS:
+        raise KeyError(f"Unknown job: {name}")
+    return TASKS[name]
+
+
+def enqueue(name, payload=None, run_at=None, commit=True):
+    """Queue a job, returning it
+
+    With commit=False the job joins the caller's transaction, so it only runs
+    if the caller's own writes are committed too.
+    """
+    job = Job(name=name, payload=json.dumps(payload or {}), run_at=run_at or datetime.utcnow(),
+              max_attempts=get_task(name).max_attempts, status=QUEUED, attempts=0)
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+        wake_workers()
+    return job
+
+
+def schedule(name, key, run_at, payload=None, commit=True):
+    """Queue a job under ``key``, moving the existing one if there is one
+
+    Rescheduling a job that is running queues it again; the current run will
+    not overwrite the new schedule when it finishes.
+    """
+    job = Job.query.filter_by(key=key).first()
+    if job is None:
+        job = Job(name=name, key=key, max_attempts=get_task(name).max_attempts)
+        db.session.add(job)
+    job.payload = json.dumps(payload or {})
+    job.run_at = run_at
+    job.status = QUEUED
+    job.attempts = 0
+    job.finished_at = None
+    job.last_error = None
+    if commit:
+        db.session.commit()
+    return job
+
+
+def unschedule(key, commit=True):
+    """Drop a queued job by key; finished and running jobs are left alone"""
+    db.session.execute(delete(Job).where(Job.key == key, Job.status == QUEUED), execution_options=UNSYNCED)
+    if commit:
+        db.session.commit()
+
+
+def backoff(attempts):
+    """Seconds before retry number ``attempts``: exponential with jitter, capped"""
+    base = current_app.config['JOB_BACKOFF_BASE']
+    delay = min(current_app.config['JOB_BACKOFF_MAX'], base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim(worker):
+    """Mark the next due job as running and return (id, name, payload, attempts, max_attempts, started_at)
+
+    Jobs left running by a worker that died are picked up again after JOB_TIMEOUT.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config['JOB_TIMEOUT'])
+    claimable = or_(
+        and_(Job.status == QUEUED, Job.run_at <= now),
+        and_(Job.status == RUNNING, Job.started_at < stale),
+    )
+    candidate = select(Job.id).where(claimable).order_by(Job.run_at, Job.id).limit(1).scalar_subquery()
+    # claimable is repeated so a worker that lost the race for the candidate updates nothing
+    row = db.session.execute(
+        update(Job)
+        .where(Job.id == candidate, claimable)
+        .values(status=RUNNING, started_at=now, worker=worker, attempts=Job.attempts + 1)
+        .returning(Job.id, Job.name, Job.payload, Job.attempts, Job.max_attempts, Job.started_at),
+        execution_options=UNSYNCED
+    ).first()
+    db.session.commit()
+    return row
+
+
+def finish(job_id, started_at, **values):
+    """Record the outcome unless the job was rescheduled or reclaimed meanwhile"""
+    db.session.execute(
+        update(Job).where(Job.id == job_id, Job.status == RUNNING, Job.started_at == started_at).values(**values),
+        execution_options=UNSYNCED
+    )
+    db.session.commit()
+
+
+def run_job(claimed):
+    job_id, name, payload, attempts, max_attempts, started_at = claimed
+    try:
+        result = get_task(name).func(**json.loads(payload or '{}'))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()[-4000:]
+        now = datetime.utcnow()
+        if attempts >= max_attempts:
+            logger.error("Job %s (%s) failed after %s attempts:\n%s", job_id, name, attempts, error)
+            finish(job_id, started_at, status=FAILED, finished_at=now, last_error=error)
+        else:
+            logger.warning("Job %s (%s) failed on attempt %s, retrying:\n%s", job_id, name, attempts, error)
+            finish(job_id, started_at, status=QUEUED, run_at=now + timedelta(seconds=backoff(attempts)),
+                   last_error=error)
+        return False
+
+    try:
+        result = json.dumps(result) if result is not None else None
+    except TypeError:
+        result = json.dumps(repr(result))
+    finish(job_id, started_at, status=SUCCEEDED, finished_at=datetime.utcnow(), result=result, last_error=None)
+    return True
+
+
+def run_pending(worker, limit=None):
+    """Run due jobs until none are left (or ``limit`` ran); returns how many ran"""
+    ran = 0
+    while limit is None or ran < limit:
+        claimed = claim(worker)
+        if claimed is None:
+            break
+        run_job(claimed)
+        ran += 1
+    return ran
+
+
+class JobWorkers:
+    """Threads that run due jobs, polling the table and woken early by enqueue()"""
+
+    def __init__(self, app, threads=2, interval=1.0):
+        self.app = app
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.threads = [
+            threading.Thread(target=self._run, args=(f"{prefix}:{n}",), name=f'jobs-{n}', daemon=True)
+            for n in range(threads)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def _run(self, worker):
+        # Started from a request: give it the interpreter until the first poll or wakeup
+        self.wakeup.wait(self.interval)
+        while not self.stopping.is_set():
+            ran = 0
+            try:
+                with self.app.app_context():
+                    ran = run_pending(worker, limit=1)
+            except Exception:
+                logger.exception("Job worker %s failed", worker)
+            if not ran:
+                self.wakeup.wait(self.interval)
+                self.wakeup.clear()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+def wake_workers():
+    workers = current_app.extensions.get('job_workers')
+    if workers is not None:
+        workers.wake()
+
+
+def purge_jobs(before):
+    """Delete succeeded and failed jobs that finished before ``before``"""
+    result = db.session.execute(
+        delete(Job).where(Job.status.in_((SUCCEEDED, FAILED)), Job.finished_at < before),
+        execution_options=UNSYNCED
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def init_jobs(app):
+    """Start the in-process workers on the first request, so CLI commands never spawn them
+
+    Set JOB_WORKER_ENABLED=0 when jobs run in a separate `flask jobs work` process.
+    """
+    app.config.setdefault('JOB_WORKER_ENABLED', True)
+    app.config.setdefault('JOB_WORKER_THREADS', int(os.environ.get('JOB_WORKER_THREADS', 2)))
+    app.config.setdefault('JOB_POLL_INTERVAL', float(os.environ.get('JOB_POLL_INTERVAL', 1.0)))
+    app.config.setdefault('JOB_TIMEOUT', 600)
+    app.config.setdefault('JOB_BACKOFF_BASE', 5)
+    app.config.setdefault('JOB_BACKOFF_MAX', 3600)
+    import tasks  # noqa: F401 - registers the job functions
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_job_workers():
+        if not app.config['JOB_WORKER_ENABLED'] or 'job_workers' in app.extensions:
+            return
+        with lock:
+            if 'job_workers' not in app.extensions:
+                workers = JobWorkers(app, app.config['JOB_WORKER_THREADS'], app.config['JOB_POLL_INTERVAL'])
+                app.extensions['job_workers'] = workers
+                workers.start()
@@ -0,0 +1,162 @@
+import csv
+from sqlalchemy import insert, literal, select
+from config import db
+from location_index import normalize
+from models import Station, District, Church
+from response_cache import invalidate
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MAX_ROWS = 100000
+DEFAULT_REPORT_LIMIT = 1000
+MAX_NAME_LENGTH = 100
+HEADER = ["station", "district", "church"]
+
+
+class LocationImportTooLarge(Exception):
+    """Raised when a file has more rows than LOCATION_IMPORT_MAX_ROWS"""
+
+
+class Node:
+    """A station, district or church, either already stored (id set) or to be created"""
+    __slots__ = ('id', 'name', 'parent')
+
+    def __init__(self, id, name, parent=None):
+        self.id = id
+        self.name = name
+        self.parent = parent
+
+    def path(self):
+        return (self.parent.path() if self.parent is not None else []) + [self.name]
+
+
+class LocationTree:
+    """Existing stations, districts and churches keyed by normalized name under their parent"""
+
+    def __init__(self):
+        self.stations = {}
+        self.districts = {}
+        self.churches = {}
+        self.new = {"stations": [], "districts": [], "churches": []}
+        self.matched = {"stations": set(), "districts": set(), "churches": set()}
+
+    @classmethod
+    def load(cls):
+        tree = cls()
+        stations, districts = {}, {}
+        for station_id, name in db.session.execute(select(Station.id, Station.name).order_by(Station.id)):
+            stations[station_id] = tree.stations.setdefault(normalize(name), Node(station_id, name))
+        for district_id, name, station_id in db.session.execute(
+                select(District.id, District.name, District.station_id).order_by(District.id)):
+            station = stations[station_id]
+            districts[district_id] = tree.districts.setdefault((station, normalize(name)),
+                                                               Node(district_id, name, station))
+        for church_id, name, district_id in db.session.execute(
+                select(Church.id, Church.name, Church.district_id).order_by(Church.id)):
+            district = districts[district_id]
+            tree.churches.setdefault((district, normalize(name)), Node(church_id, name, district))
+        return tree
+
+    def node(self, level, index, key, name, parent=None):
+        """The existing or already planned node for ``key``, planning a new one if there is none"""
+        node = index.get(key)
+        if node is None:
+            node = index[key] = Node(None, name, parent)
+            self.new[level].append(node)
+        elif node.id is not None:
+            self.matched[level].add(node)
+        return node
+
+    def add(self, station, district, church):
+        """Plan one row; returns the deepest node it names"""
+        node = self.node("stations", self.stations, normalize(station), station)
+        if district:
+            node = self.node("districts", self.districts, (node, normalize(district)), district, node)
+        if church:
+            node = self.node("churches", self.churches, (node, normalize(church)), church, node)
+        return node
+
+
+def read_rows(lines):
+    """Yield (line_number, station, district, church, error) from CSV text lines
+
+    A header row of station,district,church is skipped; district and church may
+    be left empty to add just a station or a district.
+    """
+    reader = csv.reader(lines)
+    for cells in reader:
+        cells = [" ".join(cell.split()) for cell in cells]
+        while cells and not cells[-1]:
+            cells.pop()
+        if not cells:
+            continue
+        if reader.line_num == 1 and [cell.casefold() for cell in cells] == HEADER[:len(cells)]:
+            continue
+        station, district, church = (cells + ["", ""])[:3]
+        error = None
+        if len(cells) > 3:
+            error = "Expected at most 3 columns: station,district,church"
+        elif not station or (church and not district):
+            error = "A church needs a district and a district needs a station"
+        elif any(len(name) > MAX_NAME_LENGTH for name in cells):
+            error = f"Names are limited to {MAX_NAME_LENGTH} characters"
+        yield reader.line_num, station, district, church, error
+
+
+def insert_nodes(model, nodes, batch_size, parent_column=None, parent_tag=None):
+    """Insert planned nodes with multi-row INSERT ... RETURNING statements, committing each batch
+
+    Returned rows are matched back to nodes by (parent id, name), which is unique
+    among planned nodes; asking for them in parameter order would make SQLite
+    insert one row per statement. Cached child lists are tagged by parent, so
+    each batch evicts the lists it adds to.
+    """
+    parent = getattr(model, parent_column) if parent_column is not None else literal(None)
+    for start in range(0, len(nodes), batch_size):
+        batch = nodes[start:start + batch_size]
+        rows = [{"name": node.name} for node in batch]
+        if parent_column is not None:
+            for row, node in zip(rows, batch):
+                row[parent_column] = node.parent.id
+            invalidate(*{f"{parent_tag}:{node.parent.id}" for node in batch})
+        by_key = {(node.parent.id if node.parent is not None else None, node.name): node for node in batch}
+        for node_id, name, parent_id in db.session.execute(insert(model).returning(model.id, model.name, parent), rows):
+            by_key[parent_id, name].id = node_id
+        db.session.commit()
+
+
+def import_locations(lines, dry_run=False, batch_size=DEFAULT_BATCH_SIZE, max_rows=DEFAULT_MAX_ROWS,
+                     report_limit=DEFAULT_REPORT_LIMIT):
+    """Add the stations, districts and churches in a CSV that do not exist yet; returns a report
+
+    Names are matched case- and whitespace-insensitively under their parent, so
+    re-running an import (for instance after one failed half way, since every
+    batch commits on its own) only adds what is still missing. ``report_limit``
+    caps the created paths listed per level; None lists them all.
+    """
+    tree = LocationTree.load()
+    report = {"dry_run": dry_run, "rows": 0, "duplicate_rows": 0, "errors": []}
+    seen = set()
+    for line, station, district, church, error in read_rows(lines):
+        report["rows"] += 1
+        if report["rows"] > max_rows:
+            raise LocationImportTooLarge(f"An import may contain at most {max_rows} rows")
+        if error:
+            report["errors"].append({"line": line, "error": error})
+            continue
+        node = tree.add(station, district, church)
+        if node in seen:
+            report["duplicate_rows"] += 1
+        seen.add(node)
+
+    if not dry_run:
+        insert_nodes(Station, tree.new["stations"], batch_size)
+        insert_nodes(District, tree.new["districts"], batch_size, "station_id", "station")
+        insert_nodes(Church, tree.new["churches"], batch_size, "district_id", "district")
+
+    created = {}
+    for level, nodes in tree.new.items():
+        report[level] = {"created": len(nodes), "unchanged": len(tree.matched[level])}
+        created[level] = [node.path() for node in nodes[:report_limit]]
+    report["created"] = created
+    report["truncated"] = report_limit is not None and any(len(nodes) > report_limit for nodes in tree.new.values())
+    return report
@@ -0,0 +1,192 @@
+import time
+from threading import Lock
+from flask import current_app
+from sqlalchemy import DDL, event, select, update
+from archive import archive_tables, archived_partitions
+from config import db
+from models import CacheVersion, Station, District, Church, Registration
+
+BACKFILL_BATCH_SIZE = 1000
+LOCATIONS_VERSION = 'locations'
+LOCATION_TABLES = ("stations", "districts", "churches")
+# Per-process location caches are rebuilt at least this often, whatever the version says
+DEFAULT_LOCATION_CACHE_TTL = 300
+
+_index_cache = {"index": None, "version": None, "built_at": float('-inf')}
+_index_lock = Lock()
+
+
+def location_version_ddl():
+    """Triggers bumping the locations cache version, so route writes, CSV imports
+    and cascaded deletes in any worker all reach every other worker's caches"""
+    bump = (f"INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('{LOCATIONS_VERSION}', 0);\n"
+            f"                UPDATE cache_versions SET version = version + 1 WHERE name = '{LOCATIONS_VERSION}';")
+    return tuple(
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_cache_version_{op.lower()} AFTER {op} ON {table} BEGIN
+                {bump}
+            END"""
+        for table in LOCATION_TABLES for op in ("INSERT", "UPDATE", "DELETE")
+    )
+
+
+def location_version_pg_ddl():
+    """The same bump on PostgreSQL, once per statement rather than per row"""
+    statements = [
+        f"""CREATE OR REPLACE FUNCTION bump_locations_cache_version() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO cache_versions (name, version) VALUES ('{LOCATIONS_VERSION}', 1)
+            ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql"""
+    ]
+    for table in LOCATION_TABLES:
+        statements += [
+            f"DROP TRIGGER IF EXISTS {table}_cache_version ON {table}",
+            f"""CREATE TRIGGER {table}_cache_version AFTER INSERT OR UPDATE OR DELETE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_locations_cache_version()""",
+        ]
+    return tuple(statements)
+
+
+LOCATION_VERSION_DDL = location_version_ddl()
+LOCATION_VERSION_PG_DDL = location_version_pg_ddl()
+
+for statement in LOCATION_VERSION_DDL:
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in LOCATION_VERSION_PG_DDL:
+    event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+
+
+def location_version():
+    """Version of the location tables as last committed by any worker; one primary key lookup"""
+    return db.session.execute(
+        select(CacheVersion.version).where(CacheVersion.name == LOCATIONS_VERSION)
+    ).scalar() or 0
+
+
+def location_cache_stale(cache, version):
+    """Whether a per-process location cache must be rebuilt
+
+    The version catches writes by any worker; the TTL bounds staleness on
+    databases without the version triggers.
+    """
+    ttl = current_app.config.get('LOCATION_CACHE_TTL', DEFAULT_LOCATION_CACHE_TTL)
+    return cache["version"] != version or time.monotonic() - cache["built_at"] >= ttl
+
+
+def normalize(name):
+    return " ".join(str(name or "").split()).casefold()
+
+
+class ChurchIndex:
+    """In-memory lookups between location names and church ids
+
+    Churches are matched on the full (station, district, church) path; when that
+    fails, a church name that is unique across the whole tree is accepted too.
+    """
+
+    def __init__(self, rows):
+        self.by_path = {}
+        self.by_id = {}
+        by_name = {}
+        for station_name, district_name, church_id, church_name in rows:
+            self.by_id[church_id] = (station_name, district_name, church_name)
+            self.by_path.setdefault((normalize(station_name), normalize(district_name), normalize(church_name)), church_id)
+            by_name.setdefault(normalize(church_name), []).append(church_id)
+        self.by_unique_name = {name: ids[0] for name, ids in by_name.items() if len(ids) == 1}
+
+    def resolve(self, station, district, church):
+        """Return the church id for the given names, or None"""
+        church_id = self.by_path.get((normalize(station), normalize(district), normalize(church)))
+        if church_id is None:
+            church_id = self.by_unique_name.get(normalize(church))
+        return church_id
+
+    def names(self, church_id):
+        """Return (station, district, church) names for a church id, or None"""
+        return self.by_id.get(church_id)
+
+
+def build_church_index():
+    rows = (
+        db.session.query(Station.name, District.name, Church.id, Church.name)
+        .join(District, District.station_id == Station.id)
+        .join(Church, Church.district_id == District.id)
+        .order_by(Church.id)
+        .all()
+    )
+    return ChurchIndex(rows)
+
+
+def get_church_index():
+    """Return the process-wide index, rebuilding it after a location write by any worker
+
+    The version is read before the rebuild, so an index that raced a write is
+    only ever labelled older than it is and gets rebuilt once more.
+    """
+    version = location_version()
+    with _index_lock:
+        if _index_cache["index"] is None or location_cache_stale(_index_cache, version):
+            _index_cache["index"] = build_church_index()
+            _index_cache["version"] = version
+            _index_cache["built_at"] = time.monotonic()
+        return _index_cache["index"]
+
+
+def invalidate_church_index():
+    with _index_lock:
+        _index_cache["index"] = None
+
+
+def detach_churches(church_ids):
+    """Clear church_id on live and archived registrations of churches about to be deleted
+
+    SQLite does not enforce the foreign key's ON DELETE SET NULL here, and a
+    deleted church's id can be handed to the next church created. Runs in the
+    caller's transaction; the location strings stay, so a later backfill can
+    resolve the rows again.
+    """
+    church_ids = list(church_ids)
+    if not church_ids:
+        return
+    tables = [Registration.__table__] + [archive_tables(p).registrations for p in archived_partitions()]
+    for table in tables:
+        db.session.execute(update(table).where(table.c.church_id.in_(church_ids)).values(church_id=None))
+
+
+def backfill_church_ids(batch_size=BACKFILL_BATCH_SIZE, rescan=False):
+    """Fill Registration.church_id from the location strings, one keyset batch per transaction
+
+    Returns (resolved, unresolved) counts. Only rows with a NULL church_id are
+    visited unless ``rescan`` is set.
+    """
+    index = build_church_index()
+    resolved = unresolved = 0
+    last_id = 0
+    while True:
+        query = db.session.query(Registration.id, Registration.station, Registration.district, Registration.church) \
+            .filter(Registration.id > last_id)
+        if not rescan:
+            query = query.filter(Registration.church_id.is_(None))
+        rows = query.order_by(Registration.id).limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        # Group by target church so each batch costs one UPDATE per distinct church
+        by_church = {}
+        for registration_id, station, district, church in rows:
+            church_id = index.resolve(station, district, church)
+            if church_id is None:
+                unresolved += 1
+                continue
+            by_church.setdefault(church_id, []).append(registration_id)
+            resolved += 1
+        for church_id, ids in by_church.items():
+            db.session.execute(
+                update(Registration).where(Registration.id.in_(ids)).values(church_id=church_id),
+                execution_options={"synchronize_session": False}
+            )
+        db.session.commit()
+    return resolved, unresolved
@@ -0,0 +1,42 @@
+import logging
+import os
+from flask import current_app
+from config import env_bool
+
+logger = logging.getLogger('registration.mail')
+
+
+def send_email(to, subject, body):
+    """Send a plain-text email over SMTP; without MAIL_SERVER (dev) it is logged instead
+
+    Bodies can carry password reset links, so they are only logged at DEBUG.
+    """
+    config = current_app.config
+    if not config['MAIL_SERVER']:
+        logger.info("MAIL_SERVER is not set; not sending email to %s: %s", to, subject)
+        logger.debug("Unsent email body:\n%s", body)
+        return
+
+    import smtplib
+    from email.message import EmailMessage
+    message = EmailMessage()
+    message['From'] = config['MAIL_SENDER']
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(body)
+    with smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=config['MAIL_TIMEOUT']) as smtp:
+        if config['MAIL_USE_TLS']:
+            smtp.starttls()
+        if config['MAIL_USERNAME']:
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        smtp.send_message(message)
+
+
+def init_mail(app):
+    app.config.setdefault('MAIL_SERVER', os.environ.get('MAIL_SERVER'))
+    app.config.setdefault('MAIL_PORT', int(os.environ.get('MAIL_PORT', 587)))
+    app.config.setdefault('MAIL_USERNAME', os.environ.get('MAIL_USERNAME'))
+    app.config.setdefault('MAIL_PASSWORD', os.environ.get('MAIL_PASSWORD'))
+    app.config.setdefault('MAIL_USE_TLS', env_bool('MAIL_USE_TLS', True))
+    app.config.setdefault('MAIL_SENDER', os.environ.get('MAIL_SENDER', 'no-reply@localhost'))
+    app.config.setdefault('MAIL_TIMEOUT', 30)
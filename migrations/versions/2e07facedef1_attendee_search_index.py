@@ -0,0 +1,85 @@
+"""attendee search index
+
+The typo table (attendee_search_terms) starts empty; it is filled in the
+background on the first fuzzy search, or by `flask admin rebuild-search-index`.
+
+Revision ID: 2e07facedef1
+Revises: f2f928bfa674
+Create Date: 2026-10-18 19:40:12.512043
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '2e07facedef1'
+down_revision = 'f2f928bfa674'
+branch_labels = None
+depends_on = None
+
+
+UPGRADE_SQL = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS attendee_search USING fts5(
+        name, leader_name, leader_phone, invoice_number, church,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS attendee_search_vocab USING fts5vocab(attendee_search, 'row')",
+    """CREATE TABLE IF NOT EXISTS attendee_search_terms (
+        variant TEXT NOT NULL, term TEXT NOT NULL, PRIMARY KEY (variant, term)
+    ) WITHOUT ROWID""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_insert AFTER INSERT ON attendees BEGIN
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_update AFTER UPDATE OF name, registration_id ON attendees BEGIN
+        DELETE FROM attendee_search WHERE rowid = old.id;
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_delete AFTER DELETE ON attendees BEGIN
+        DELETE FROM attendee_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_registration_update
+    AFTER UPDATE OF leader_name, leader_phone, invoice_number, church ON registrations BEGIN
+        DELETE FROM attendee_search WHERE rowid IN (SELECT id FROM attendees WHERE registration_id = new.id);
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT a.id, a.name, new.leader_name, new.leader_phone, new.invoice_number, new.church
+        FROM attendees a WHERE a.registration_id = new.id;
+    END""",
+    """INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+    SELECT a.id, a.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+    FROM attendees a LEFT JOIN registrations r ON r.id = a.registration_id""",
+)
+
+DOWNGRADE_SQL = (
+    "DROP TRIGGER IF EXISTS attendee_search_registration_update",
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_delete",
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_update",
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_insert",
+    "DROP TABLE IF EXISTS attendee_search_terms",
+    "DROP TABLE IF EXISTS attendee_search_vocab",
+    "DROP TABLE IF EXISTS attendee_search",
+)
+
+
+def upgrade():
+    # Search results (and registration cascades) join attendees on registration_id
+    with op.batch_alter_table('attendees', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_attendees_registration_id'), ['registration_id'], unique=False)
+
+    # FTS5 is SQLite-only; other databases fall back to LIKE searches
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in UPGRADE_SQL:
+        op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in DOWNGRADE_SQL:
+            op.execute(statement)
+
+    with op.batch_alter_table('attendees', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_attendees_registration_id'))
@@ -0,0 +1,44 @@
+"""registration amount received
+
+Revision ID: 3041c33c68c8
+Revises: dd8a83020efd
+Create Date: 2026-10-18 20:21:24.678876
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3041c33c68c8'
+down_revision = 'dd8a83020efd'
+branch_labels = None
+depends_on = None
+
+
+# Partial payments recorded so far, so invoices left underpaid by earlier batches can still be settled
+BACKFILL_SQL = """
+UPDATE registrations SET amount_received = (
+    SELECT coalesce(sum(payment_callbacks.amount), 0) FROM payment_callbacks
+    WHERE payment_callbacks.invoice_number = registrations.invoice_number
+      AND payment_callbacks.status IN ('applied', 'underpaid')
+)
+"""
+
+
+def archive_partitions():
+    """Archive copies of registrations created by archive.py, which keep the live table's columns"""
+    return [name for name in sa.inspect(op.get_bind()).get_table_names() if name.startswith('registrations_archive_')]
+
+
+def upgrade():
+    # Plain ALTER TABLE rather than a batch rebuild, which would drop the table's triggers on SQLite
+    for name in ['registrations', *archive_partitions()]:
+        op.add_column(name, sa.Column('amount_received', sa.Float(), server_default='0', nullable=False))
+    op.execute(BACKFILL_SQL)
+
+
+def downgrade():
+    for name in archive_partitions():
+        op.drop_column(name, 'amount_received')
+    op.drop_column('registrations', 'amount_received')
@@ -0,0 +1,47 @@
+"""postgresql location cache version triggers
+
+53f3365c2847 created the 'locations' version triggers on SQLite only, so on
+PostgreSQL the version never moved. See location_index.py.
+
+Revision ID: 4d3c7f42e7df
+Revises: a9bff64f684a
+Create Date: 2026-10-18 20:37:21.331986
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4d3c7f42e7df'
+down_revision = 'a9bff64f684a'
+branch_labels = None
+depends_on = None
+
+
+FUNCTION_SQL = """CREATE OR REPLACE FUNCTION bump_locations_cache_version() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO cache_versions (name, version) VALUES ('locations', 1)
+    ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql"""
+
+TABLES = ('stations', 'districts', 'churches')
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(FUNCTION_SQL)
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_cache_version ON {table}")
+        op.execute(f"CREATE TRIGGER {table}_cache_version AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                   "FOR EACH STATEMENT EXECUTE FUNCTION bump_locations_cache_version()")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in reversed(TABLES):
+        op.execute(f"DROP TRIGGER IF EXISTS {table}_cache_version ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS bump_locations_cache_version()")
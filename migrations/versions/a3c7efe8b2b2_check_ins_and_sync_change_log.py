@@ -0,0 +1,101 @@
+"""check ins and sync change log
+
+Revision ID: a3c7efe8b2b2
+Revises: 2e07facedef1
+Create Date: 2026-10-18 19:34:54.459324
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c7efe8b2b2'
+down_revision = '2e07facedef1'
+branch_labels = None
+depends_on = None
+
+
+# Every write to these tables appends to sync_changes; see checkin.py
+TRIGGER_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_insert AFTER INSERT ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_update AFTER UPDATE OF invoice_number, leader_name, leader_phone, church, paid ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_delete AFTER DELETE ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', old.id, 'delete');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_attendees_insert AFTER INSERT ON attendees BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('attendee', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_attendees_update AFTER UPDATE OF name, age, registration_id ON attendees BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('attendee', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_attendees_delete AFTER DELETE ON attendees BEGIN
+        DELETE FROM check_ins WHERE attendee_id = old.id;
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('attendee', old.id, 'delete');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_check_ins_insert AFTER INSERT ON check_ins BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('check_in', new.attendee_id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_check_ins_update AFTER UPDATE OF checked_in_at, device_id ON check_ins BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('check_in', new.attendee_id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_check_ins_delete AFTER DELETE ON check_ins BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('check_in', old.attendee_id, 'delete');
+    END""",
+)
+
+DROP_TRIGGER_SQL = (
+    "DROP TRIGGER IF EXISTS sync_check_ins_delete",
+    "DROP TRIGGER IF EXISTS sync_check_ins_update",
+    "DROP TRIGGER IF EXISTS sync_check_ins_insert",
+    "DROP TRIGGER IF EXISTS sync_attendees_delete",
+    "DROP TRIGGER IF EXISTS sync_attendees_update",
+    "DROP TRIGGER IF EXISTS sync_attendees_insert",
+    "DROP TRIGGER IF EXISTS sync_registrations_delete",
+    "DROP TRIGGER IF EXISTS sync_registrations_update",
+    "DROP TRIGGER IF EXISTS sync_registrations_insert",
+)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('sync_changes',
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('entity', sa.String(length=20), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=False),
+    sa.Column('op', sa.String(length=10), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False),
+    sa.PrimaryKeyConstraint('version'),
+    sqlite_autoincrement=True
+    )
+    op.create_table('check_ins',
+    sa.Column('attendee_id', sa.Integer(), nullable=False),
+    sa.Column('checked_in_at', sa.DateTime(), nullable=False),
+    sa.Column('recorded_at', sa.DateTime(), nullable=False),
+    sa.Column('device_id', sa.String(length=64), nullable=True),
+    sa.Column('admin_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['admin_id'], ['admins.id'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['attendee_id'], ['attendees.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('attendee_id')
+    )
+    # ### end Alembic commands ###
+
+    # The change log is SQLite-only, like the attendee search index
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in TRIGGER_SQL:
+            op.execute(statement)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in DROP_TRIGGER_SQL:
+            op.execute(statement)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table('check_ins')
+    op.drop_table('sync_changes')
+    # ### end Alembic commands ###
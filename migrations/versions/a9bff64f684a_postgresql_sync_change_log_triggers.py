@@ -0,0 +1,65 @@
+"""postgresql sync change log triggers
+
+a3c7efe8b2b2 created the sync_changes triggers on SQLite only, so on
+PostgreSQL the check-in change log stayed empty. See checkin.py.
+
+Revision ID: a9bff64f684a
+Revises: aaa968946856
+Create Date: 2026-10-18 20:36:02.245699
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9bff64f684a'
+down_revision = 'aaa968946856'
+branch_labels = None
+depends_on = None
+
+
+# Writers lock the log until they commit, so versions become visible in order
+FUNCTION_SQL = """CREATE OR REPLACE FUNCTION sync_changes_log() RETURNS trigger AS $$
+BEGIN
+    LOCK TABLE sync_changes IN EXCLUSIVE MODE;
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO sync_changes (entity, entity_id, op)
+        VALUES (TG_ARGV[0], (to_jsonb(old) ->> TG_ARGV[1])::integer, 'delete');
+        RETURN old;
+    END IF;
+    INSERT INTO sync_changes (entity, entity_id, op)
+    VALUES (TG_ARGV[0], (to_jsonb(new) ->> TG_ARGV[1])::integer, 'upsert');
+    RETURN new;
+END
+$$ LANGUAGE plpgsql"""
+
+# (table, key column, entity, columns whose updates are logged)
+TRACKED = (
+    ('registrations', 'id', 'registration',
+     'invoice_number, leader_name, leader_phone, church, paid, meeting_id, status'),
+    ('attendees', 'id', 'attendee', 'name, age, registration_id'),
+    ('check_ins', 'attendee_id', 'check_in', 'checked_in_at, device_id'),
+)
+TRIGGERS = [
+    (table, suffix, timing, key, entity)
+    for table, key, entity, columns in TRACKED
+    for suffix, timing in (('insert', 'INSERT'), ('update', f'UPDATE OF {columns}'), ('delete', 'DELETE'))
+]
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(FUNCTION_SQL)
+    for table, suffix, timing, key, entity in TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS sync_{table}_{suffix} ON {table}")
+        op.execute(f"CREATE TRIGGER sync_{table}_{suffix} AFTER {timing} ON {table} "
+                   f"FOR EACH ROW EXECUTE FUNCTION sync_changes_log('{entity}', '{key}')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table, suffix, _, _, _ in reversed(TRIGGERS):
+        op.execute(f"DROP TRIGGER IF EXISTS sync_{table}_{suffix} ON {table}")
+    op.execute("DROP FUNCTION IF EXISTS sync_changes_log()")
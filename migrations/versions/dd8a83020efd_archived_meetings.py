@@ -0,0 +1,120 @@
+"""archived meetings
+
+Revision ID: dd8a83020efd
+Revises: 9b67b4c5960e
+Create Date: 2026-10-18 20:04:39.547826
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'dd8a83020efd'
+down_revision = '9b67b4c5960e'
+branch_labels = None
+depends_on = None
+
+
+# Archiving moves rows out of registrations and attendees, and SQLite hands out
+# max(rowid) + 1 for new rows, so without AUTOINCREMENT a new registration could
+# take an archived one's id. Both tables are rebuilt with it; the rebuild drops
+# their triggers, so those are dropped first and recreated afterwards.
+DROP_TRIGGER_SQL = (
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_insert",
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_update",
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_delete",
+    "DROP TRIGGER IF EXISTS attendee_search_registration_update",
+    "DROP TRIGGER IF EXISTS sync_registrations_insert",
+    "DROP TRIGGER IF EXISTS sync_registrations_update",
+    "DROP TRIGGER IF EXISTS sync_registrations_delete",
+    "DROP TRIGGER IF EXISTS sync_attendees_insert",
+    "DROP TRIGGER IF EXISTS sync_attendees_update",
+    "DROP TRIGGER IF EXISTS sync_attendees_delete",
+)
+
+TRIGGER_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_insert AFTER INSERT ON attendees BEGIN
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_update AFTER UPDATE OF name, registration_id ON attendees BEGIN
+        DELETE FROM attendee_search WHERE rowid = old.id;
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_delete AFTER DELETE ON attendees BEGIN
+        DELETE FROM attendee_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_registration_update
+    AFTER UPDATE OF leader_name, leader_phone, invoice_number, church ON registrations BEGIN
+        DELETE FROM attendee_search WHERE rowid IN (SELECT id FROM attendees WHERE registration_id = new.id);
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT a.id, a.name, new.leader_name, new.leader_phone, new.invoice_number, new.church
+        FROM attendees a WHERE a.registration_id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_insert AFTER INSERT ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_update
+    AFTER UPDATE OF invoice_number, leader_name, leader_phone, church, paid, meeting_id, status ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_delete AFTER DELETE ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', old.id, 'delete');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_attendees_insert AFTER INSERT ON attendees BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('attendee', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_attendees_update AFTER UPDATE OF name, age, registration_id ON attendees BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('attendee', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_attendees_delete AFTER DELETE ON attendees BEGIN
+        DELETE FROM check_ins WHERE attendee_id = old.id;
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('attendee', old.id, 'delete');
+    END""",
+)
+
+
+def rebuild_with_autoincrement(enabled):
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for statement in DROP_TRIGGER_SQL:
+        op.execute(statement)
+    for table in ('registrations', 'attendees'):
+        with op.batch_alter_table(table, recreate='always', table_kwargs={'sqlite_autoincrement': enabled}):
+            pass
+    for statement in TRIGGER_SQL:
+        op.execute(statement)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('archived_meetings',
+    sa.Column('meeting_id', sa.Integer(), nullable=False),
+    sa.Column('partition', sa.String(length=20), nullable=False),
+    sa.Column('registrations', sa.Integer(), nullable=False),
+    sa.Column('attendees', sa.Integer(), nullable=False),
+    sa.Column('check_ins', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('meeting_id')
+    )
+    with op.batch_alter_table('archived_meetings', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_meetings_partition'), ['partition'], unique=False)
+
+    # ### end Alembic commands ###
+
+    rebuild_with_autoincrement(True)
+
+
+def downgrade():
+    rebuild_with_autoincrement(False)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('archived_meetings', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_meetings_partition'))
+
+    op.drop_table('archived_meetings')
+    # ### end Alembic commands ###
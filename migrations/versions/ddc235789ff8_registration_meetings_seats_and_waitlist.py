@@ -0,0 +1,122 @@
+"""registration meetings seats and waitlist
+
+Revision ID: ddc235789ff8
+Revises: a3c7efe8b2b2
+Create Date: 2026-10-18 19:38:12.522219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ddc235789ff8'
+down_revision = 'a3c7efe8b2b2'
+branch_labels = None
+depends_on = None
+
+
+# Rebuilding registrations on SQLite drops its triggers, and the rename fails while
+# attendee triggers still point at the old table, so these are dropped and recreated
+# around the batch operations.
+DROP_TRIGGER_SQL = (
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_insert",
+    "DROP TRIGGER IF EXISTS attendee_search_attendee_update",
+    "DROP TRIGGER IF EXISTS attendee_search_registration_update",
+    "DROP TRIGGER IF EXISTS sync_registrations_insert",
+    "DROP TRIGGER IF EXISTS sync_registrations_update",
+    "DROP TRIGGER IF EXISTS sync_registrations_delete",
+)
+
+SEARCH_TRIGGER_SQL = (
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_insert AFTER INSERT ON attendees BEGIN
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_attendee_update AFTER UPDATE OF name, registration_id ON attendees BEGIN
+        DELETE FROM attendee_search WHERE rowid = old.id;
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS attendee_search_registration_update
+    AFTER UPDATE OF leader_name, leader_phone, invoice_number, church ON registrations BEGIN
+        DELETE FROM attendee_search WHERE rowid IN (SELECT id FROM attendees WHERE registration_id = new.id);
+        INSERT INTO attendee_search(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT a.id, a.name, new.leader_name, new.leader_phone, new.invoice_number, new.church
+        FROM attendees a WHERE a.registration_id = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_insert AFTER INSERT ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', new.id, 'upsert');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS sync_registrations_delete AFTER DELETE ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', old.id, 'delete');
+    END""",
+)
+
+# Check-in devices now also see a registration's meeting and status change
+SYNC_UPDATE_TRIGGER_SQL = """CREATE TRIGGER IF NOT EXISTS sync_registrations_update
+    AFTER UPDATE OF invoice_number, leader_name, leader_phone, church, paid, meeting_id, status ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', new.id, 'upsert');
+    END"""
+
+PREVIOUS_SYNC_UPDATE_TRIGGER_SQL = """CREATE TRIGGER IF NOT EXISTS sync_registrations_update
+    AFTER UPDATE OF invoice_number, leader_name, leader_phone, church, paid ON registrations BEGIN
+        INSERT INTO sync_changes (entity, entity_id, op) VALUES ('registration', new.id, 'upsert');
+    END"""
+
+
+def run_sqlite(*statements):
+    if op.get_bind().dialect.name == 'sqlite':
+        for statement in statements:
+            op.execute(statement)
+
+
+def upgrade():
+    run_sqlite(*DROP_TRIGGER_SQL)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('meetings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('capacity', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('seats_taken', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('waitlist_count', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('registrations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('meeting_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('status', sa.String(length=20), server_default='confirmed', nullable=False))
+        batch_op.add_column(sa.Column('seats', sa.Integer(), server_default='1', nullable=False))
+        batch_op.add_column(sa.Column('cancelled_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_registrations_meeting_status_id', ['meeting_id', 'status', 'id'], unique=False)
+        batch_op.create_foreign_key('fk_registrations_meeting_id_meetings', 'meetings', ['meeting_id'], ['id'], ondelete='SET NULL')
+
+    # ### end Alembic commands ###
+
+    # Existing registrations hold one seat per attendee, as new ones do
+    op.execute(
+        "UPDATE registrations SET seats = (SELECT CASE WHEN count(*) > 1 THEN count(*) ELSE 1 END "
+        "FROM attendees WHERE attendees.registration_id = registrations.id)"
+    )
+    run_sqlite(*SEARCH_TRIGGER_SQL, SYNC_UPDATE_TRIGGER_SQL)
+
+
+def downgrade():
+    run_sqlite(*DROP_TRIGGER_SQL)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    with op.batch_alter_table('registrations', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_registrations_meeting_id_meetings', type_='foreignkey')
+        batch_op.drop_index('ix_registrations_meeting_status_id')
+        batch_op.drop_column('cancelled_at')
+        batch_op.drop_column('seats')
+        batch_op.drop_column('status')
+        batch_op.drop_column('meeting_id')
+
+    with op.batch_alter_table('meetings', schema=None) as batch_op:
+        batch_op.drop_column('waitlist_count')
+        batch_op.drop_column('seats_taken')
+        batch_op.drop_column('capacity')
+
+    # ### end Alembic commands ###
+
+    run_sqlite(*SEARCH_TRIGGER_SQL, PREVIOUS_SYNC_UPDATE_TRIGGER_SQL)
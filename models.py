@@ -1,5 +1,6 @@
 from config import db 
 from datetime import datetime 
+from sqlalchemy_serializer import SerializerMixin
 
 # _______________ LOCATION MODELS _______________
 
@@ -27,40 +28,86 @@ class Church(db.Model, SerializerMixin):
     district_id = db.Column(db.Integer, db.ForeignKey('districts.id'), nullable=False)
 
 
+class CacheVersion(db.Model, SerializerMixin):
+    """Named version shared by every worker
+
+    'locations' is bumped by triggers on every location write, see location_index.py;
+    'search_terms' is how far search.py has read the change log into its typo table.
+    """
+    __tablename__ = 'cache_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
 # _______________ MEETING MODELS _______________
 class Meeting(db.Model, SerializerMixin):
     __tablename__ = 'meetings'
+    __table_args__ = (
+        # Keyset pagination and the upcoming-only filter walk (date, id)
+        db.Index('ix_meetings_date_id', 'date', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     date = db.Column(db.DateTime, nullable=False)
-    deadline = db.Column(db.DateTime, nullable=False)
+    deadline = db.Column(db.DateTime, nullable=False, index=True)
     registration_amount = db.Column(db.Float, nullable=False)
     poster_url = db.Column(db.String(300))
+    # Storage key of an uploaded poster; thumbnails are derived from it
+    poster_asset = db.Column(db.String(120))
+    poster_thumbnails_ready = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
     description = db.Column(db.Text)
+    # None means unlimited; seats_taken and waitlist_count only change through seats.py
+    capacity = db.Column(db.Integer)
+    seats_taken = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    waitlist_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    @property
+    def poster_thumbnails(self):
+        """{width: url} once the background worker has built them, else None"""
+        if not self.poster_asset or not self.poster_thumbnails_ready:
+            return None
+        from posters import thumbnail_urls
+        return thumbnail_urls(self.poster_asset)
 
 
 class Registration(db.Model, SerializerMixin):
     __tablename__ = 'registrations'
+    __table_args__ = (
+        # Waitlist promotion walks a meeting's waitlisted registrations in id order
+        db.Index('ix_registrations_meeting_status_id', 'meeting_id', 'status', 'id'),
+        # Ids are never reused once archive.py moves the highest ones out, see ArchivedMeeting
+        {'sqlite_autoincrement': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     station = db.Column(db.String(100), nullable=False)
     district = db.Column(db.String(100), nullable=False)
     church = db.Column(db.String(100), nullable=False)
+    # Resolved from the strings above; district and station are reachable through the church
+    church_id = db.Column(db.Integer, db.ForeignKey('churches.id', ondelete='SET NULL', name='fk_registrations_church_id_churches'), index=True)
     leader_name = db.Column(db.String(120), nullable=False)
     leader_phone = db.Column(db.String(50), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     invoice_number = db.Column(db.String(100), unique=True, nullable=False)
     paid = db.Column(db.Boolean, default=False)
+    # Running total of payment callbacks; reconciliation.py flips paid once it covers amount
+    amount_received = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    meeting_id = db.Column(db.Integer, db.ForeignKey('meetings.id', ondelete='SET NULL', name='fk_registrations_meeting_id_meetings'))
+    # confirmed, waitlisted or cancelled; seats are counted against the meeting by seats.py
+    status = db.Column(db.String(20), nullable=False, default='confirmed', server_default='confirmed')
+    seats = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    cancelled_at = db.Column(db.DateTime)
     
     attendees = db.relationship('Attendee', backref='registration', cascade='all, delete-orphan')
 
 
 class Attendee(db.Model, SerializerMixin):
     __tablename__ = 'attendees'
+    __table_args__ = {'sqlite_autoincrement': True}
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     age = db.Column(db.Integer, nullable=False)
-    registration_id = db.Column(db.Integer, db.ForeignKey('registration.id'))
+    registration_id = db.Column(db.Integer, db.ForeignKey('registrations.id'), index=True)
 
 
 
@@ -75,25 +122,165 @@ class Admin(db.Model, SerializerMixin):
     role = db.Column(db.String(20), nullable=False, default='admin') # 'admin' or 'super_admin'
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Bumped on password changes so previously issued tokens stop validating
+    token_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
 
     # Exclude sensitive data from serialization
-    serialize_rules = ('-password_hash',)
+    serialize_rules = ('-password_hash', '-token_version')
 
     # Password handling
     @property
-    def password(self)
+    def password(self):
         raise AttributeError("password is write-only.")
 
     @password.setter
     def password(self, password):
-        self.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+        from passwords import hash_password
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return bcrypt.check_password_hash(self.password_hash, password)
+        from passwords import check_password
+        return check_password(self.password_hash, password)
 
     def is_super_admin(self):
         return self.role == 'super_admin'
 
     def __repr__(self):
-        return f"<Admin {self.name} ({self.role})>"
\ No newline at end of file
+        return f"<Admin {self.username} ({self.role})>"
+
+
+class StreamTicket(db.Model, SerializerMixin):
+    """Single-use ticket that opens the live event stream, so the access token stays out of URLs"""
+    __tablename__ = 'stream_tickets'
+    ticket_hash = db.Column(db.String(64), primary_key=True)  # sha256 of the ticket handed to the client
+    admin_id = db.Column(db.Integer, db.ForeignKey('admins.id', ondelete='CASCADE'), nullable=False)
+    token_version = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# _______________ ANALYTICS MODELS _______________
+class RegistrationRollup(db.Model, SerializerMixin):
+    """Running registration totals per church, maintained by rollups.py"""
+    __tablename__ = 'registration_rollups'
+    station = db.Column(db.String(100), primary_key=True)
+    district = db.Column(db.String(100), primary_key=True)
+    church = db.Column(db.String(100), primary_key=True)
+    registrations = db.Column(db.Integer, nullable=False, default=0)
+    attendees = db.Column(db.Integer, nullable=False, default=0)
+    amount_invoiced = db.Column(db.Float, nullable=False, default=0.0)
+    amount_paid = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class AttendeeAgeRollup(db.Model, SerializerMixin):
+    """Running attendee counts per church and age band, maintained by rollups.py"""
+    __tablename__ = 'attendee_age_rollups'
+    station = db.Column(db.String(100), primary_key=True)
+    district = db.Column(db.String(100), primary_key=True)
+    church = db.Column(db.String(100), primary_key=True)
+    age_band = db.Column(db.String(10), primary_key=True)
+    attendees = db.Column(db.Integer, nullable=False, default=0)
+
+
+# _______________ REGISTRATION SUPPORT MODELS _______________
+class InvoiceSequence(db.Model, SerializerMixin):
+    """Next unreserved invoice number; workers reserve numbers from it in blocks"""
+    __tablename__ = 'invoice_sequences'
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+
+class IdempotencyKey(db.Model, SerializerMixin):
+    """Stored response for a request sent with an Idempotency-Key header"""
+    __tablename__ = 'idempotency_keys'
+    key = db.Column(db.String(320), primary_key=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)  # NULL while the first request is still running
+    # When the running request took the key; after IDEMPOTENCY_LEASE a retry may take it over
+    started_at = db.Column(db.DateTime)
+    response_body = db.Column(db.Text)
+    content_type = db.Column(db.String(100))
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# _______________ PAYMENT MODELS _______________
+class PaymentCallback(db.Model, SerializerMixin):
+    """Durable queue of payment confirmations waiting to be applied to registrations"""
+    __tablename__ = 'payment_callbacks'
+    __table_args__ = (
+        db.Index('ix_payment_callbacks_status_id', 'status', 'id'),
+        # A redelivered callback is dropped on insert; callbacks without a reference are all kept
+        db.UniqueConstraint('invoice_number', 'reference', name='uq_payment_callbacks_invoice_reference'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_number = db.Column(db.String(100), nullable=False, index=True)
+    amount = db.Column(db.Float)
+    reference = db.Column(db.String(120))
+    source = db.Column(db.String(20), nullable=False, default='webhook')  # 'webhook' or 'statement'
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, applied, unmatched, underpaid
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claimed_at = db.Column(db.DateTime)
+    claim_id = db.Column(db.String(32))  # batch that holds the row while it is processing
+    processed_at = db.Column(db.DateTime)
+
+
+# _______________ JOB MODELS _______________
+class Job(db.Model, SerializerMixin):
+    """Background work queued in the database and run by jobs.py workers"""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers claim the oldest due job: status = 'queued' AND run_at <= now ORDER BY run_at
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    # Scheduled jobs have a key so rescheduling moves the existing job instead of adding one
+    key = db.Column(db.String(200), unique=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    worker = db.Column(db.String(100))
+    last_error = db.Column(db.Text)
+    result = db.Column(db.Text)  # JSON
+
+
+# _______________ CHECK-IN MODELS _______________
+class CheckIn(db.Model, SerializerMixin):
+    """Arrival of one attendee at the venue; the earliest reported time wins"""
+    __tablename__ = 'check_ins'
+    attendee_id = db.Column(db.Integer, db.ForeignKey('attendees.id', ondelete='CASCADE'), primary_key=True)
+    checked_in_at = db.Column(db.DateTime, nullable=False)  # when the device saw the attendee
+    recorded_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # when the server got it
+    device_id = db.Column(db.String(64))
+    admin_id = db.Column(db.Integer, db.ForeignKey('admins.id', ondelete='SET NULL'))
+
+
+class SyncChange(db.Model, SerializerMixin):
+    """Change log behind the check-in delta sync, appended to by triggers in checkin.py
+
+    version only ever increases (AUTOINCREMENT never reuses ids), so a client can
+    ask for everything after the last version it has seen.
+    """
+    __tablename__ = 'sync_changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+    version = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # registration, attendee, check_in
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # upsert or delete
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.current_timestamp())
+
+
+# _______________ ARCHIVE MODELS _______________
+class ArchivedMeeting(db.Model, SerializerMixin):
+    """A meeting whose registrations were moved to the archive tables of one partition by archive.py"""
+    __tablename__ = 'archived_meetings'
+    meeting_id = db.Column(db.Integer, primary_key=True)  # no foreign key: the archive outlives a deleted meeting
+    partition = db.Column(db.String(20), nullable=False, index=True)  # suffix of the archive tables, e.g. "2024"
+    registrations = db.Column(db.Integer, nullable=False, default=0)
+    attendees = db.Column(db.Integer, nullable=False, default=0)
+    check_ins = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
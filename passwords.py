@@ -0,0 +1,82 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from flask import current_app
+
+
+def encode(password):
+    # bcrypt only reads 72 bytes; older releases truncated silently, newer ones raise
+    return password.encode('utf-8')[:72]
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the hashing queue is full or a hash did not finish in time"""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded thread pool so bursts queue here instead of pinning request workers"""
+
+    def __init__(self, rounds=12, workers=None, queue_limit=None, timeout=10.0):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 2
+        self.queue_limit = queue_limit if queue_limit is not None else self.workers * 4
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        # Running plus queued jobs; acquiring fails fast once the queue is full
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Password hashing queue is full")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout as e:
+            future.cancel()
+            raise PasswordHasherBusy("Password hashing timed out") from e
+
+    def hash(self, password):
+        return self._run(self._hash, password)
+
+    def verify(self, password_hash, password):
+        if not password_hash or password is None:
+            return False
+        return self._run(self._verify, password_hash, password)
+
+    def _hash(self, password):
+        import bcrypt as _bcrypt  # imported on first use to keep it out of worker startup
+        return _bcrypt.hashpw(encode(password), _bcrypt.gensalt(self.rounds)).decode('utf-8')
+
+    @staticmethod
+    def _verify(password_hash, password):
+        import bcrypt as _bcrypt
+        try:
+            return _bcrypt.checkpw(encode(password), password_hash.encode('utf-8'))
+        except ValueError:
+            return False
+
+
+def init_password_hasher(app):
+    app.config.setdefault('BCRYPT_LOG_ROUNDS', 12)
+    app.config.setdefault('PASSWORD_HASH_WORKERS', None)
+    app.config.setdefault('PASSWORD_HASH_QUEUE_LIMIT', None)
+    app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10.0)
+    app.extensions['password_hasher'] = PasswordHasher(
+        rounds=app.config['BCRYPT_LOG_ROUNDS'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_limit=app.config['PASSWORD_HASH_QUEUE_LIMIT'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
+
+
+def hash_password(password):
+    return current_app.extensions['password_hasher'].hash(password)
+
+
+def check_password(password_hash, password):
+    return current_app.extensions['password_hasher'].verify(password_hash, password)
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import update
+from config import db
+from models import Meeting
+from response_cache import invalidate
+from storage import asset_store
+
+logger = logging.getLogger('registration.posters')
+
+POSTER_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+READ_CHUNK = 64 * 1024
+
+
+class PosterError(ValueError):
+    """Raised for uploads that are too large or not a supported image"""
+
+
+def poster_key(digest, ext):
+    return f"posters/{digest}.{ext}"
+
+
+def thumbnail_key(digest, width):
+    return f"posters/{digest}-w{width}.webp"
+
+
+def split_poster_key(key):
+    """Return (digest, ext) for a key made by poster_key"""
+    name = key.rsplit('/', 1)[-1]
+    digest, _, ext = name.partition('.')
+    return digest, ext
+
+
+def asset_url(key):
+    return asset_store().url(key) or f"{current_app.config['ASSET_URL_PREFIX']}/{key}"
+
+
+def thumbnail_urls(poster_asset):
+    """{width: url} for a stored poster; widths are strings so the JSON keys are stable"""
+    digest, _ = split_poster_key(poster_asset)
+    return {str(width): asset_url(thumbnail_key(digest, width))
+            for width in current_app.config['POSTER_THUMBNAIL_WIDTHS']}
+
+
+def receive_upload(upload, max_bytes):
+    """Spool an uploaded file to disk while hashing it; returns (digest, ext, temp_path)
+
+    The caller owns temp_path and must remove it.
+    """
+    from PIL import Image
+
+    digest = hashlib.sha256()
+    size = 0
+    fd, temp_path = tempfile.mkstemp(prefix='poster-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = upload.stream.read(READ_CHUNK)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise PosterError(f"Poster must be at most {max_bytes // (1024 * 1024)} MB")
+                digest.update(chunk)
+                out.write(chunk)
+        try:
+            with Image.open(temp_path) as image:
+                image_format = image.format
+                image.verify()
+        except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+            raise PosterError("File is not a readable image") from e
+        if image_format not in POSTER_FORMATS:
+            raise PosterError(f"Unsupported image format: {image_format}")
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return digest.hexdigest()[:24], POSTER_FORMATS[image_format], temp_path
+
+
+def render_thumbnails(source_path, widths, quality):
+    """Write one WebP per width into a temp dir; returns (dir, {width: path})"""
+    from PIL import Image, ImageOps
+
+    out_dir = tempfile.mkdtemp(prefix='thumbs-')
+    paths = {}
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for width in widths:
+            thumb = image.copy()
+            # Fits the width, keeps the aspect ratio and never upscales
+            thumb.thumbnail((width, image.height))
+            path = os.path.join(out_dir, f"w{width}.webp")
+            thumb.save(path, 'WEBP', quality=quality, method=4)
+            paths[width] = path
+    return out_dir, paths
+
+
+def build_thumbnails(meeting_id, key, source_path):
+    """Render, store and publish the thumbnails for one poster"""
+    config = current_app.config
+    store = asset_store()
+    digest, _ = split_poster_key(key)
+    out_dir, paths = render_thumbnails(source_path, config['POSTER_THUMBNAIL_WIDTHS'], config['POSTER_WEBP_QUALITY'])
+    try:
+        for width, path in paths.items():
+            store.save(thumbnail_key(digest, width), path)
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+
+    # Only flag the meeting if its poster was not replaced in the meantime
+    db.session.execute(
+        update(Meeting)
+        .where(Meeting.id == meeting_id, Meeting.poster_asset == key)
+        .values(poster_thumbnails_ready=True),
+        execution_options={"synchronize_session": False}
+    )
+    invalidate("meetings", f"meeting:{meeting_id}")
+    db.session.commit()
+
+
+class Thumbnailer:
+    """Background pool that turns uploaded posters into WebP thumbnails"""
+
+    def __init__(self, app, workers=2):
+        self.app = app
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='thumbnails')
+
+    def submit(self, meeting_id, key, source_path):
+        """Queue a job; the worker deletes source_path when it is done"""
+        return self._executor.submit(self._run, meeting_id, key, source_path)
+
+    def _run(self, meeting_id, key, source_path):
+        try:
+            with self.app.app_context():
+                build_thumbnails(meeting_id, key, source_path)
+        except Exception:
+            logger.exception("Thumbnail generation failed for meeting %s (%s)", meeting_id, key)
+        finally:
+            if os.path.exists(source_path):
+                os.remove(source_path)
+
+
+def init_posters(app):
+    app.config.setdefault('ASSET_URL_PREFIX', '/api/assets')
+    app.config.setdefault('MAX_POSTER_BYTES', 10 * 1024 * 1024)
+    app.config.setdefault('POSTER_THUMBNAIL_WIDTHS', (320, 640))
+    app.config.setdefault('POSTER_WEBP_QUALITY', 80)
+    app.config.setdefault('POSTER_WORKERS', 2)
+    app.config.setdefault('ASSET_MAX_AGE', 365 * 24 * 3600)
+    app.extensions['thumbnailer'] = Thumbnailer(app, app.config['POSTER_WORKERS'])
+
+
+def store_poster(meeting, upload):
+    """Store an uploaded poster for a meeting and queue its thumbnails
+
+    Posters are content-addressed, so re-uploading the same image reuses the
+    stored file and every URL can be cached forever.
+    """
+    digest, ext, temp_path = receive_upload(upload, current_app.config['MAX_POSTER_BYTES'])
+    key = poster_key(digest, ext)
+    try:
+        asset_store().save(key, temp_path)
+        meeting.poster_asset = key
+        meeting.poster_url = asset_url(key)
+        meeting.poster_thumbnails_ready = False
+        invalidate("meetings", f"meeting:{meeting.id}")
+        db.session.commit()
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    current_app.extensions['thumbnailer'].submit(meeting.id, key, temp_path)
+    return key
+
+
+def regenerate_thumbnails():
+    """Build thumbnails for every poster still missing them; returns the count"""
+    store = asset_store()
+    pending = db.session.query(Meeting.id, Meeting.poster_asset).filter(
+        Meeting.poster_asset.isnot(None), Meeting.poster_thumbnails_ready.isnot(True)
+    ).all()
+    for meeting_id, key in pending:
+        fd, temp_path = tempfile.mkstemp(prefix='poster-')
+        try:
+            with os.fdopen(fd, 'wb') as out, store.open(key) as source:
+                shutil.copyfileobj(source, out)
+            build_thumbnails(meeting_id, key, temp_path)
+        finally:
+            os.remove(temp_path)
+    return len(pending)
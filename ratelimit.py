@@ -0,0 +1,75 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, jsonify, request
+
+
+class TokenBucketLimiter:
+    """In-process token buckets keyed by any string; the least recently used keys are dropped"""
+
+    def __init__(self, capacity, per_seconds, max_keys=100000):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key):
+        """Take one token; returns 0 when allowed, otherwise seconds until a token is available"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+def init_rate_limits(app):
+    """Create the limiters named in RATE_LIMITS: {name: (capacity, per_seconds)}"""
+    app.config.setdefault('RATE_LIMIT_ENABLED', True)
+    app.config.setdefault('RATE_LIMITS', {
+        'auth_ip': (20, 60),
+        'auth_email': (5, 60),
+    })
+    app.extensions['rate_limiters'] = {
+        name: TokenBucketLimiter(capacity, per_seconds)
+        for name, (capacity, per_seconds) in app.config['RATE_LIMITS'].items()
+    }
+
+
+def request_email():
+    data = request.get_json(silent=True)
+    # Any JSON value parses; bodies that are not objects get the per-IP bucket only
+    email = data.get('email') if isinstance(data, dict) else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+def rate_limited(f):
+    """Apply the per-IP and per-email auth buckets before the view runs"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if current_app.config['RATE_LIMIT_ENABLED']:
+            limiters = current_app.extensions['rate_limiters']
+            checks = [('auth_ip', f"{request.endpoint}:{request.remote_addr}")]
+            email = request_email()
+            if email:
+                checks.append(('auth_email', f"{request.endpoint}:{email}"))
+
+            for name, key in checks:
+                wait = limiters[name].consume(key)
+                if wait:
+                    response = jsonify({"error": "Too many attempts. Please try again later."})
+                    response.headers['Retry-After'] = str(math.ceil(wait))
+                    return response, 429
+        return f(*args, **kwargs)
+    return decorated_function
@@ -0,0 +1,250 @@
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import and_, bindparam, or_, select, update
+from checkin import dialect_insert
+from config import db
+from events import publish
+from models import PaymentCallback, Registration
+from rollups import RollupDelta, counted
+
+logger = logging.getLogger('registration.payments')
+
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_POLL_INTERVAL = 1.0
+CLAIM_TIMEOUT = timedelta(minutes=5)
+ENQUEUE_CHUNK = 1000
+
+
+def enqueue_callbacks(callbacks, source='webhook'):
+    """Append validated callbacks to the queue with one multi-row INSERT per chunk
+
+    A callback whose (invoice_number, reference) is already queued is a
+    redelivery and is dropped. Returns how many callbacks were queued.
+    """
+    now = datetime.utcnow()
+    rows = [{**callback, "source": source, "status": "pending", "received_at": now} for callback in callbacks]
+    queued = 0
+    for start in range(0, len(rows), ENQUEUE_CHUNK):
+        queued += len(db.session.execute(
+            dialect_insert()(PaymentCallback)
+            .on_conflict_do_nothing(index_elements=[PaymentCallback.invoice_number, PaymentCallback.reference])
+            .returning(PaymentCallback.id),
+            rows[start:start + ENQUEUE_CHUNK]
+        ).all())
+    db.session.commit()
+    return queued
+
+
+def claim_batch(batch_size):
+    """Mark up to batch_size pending callbacks as processing and return (claim_id, rows)
+
+    Rows left in 'processing' by a worker that died are reclaimed after
+    CLAIM_TIMEOUT under a new claim id.
+    """
+    now = datetime.utcnow()
+    claim_id = uuid.uuid4().hex
+    claimable = or_(
+        PaymentCallback.status == 'pending',
+        and_(PaymentCallback.status == 'processing', PaymentCallback.claimed_at < now - CLAIM_TIMEOUT),
+    )
+    candidates = (
+        select(PaymentCallback.id)
+        .where(claimable)
+        .order_by(PaymentCallback.id)
+        .limit(batch_size)
+        .scalar_subquery()
+    )
+    claimed = db.session.execute(
+        update(PaymentCallback)
+        # claimable again on the row itself, which PostgreSQL rechecks after waiting on a concurrent apply
+        .where(PaymentCallback.id.in_(candidates), claimable)
+        .values(status='processing', claimed_at=now, claim_id=claim_id)
+        .returning(PaymentCallback.id, PaymentCallback.invoice_number, PaymentCallback.amount),
+        execution_options={"synchronize_session": False}
+    ).all()
+    db.session.commit()
+    return claim_id, claimed
+
+
+def hold_claim(claim_id, claimed):
+    """Keep the callbacks this batch still holds, locking them until the caller commits
+
+    A batch that outlived CLAIM_TIMEOUT may have been reclaimed by another
+    worker; those rows now carry that worker's claim id and are left to it.
+    """
+    held = set(db.session.execute(
+        update(PaymentCallback)
+        .where(PaymentCallback.id.in_([c[0] for c in claimed]),
+               PaymentCallback.claim_id == claim_id, PaymentCallback.status == 'processing')
+        .values(claimed_at=datetime.utcnow())
+        .returning(PaymentCallback.id),
+        execution_options={"synchronize_session": False}
+    ).scalars())
+    if len(held) < len(claimed):
+        logger.warning("Skipping %d payment callbacks reclaimed by another worker", len(claimed) - len(held))
+    return [c for c in claimed if c[0] in held]
+
+
+def apply_batch(claim_id, claimed):
+    """Credit a claimed batch to its registrations and flip paid where the running total covers the amount
+
+    Only callbacks still held under claim_id are credited, in the same
+    transaction that locks them. Amounts are added to
+    Registration.amount_received with atomic increments, so partial payments
+    count together across batches and workers. A callback without an amount
+    pays the invoice in full. paid flips with one
+    UPDATE ... WHERE paid IS NOT true RETURNING, and only the rows it returns
+    reach the rollups and live events, so no payment is counted twice.
+    """
+    claimed = hold_claim(claim_id, claimed)
+
+    # Several callbacks for one invoice count together; None means paid in full
+    received = {}
+    for _, invoice, amount in claimed:
+        received[invoice] = None if amount is None or received.get(invoice, 0) is None \
+            else received.get(invoice, 0) + amount
+
+    registrations = Registration.__table__
+    credits = [{"invoice": invoice, "credit": total} for invoice, total in received.items() if total is not None]
+    if credits:
+        db.session.execute(
+            registrations.update()
+            .where(registrations.c.invoice_number == bindparam("invoice"))
+            .values(amount_received=registrations.c.amount_received + bindparam("credit")),
+            credits
+        )
+    paid_in_full = [invoice for invoice, total in received.items() if total is None]
+    flipped = db.session.execute(
+        registrations.update()
+        .where(registrations.c.invoice_number.in_(received), registrations.c.paid.isnot(True),
+               or_(registrations.c.invoice_number.in_(paid_in_full),
+                   registrations.c.amount_received + 1e-9 >= registrations.c.amount))
+        .values(paid=True)
+        .returning(registrations.c.id, registrations.c.invoice_number, registrations.c.meeting_id,
+                   registrations.c.station, registrations.c.district, registrations.c.church,
+                   registrations.c.amount, registrations.c.status)
+    ).all()
+
+    delta = RollupDelta()
+    for r in flipped:
+        if counted(r.status):
+            delta.add_payment(r.station, r.district, r.church, r.amount)
+        publish("payment.received", {"registration_id": r.id, "invoice_number": r.invoice_number,
+                                     "meeting_id": r.meeting_id, "amount": received[r.invoice_number], "paid": True})
+    delta.apply(db.session.connection())
+
+    # Read after the flip: whatever is still unpaid is short of its amount
+    unpaid = {
+        r.invoice_number: r for r in db.session.execute(
+            select(Registration.invoice_number, Registration.id, Registration.meeting_id, Registration.paid)
+            .where(Registration.invoice_number.in_(received))
+        )
+    }
+    underpaid = {invoice for invoice, r in unpaid.items() if not r.paid}
+    for invoice in underpaid:
+        r = unpaid[invoice]
+        publish("payment.received", {"registration_id": r.id, "invoice_number": invoice,
+                                     "meeting_id": r.meeting_id, "amount": received[invoice], "paid": False})
+
+    now = datetime.utcnow()
+    by_status = {"applied": [], "unmatched": [], "underpaid": []}
+    for callback_id, invoice, _ in claimed:
+        if invoice not in unpaid:
+            by_status["unmatched"].append(callback_id)
+        elif invoice in underpaid:
+            by_status["underpaid"].append(callback_id)
+        else:
+            by_status["applied"].append(callback_id)
+    for status, ids in by_status.items():
+        if ids:
+            db.session.execute(
+                update(PaymentCallback).where(PaymentCallback.id.in_(ids)).values(status=status, processed_at=now),
+                execution_options={"synchronize_session": False}
+            )
+    if flipped:
+        # Earlier partial payments that this batch completed
+        db.session.execute(
+            update(PaymentCallback)
+            .where(PaymentCallback.status == 'underpaid',
+                   PaymentCallback.invoice_number.in_([r.invoice_number for r in flipped]))
+            .values(status='applied'),
+            execution_options={"synchronize_session": False}
+        )
+    db.session.commit()
+    return {"claimed": len(claimed), "paid": len(flipped), **{s: len(ids) for s, ids in by_status.items()}}
+
+
+def process_batch(batch_size=DEFAULT_BATCH_SIZE):
+    claim_id, claimed = claim_batch(batch_size)
+    if not claimed:
+        return None
+    try:
+        return apply_batch(claim_id, claimed)
+    except Exception:
+        db.session.rollback()
+        # Hand the rows back so the next pass retries them, unless another worker holds them now
+        db.session.execute(
+            update(PaymentCallback)
+            .where(PaymentCallback.id.in_([c[0] for c in claimed]), PaymentCallback.claim_id == claim_id,
+                   PaymentCallback.status == 'processing')
+            .values(status='pending', claimed_at=None, claim_id=None),
+            execution_options={"synchronize_session": False}
+        )
+        db.session.commit()
+        raise
+
+
+class ReconciliationWorker(threading.Thread):
+    """Background thread that drains the payment queue in batches"""
+
+    def __init__(self, app, batch_size=DEFAULT_BATCH_SIZE, interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(name='payment-reconciliation', daemon=True)
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def run(self):
+        # Started from a request: give it the interpreter until the first poll or wakeup
+        self.wakeup.wait(self.interval)
+        while not self.stopping.is_set():
+            result = None
+            try:
+                with self.app.app_context():
+                    result = process_batch(self.batch_size)
+            except Exception:
+                logger.exception("Payment reconciliation batch failed")
+            if result is None:
+                self.wakeup.wait(self.interval)
+                self.wakeup.clear()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+
+
+def init_reconciliation(app):
+    """Start the worker on the first request, so CLI commands and migrations never spawn it"""
+    app.config.setdefault('PAYMENT_WORKER_ENABLED', True)
+    app.config.setdefault('PAYMENT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    app.config.setdefault('PAYMENT_POLL_INTERVAL', DEFAULT_POLL_INTERVAL)
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_reconciliation_worker():
+        if not app.config['PAYMENT_WORKER_ENABLED'] or 'payment_worker' in app.extensions:
+            return
+        with lock:
+            if 'payment_worker' not in app.extensions:
+                worker = ReconciliationWorker(app, app.config['PAYMENT_BATCH_SIZE'], app.config['PAYMENT_POLL_INTERVAL'])
+                app.extensions['payment_worker'] = worker
+                worker.start()
+
+
+def wake_worker(app):
+    worker = app.extensions.get('payment_worker')
+    if worker is not None:
+        worker.wakeup.set()
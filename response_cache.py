@@ -0,0 +1,366 @@
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, request
+from sqlalchemy import event
+from config import db, env_bool
+
+PENDING_TAGS = 'response_cache_tags'
+DEFAULT_FILE_MAX_ENTRIES = 10000
+DEFAULT_FILE_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_FILE_SWEEP_INTERVAL = 60
+
+# ``versions`` maps each tag to its version when the view started; a bump since then makes the entry stale
+CachedResponse = namedtuple('CachedResponse', 'body mimetype etag versions expires')
+
+
+class FileStore:
+    """Cache shared by the workers on one host, kept in a directory
+
+    Entries are written to a temporary file and renamed into place, so readers
+    never see half an entry. Tag versions are random tokens rather than counters,
+    so bumping one needs no lock across processes. Writes sweep the directory at
+    most once per ``sweep_interval`` seconds per worker, dropping expired entries
+    and then the oldest ones until it is within ``max_entries`` and ``max_bytes``.
+    """
+
+    def __init__(self, root, max_entries=DEFAULT_FILE_MAX_ENTRIES, max_bytes=DEFAULT_FILE_MAX_BYTES,
+                 sweep_interval=DEFAULT_FILE_SWEEP_INTERVAL):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self._last_sweep = float('-inf')
+        self._sweep_lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'tags'), exist_ok=True)
+
+    def _path(self, kind, name):
+        return os.path.join(self.root, kind, hashlib.sha1(name.encode()).hexdigest())
+
+    def _write(self, path, data):
+        fd, temp_path = tempfile.mkstemp(dir=self.root)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def get(self, key):
+        path = self._path('entries', key)
+        try:
+            with open(path, 'rb') as f:
+                header, body = f.read().split(b'\n', 1)
+        except (FileNotFoundError, ValueError):
+            return None
+        meta = json.loads(header)
+        if meta["expires"] <= time.time():
+            self._remove(path)
+            return None
+        return CachedResponse(body, meta["mimetype"], meta["etag"], meta["versions"], meta["expires"])
+
+    def set(self, key, entry):
+        header = json.dumps({"mimetype": entry.mimetype, "etag": entry.etag, "versions": entry.versions,
+                             "expires": entry.expires}).encode()
+        self._write(self._path('entries', key), header + b'\n' + entry.body)
+        self._maybe_sweep()
+
+    def versions(self, tags):
+        versions = {}
+        for tag in tags:
+            try:
+                with open(self._path('tags', tag)) as f:
+                    versions[tag] = f.read()
+            except FileNotFoundError:
+                versions[tag] = ''
+        return versions
+
+    def bump(self, tags):
+        for tag in tags:
+            self._write(self._path('tags', tag), os.urandom(8).hex().encode())
+
+    def sweep(self):
+        """Remove expired entries, then the oldest written until within the bounds; returns how many"""
+        now = time.time()
+        live, removed = [], 0
+        with os.scandir(os.path.join(self.root, 'entries')) as entries:
+            for file in entries:
+                try:
+                    with open(file.path, 'rb') as f:
+                        expires = json.loads(f.readline())["expires"]
+                    stat = file.stat()
+                except (FileNotFoundError, ValueError, KeyError):
+                    continue
+                if expires <= now:
+                    self._remove(file.path)
+                    removed += 1
+                else:
+                    live.append((stat.st_mtime, stat.st_size, file.path))
+
+        live.sort()
+        count, total = len(live), sum(size for _, size, _ in live)
+        for _, size, path in live:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            self._remove(path)
+            removed += 1
+            count -= 1
+            total -= size
+        return removed
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._sweep_lock:
+            if now - self._last_sweep < self.sweep_interval:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+    def clear(self):
+        shutil.rmtree(os.path.join(self.root, 'entries'), ignore_errors=True)
+        os.makedirs(os.path.join(self.root, 'entries'), exist_ok=True)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ResponseCache:
+    """In-process LRU of serialized responses with a TTL, in front of an optional shared store
+
+    Entries are tagged (e.g. "meetings", "meeting:5"). Invalidating a tag drops
+    this worker's entries for it and bumps the tag's version, which is how other
+    workers sharing the store notice on their next hit.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, shared=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._keys_by_tag = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._counters = dict.fromkeys(
+            ("hits", "shared_hits", "misses", "stores", "evictions", "expirations", "invalidations", "stale"), 0)
+
+    def versions(self, tags):
+        if self.shared is not None:
+            return self.shared.versions(tags)
+        with self._lock:
+            return {tag: self._versions.get(tag, 0) for tag in tags}
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= now:
+                self._remove(key)
+                self._counters["expirations"] += 1
+                entry = None
+            elif entry is not None:
+                self._entries.move_to_end(key)
+
+        # Local entries are evicted as soon as this worker invalidates, but only
+        # the shared versions say whether another worker has
+        if entry is not None and (self.shared is None or self.shared.versions(entry.versions) == entry.versions):
+            self._count("hits")
+            return entry
+        if entry is not None:
+            with self._lock:
+                self._remove(key)
+                self._counters["stale"] += 1
+
+        if self.shared is not None:
+            entry = self.shared.get(key)
+            if entry is not None and self.shared.versions(entry.versions) == entry.versions:
+                self._store_local(key, entry)
+                self._count("shared_hits")
+                return entry
+        self._count("misses")
+        return None
+
+    def put(self, key, entry):
+        """Store a response unless one of its tags was invalidated while it was being built"""
+        if self.shared is not None:
+            if self.shared.versions(entry.versions) != entry.versions:
+                return
+            self.shared.set(key, entry)
+            self._store_local(key, entry)
+            return
+        with self._lock:
+            if any(self._versions.get(tag, 0) != version for tag, version in entry.versions.items()):
+                return
+            self._store(key, entry)
+
+    def invalidate(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+                for key in list(self._keys_by_tag.get(tag, ())):
+                    self._remove(key)
+                    self._counters["invalidations"] += 1
+        if self.shared is not None:
+            self.shared.bump(tags)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_tag.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = sum(len(entry.body) for entry in self._entries.values())
+        lookups = stats["hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["shared_hits"]) / lookups, 4) if lookups else None
+        stats.update(maxsize=self.maxsize, ttl=self.ttl, shared=type(self.shared).__name__ if self.shared else None)
+        return stats
+
+    def _count(self, counter):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def _store_local(self, key, entry):
+        with self._lock:
+            self._store(key, entry)
+
+    def _store(self, key, entry):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = entry
+        for tag in entry.versions:
+            self._keys_by_tag.setdefault(tag, set()).add(key)
+        self._counters["stores"] += 1
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+            self._counters["evictions"] += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.versions:
+            keys = self._keys_by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_tag[tag]
+
+
+# --------------- Invalidation -----------------
+def invalidate(*tags):
+    """Evict responses tagged with any of ``tags`` once the current transaction commits
+
+    Evicting after the commit, not before, keeps a concurrent request from
+    caching the rows it read just before the write landed.
+    """
+    db.session.info.setdefault(PENDING_TAGS, set()).update(tags)
+
+
+def _after_commit(session):
+    tags = session.info.pop(PENDING_TAGS, None)
+    cache = current_app.extensions.get('response_cache') if tags else None
+    if cache is not None:
+        cache.invalidate(tags)
+
+
+def _after_rollback(session):
+    session.info.pop(PENDING_TAGS, None)
+
+
+# --------------- Decorator -----------------
+def request_key():
+    """Path plus the query string in a canonical order"""
+    return f"{request.path}?{urlencode(sorted(request.args.items(multi=True)))}"
+
+
+def serve(entry, status):
+    response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+    response.set_etag(entry.etag)
+    response.headers['X-Cache'] = status
+    return response.make_conditional(request)
+
+
+def cached(tags, ttl=None):
+    """Serve a GET view's 200 JSON responses from the response cache
+
+    ``tags`` is a list, or a function of the view arguments returning one. Keys
+    are the path and query string, so only wrap views whose output does not
+    depend on who is asking; put the decorator under the auth decorator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            cache = current_app.extensions.get('response_cache')
+            if cache is None or request.method != 'GET':
+                return f(*args, **kwargs)
+
+            key = request_key()
+            entry = cache.get(key)
+            if entry is not None:
+                return serve(entry, 'HIT')
+
+            # Versions are read before the view queries anything, see ResponseCache.put
+            versions = cache.versions(tags(**kwargs) if callable(tags) else tags)
+            response = current_app.make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed or not response.is_json:
+                return response
+            body = response.get_data()
+            entry = CachedResponse(body, response.mimetype, hashlib.sha1(body).hexdigest(), versions,
+                                   time.time() + (ttl or cache.ttl))
+            cache.put(key, entry)
+            return serve(entry, 'MISS')
+        return decorated_function
+    return decorator
+
+
+def load_shared_store(spec, app):
+    """Build the store named by RESPONSE_CACHE_SHARED: '', 'file' or 'package.module:Class'"""
+    if not spec:
+        return None
+    if spec == 'file':
+        return FileStore(app.config['RESPONSE_CACHE_DIR'], max_entries=app.config['RESPONSE_CACHE_DIR_MAX_ENTRIES'],
+                         max_bytes=app.config['RESPONSE_CACHE_DIR_MAX_BYTES'],
+                         sweep_interval=app.config['RESPONSE_CACHE_DIR_SWEEP_INTERVAL'])
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)(app)
+
+
+def init_response_cache(app):
+    app.config.setdefault('RESPONSE_CACHE_ENABLED', env_bool('RESPONSE_CACHE_ENABLED', True))
+    app.config.setdefault('RESPONSE_CACHE_SIZE', int(os.environ.get('RESPONSE_CACHE_SIZE', 1024)))
+    app.config.setdefault('RESPONSE_CACHE_TTL', int(os.environ.get('RESPONSE_CACHE_TTL', 60)))
+    app.config.setdefault('RESPONSE_CACHE_SHARED', os.environ.get('RESPONSE_CACHE_SHARED', ''))
+    app.config.setdefault('RESPONSE_CACHE_DIR', os.environ.get('RESPONSE_CACHE_DIR')
+                          or os.path.join(app.instance_path, 'response-cache'))
+    app.config.setdefault('RESPONSE_CACHE_DIR_MAX_ENTRIES', int(os.environ.get('RESPONSE_CACHE_DIR_MAX_ENTRIES',
+                                                                               DEFAULT_FILE_MAX_ENTRIES)))
+    app.config.setdefault('RESPONSE_CACHE_DIR_MAX_BYTES', int(os.environ.get('RESPONSE_CACHE_DIR_MAX_BYTES',
+                                                                             DEFAULT_FILE_MAX_BYTES)))
+    app.config.setdefault('RESPONSE_CACHE_DIR_SWEEP_INTERVAL', int(os.environ.get('RESPONSE_CACHE_DIR_SWEEP_INTERVAL',
+                                                                                  DEFAULT_FILE_SWEEP_INTERVAL)))
+    # Registered even when disabled, so tags queued by invalidate() are always cleared
+    if not event.contains(db.session, 'after_commit', _after_commit):
+        event.listen(db.session, 'after_commit', _after_commit)
+        event.listen(db.session, 'after_rollback', _after_rollback)
+    if not app.config['RESPONSE_CACHE_ENABLED']:
+        return
+
+    app.extensions['response_cache'] = ResponseCache(
+        maxsize=app.config['RESPONSE_CACHE_SIZE'],
+        ttl=app.config['RESPONSE_CACHE_TTL'],
+        shared=load_shared_store(app.config['RESPONSE_CACHE_SHARED'], app),
+    )
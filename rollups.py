@@ -0,0 +1,261 @@
+from collections import defaultdict
+from sqlalchemy import case, event, func, inspect, insert, select, delete
+from sqlalchemy.orm import Session
+from archive import registration_tables
+from config import db
+from models import Registration, Attendee, RegistrationRollup, AttendeeAgeRollup
+
+# Only confirmed registrations count; waitlisted and cancelled ones are left out
+COUNTED_STATUS = 'confirmed'
+
+# (label, lowest age, highest age); None means open-ended
+AGE_BANDS = (
+    ("0-12", 0, 12),
+    ("13-17", 13, 17),
+    ("18-35", 18, 35),
+    ("36-59", 36, 59),
+    ("60+", 60, None),
+)
+
+
+def age_band(age):
+    for label, low, high in AGE_BANDS:
+        if age >= low and (high is None or age <= high):
+            return label
+    return AGE_BANDS[0][0]
+
+
+def age_band_expression(column):
+    """SQL CASE mirroring age_band(), used by the rebuild"""
+    return case(
+        *((column <= high, label) for label, _, high in AGE_BANDS if high is not None),
+        else_=AGE_BANDS[-1][0]
+    )
+
+
+class RollupDelta:
+    """Accumulates rollup increments so each key is written once per flush"""
+
+    def __init__(self):
+        self.registrations = defaultdict(lambda: [0, 0, 0.0, 0.0])
+        self.age_bands = defaultdict(int)
+
+    def add_registration(self, station, district, church, amount, paid, sign=1):
+        totals = self.registrations[(station, district, church)]
+        totals[0] += sign
+        totals[2] += sign * (amount or 0.0)
+        if paid:
+            totals[3] += sign * (amount or 0.0)
+
+    def add_payment(self, station, district, church, amount, sign=1):
+        self.registrations[(station, district, church)][3] += sign * (amount or 0.0)
+
+    def add_invoiced(self, station, district, church, amount):
+        self.registrations[(station, district, church)][2] += amount or 0.0
+
+    def add_attendee(self, station, district, church, age, sign=1):
+        self.registrations[(station, district, church)][1] += sign
+        self.age_bands[(station, district, church, age_band(age))] += sign
+
+    def apply(self, connection):
+        """Upsert the accumulated increments on the given connection"""
+        for (station, district, church), (registrations, attendees, invoiced, paid) in self.registrations.items():
+            if not (registrations or attendees or invoiced or paid):
+                continue
+            upsert_increment(connection, RegistrationRollup.__table__,
+                             {"station": station, "district": district, "church": church},
+                             {"registrations": registrations, "attendees": attendees,
+                              "amount_invoiced": invoiced, "amount_paid": paid})
+        for (station, district, church, band), attendees in self.age_bands.items():
+            if not attendees:
+                continue
+            upsert_increment(connection, AttendeeAgeRollup.__table__,
+                             {"station": station, "district": district, "church": church, "age_band": band},
+                             {"attendees": attendees})
+        self.registrations.clear()
+        self.age_bands.clear()
+
+
+def upsert_increment(connection, table, key, increments):
+    """INSERT the key with the increments, or add them to the existing row"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        dialect_insert = None
+
+    if dialect_insert is not None:
+        stmt = dialect_insert(table).values(**key, **increments)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={name: table.c[name] + stmt.excluded[name] for name in increments}
+        )
+        connection.execute(stmt)
+        return
+
+    where = [table.c[name] == value for name, value in key.items()]
+    updated = connection.execute(
+        table.update().where(*where).values({name: table.c[name] + value for name, value in increments.items()})
+    )
+    if updated.rowcount == 0:
+        connection.execute(table.insert().values(**key, **increments))
+
+
+def counted(status):
+    # Registrations flushed before their column default is applied are confirmed
+    return (status or COUNTED_STATUS) == COUNTED_STATUS
+
+
+def record_bulk_registrations(connection, rows):
+    """Apply rollups for registrations written with Core inserts, which skip ORM events
+
+    ``rows`` is an iterable of (registration_row, attendee_rows) dicts as inserted.
+    """
+    delta = RollupDelta()
+    for row, attendees in rows:
+        if not counted(row.get("status")):
+            continue
+        location = (row["station"], row["district"], row["church"])
+        delta.add_registration(*location, row["amount"], row.get("paid", False))
+        for attendee in attendees:
+            delta.add_attendee(*location, attendee["age"])
+    delta.apply(connection)
+
+
+def record_status_change(registration_ids, sign):
+    """Add (sign=1) or remove (sign=-1) registrations confirmed or cancelled with Core UPDATEs
+
+    Runs in the caller's transaction, with one SELECT for the registrations and
+    one for their attendees.
+    """
+    if not registration_ids:
+        return
+    delta = RollupDelta()
+    location = (Registration.station, Registration.district, Registration.church)
+    for station, district, church, amount, paid in db.session.execute(
+        select(*location, Registration.amount, Registration.paid).where(Registration.id.in_(registration_ids))
+    ):
+        delta.add_registration(station, district, church, amount, paid, sign=sign)
+    for station, district, church, age in db.session.execute(
+        select(*location, Attendee.age)
+        .join(Registration, Attendee.registration_id == Registration.id)
+        .where(Registration.id.in_(registration_ids))
+    ):
+        delta.add_attendee(station, district, church, age, sign=sign)
+    delta.apply(db.session.connection())
+
+
+def rebuild_rollups():
+    """Recompute both rollup tables from scratch with GROUP BY inserts, archived meetings included
+
+    Like the incremental updates, only confirmed registrations are counted.
+    """
+    db.session.execute(delete(RegistrationRollup))
+    db.session.execute(delete(AttendeeAgeRollup))
+
+    registrations, attendees = registration_tables()
+    attendee_counts = (
+        select(attendees.c.registration_id, func.count(attendees.c.id).label("attendees"))
+        .group_by(attendees.c.registration_id)
+        .subquery()
+    )
+    location = (registrations.c.station, registrations.c.district, registrations.c.church)
+    db.session.execute(insert(RegistrationRollup).from_select(
+        ["station", "district", "church", "registrations", "attendees", "amount_invoiced", "amount_paid"],
+        select(
+            *location,
+            func.count(registrations.c.id),
+            func.coalesce(func.sum(attendee_counts.c.attendees), 0),
+            func.coalesce(func.sum(registrations.c.amount), 0.0),
+            func.coalesce(func.sum(case((registrations.c.paid.is_(True), registrations.c.amount), else_=0.0)), 0.0),
+        )
+        .outerjoin(attendee_counts, attendee_counts.c.registration_id == registrations.c.id)
+        .where(registrations.c.status == COUNTED_STATUS)
+        .group_by(*location)
+    ))
+
+    band = age_band_expression(attendees.c.age)
+    db.session.execute(insert(AttendeeAgeRollup).from_select(
+        ["station", "district", "church", "age_band", "attendees"],
+        select(*location, band, func.count(attendees.c.id))
+        .join(registrations, attendees.c.registration_id == registrations.c.id)
+        .where(registrations.c.status == COUNTED_STATUS)
+        .group_by(*location, band)
+    ))
+    db.session.commit()
+
+
+# --------------- ORM hooks -----------------
+@event.listens_for(Session, 'after_flush')
+def update_rollups_after_flush(session, flush_context):
+    """Keep the rollups in step with Registration/Attendee changes made through the ORM
+
+    A registration whose status changes to or from confirmed is added or
+    removed whole, attendees included.
+    """
+    delta = RollupDelta()
+
+    def add_whole(registration, sign, amount=None, paid=None):
+        location = (registration.station, registration.district, registration.church)
+        delta.add_registration(*location, registration.amount if amount is None else amount,
+                               registration.paid if paid is None else paid, sign=sign)
+        for attendee in registration.attendees:
+            if attendee not in session.new:
+                delta.add_attendee(*location, attendee.age, sign=sign)
+
+    for obj in session.new:
+        if isinstance(obj, Registration):
+            if counted(obj.status):
+                delta.add_registration(obj.station, obj.district, obj.church, obj.amount, obj.paid)
+        elif isinstance(obj, Attendee) and obj.registration is not None and counted(obj.registration.status):
+            r = obj.registration
+            delta.add_attendee(r.station, r.district, r.church, obj.age)
+
+    for obj in session.deleted:
+        if isinstance(obj, Registration):
+            state = inspect(obj)
+            status = state.attrs.status.history.non_added()
+            if not counted(status[0] if status else obj.status):
+                continue
+            paid = state.attrs.paid.history.non_added()
+            amount = state.attrs.amount.history.non_added()
+            delta.add_registration(obj.station, obj.district, obj.church,
+                                   amount[0] if amount else obj.amount,
+                                   paid[0] if paid else obj.paid, sign=-1)
+        elif isinstance(obj, Attendee) and obj.registration is not None and counted(obj.registration.status):
+            r = obj.registration
+            delta.add_attendee(r.station, r.district, r.church, obj.age, sign=-1)
+
+    for obj in session.dirty:
+        if isinstance(obj, Registration):
+            state = inspect(obj)
+            status_history = state.attrs.status.history
+            paid_history = state.attrs.paid.history
+            amount_history = state.attrs.amount.history
+            old_paid = bool(paid_history.deleted[0]) if paid_history.deleted else bool(obj.paid)
+            old_amount = amount_history.deleted[0] if amount_history.deleted else obj.amount
+            was_counted = counted(status_history.deleted[0]) if status_history.deleted else counted(obj.status)
+            if was_counted != counted(obj.status):
+                if was_counted:
+                    add_whole(obj, -1, old_amount, old_paid)
+                else:
+                    add_whole(obj, 1)
+                continue
+            if not was_counted or not (paid_history.has_changes() or amount_history.has_changes()):
+                continue
+            location = (obj.station, obj.district, obj.church)
+            delta.add_invoiced(*location, obj.amount - old_amount)
+            if old_paid:
+                delta.add_payment(*location, old_amount, sign=-1)
+            if obj.paid:
+                delta.add_payment(*location, obj.amount)
+        elif isinstance(obj, Attendee) and obj.registration is not None and counted(obj.registration.status):
+            age_history = inspect(obj).attrs.age.history
+            if age_history.has_changes() and age_history.deleted:
+                r = obj.registration
+                delta.add_attendee(r.station, r.district, r.church, age_history.deleted[0], sign=-1)
+                delta.add_attendee(r.station, r.district, r.church, obj.age)
+
+    delta.apply(session.connection())
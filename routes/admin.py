@@ -0,0 +1,419 @@
+import csv
+import io
+import os
+import tempfile
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
+from sqlalchemy import and_, or_, select, func
+from archive import registration_tables
+from config import db
+from async_bridge import bridge_loop, stream_async
+from async_db import async_engine, async_session
+from events import async_stream, stream
+from location_import import DEFAULT_MAX_ROWS, DEFAULT_REPORT_LIMIT, LocationImportTooLarge, import_locations
+from models import Station, District, Church, Registration, Attendee, RegistrationRollup, AttendeeAgeRollup
+from rollups import rebuild_rollups
+from search import DEFAULT_LIMIT, MAX_LIMIT, rebuild_search_index, search_attendees
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from routes.admin_auth import current_admin_id, issue_stream_ticket, login_required, redeem_stream_ticket
+from routes.locations import invalidate_location_tree
+
+admin_bp = Blueprint('admin', __name__)
+
+EXPORT_COLUMNS = (
+    ("registration_id", Registration.id),
+    ("invoice_number", Registration.invoice_number),
+    ("timestamp", Registration.timestamp),
+    ("station", Registration.station),
+    ("district", Registration.district),
+    ("church", Registration.church),
+    ("church_id", Registration.church_id),
+    ("leader_name", Registration.leader_name),
+    ("leader_phone", Registration.leader_phone),
+    ("amount", Registration.amount),
+    ("paid", Registration.paid),
+    ("meeting_id", Registration.meeting_id),
+    ("status", Registration.status),
+    ("attendee_id", Attendee.id),
+    ("attendee_name", Attendee.name),
+    ("attendee_age", Attendee.age),
+)
+EXPORT_YIELD_PER = 1000
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+# --------------- Helpers -----------------
+def church_ids_where(*criteria):
+    """Subquery of church ids under the matching stations/districts/churches"""
+    return (
+        select(Church.id)
+        .join(District, Church.district_id == District.id)
+        .join(Station, District.station_id == Station.id)
+        .where(*criteria)
+    )
+
+
+def export_query(args):
+    """Registrations left-joined to attendees, filtered from the query string
+
+    Archived meetings are included through the archive-aware tables. Location
+    filters go through the indexed church_id; rows the backfill could not link
+    to a church still match on their stored names.
+    """
+    meeting_id = args.get('meeting_id', type=int)
+    registrations, attendees = registration_tables(meeting_id)
+
+    def column(model_column):
+        return (registrations if model_column.table is Registration.__table__ else attendees).c[model_column.key]
+
+    stmt = (
+        select(*(column(model_column).label(name) for name, model_column in EXPORT_COLUMNS))
+        .select_from(registrations)
+        .outerjoin(attendees, attendees.c.registration_id == registrations.c.id)
+        .order_by(registrations.c.id, attendees.c.id)
+    )
+    if meeting_id is not None:
+        stmt = stmt.where(registrations.c.meeting_id == meeting_id)
+    if args.get('status'):
+        stmt = stmt.where(registrations.c.status == args['status'])
+    church_id = args.get('church_id', type=int)
+    if church_id is not None:
+        stmt = stmt.where(registrations.c.church_id == church_id)
+    for field, location_column in (("district_id", District.id), ("station_id", Station.id)):
+        value = args.get(field, type=int)
+        if value is not None:
+            stmt = stmt.where(registrations.c.church_id.in_(church_ids_where(location_column == value)))
+    for field, model in (("station", Station), ("district", District), ("church", Church)):
+        if args.get(field):
+            stmt = stmt.where(or_(
+                registrations.c.church_id.in_(church_ids_where(model.name == args[field])),
+                and_(registrations.c.church_id.is_(None), registrations.c[field] == args[field]),
+            ))
+    if args.get('paid') is not None:
+        stmt = stmt.where(registrations.c.paid == (args['paid'].lower() in ('1', 'true', 'yes')))
+    return stmt
+
+
+def iter_export_rows(stmt):
+    """Stream rows through a server-side cursor, EXPORT_YIELD_PER at a time"""
+    result = db.session.execute(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+    try:
+        for row in result:
+            yield row
+    finally:
+        result.close()
+
+
+def generate_csv(stmt):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in EXPORT_COLUMNS)
+    for row in iter_export_rows(stmt):
+        writer.writerow(row)
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def generate_csv_async(app, stmt):
+    """generate_csv() through the async engine, for the ASGI bridge: the event loop waits on the database"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in EXPORT_COLUMNS)
+    async with async_session(app) as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_YIELD_PER))
+        try:
+            async for row in result:
+                writer.writerow(row)
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+        finally:
+            await result.close()
+    yield buffer.getvalue().encode()
+
+
+def generate_xlsx(stmt):
+    """Write the sheet in constant-memory mode to a temp file, then stream it in chunks"""
+    import xlsxwriter
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    try:
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd hh:mm:ss'})
+        sheet = workbook.add_worksheet('Registrations')
+        sheet.write_row(0, 0, [name for name, _ in EXPORT_COLUMNS])
+        for row_number, row in enumerate(iter_export_rows(stmt), start=1):
+            sheet.write_row(row_number, 0, row)
+        workbook.close()
+
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(EXPORT_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+# -------------------------------
+# EXPORTS
+# -------------------------------
+
+# ✅ EXPORT registrations with their attendees as CSV or XLSX
+@admin_bp.route('/exports/registrations', methods=['GET'])
+@login_required
+def export_registrations():
+    export_format = request.args.get('format', 'csv').lower()
+    stmt = export_query(request.args)
+
+    if export_format == 'csv' and bridge_loop() is not None and async_engine(current_app) is not None:
+        body = stream_async(generate_csv_async(current_app._get_current_object(), stmt))
+        mimetype = 'text/csv'
+    elif export_format == 'csv':
+        body, mimetype = stream_with_context(generate_csv(stmt)), 'text/csv'
+    elif export_format == 'xlsx':
+        try:
+            import xlsxwriter  # noqa: F401
+        except ImportError:
+            return jsonify({"error": "XLSX export requires the xlsxwriter package"}), 501
+        body = stream_with_context(generate_xlsx(stmt))
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        return jsonify({"error": "format must be csv or xlsx"}), 400
+
+    return Response(
+        body,
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename=registrations.{export_format}"}
+    )
+
+
+# -------------------------------
+# LIVE EVENTS
+# -------------------------------
+
+# ✅ CREATE a single-use ticket for opening the event stream
+@admin_bp.route('/events/ticket', methods=['POST'])
+@login_required
+def create_event_ticket():
+    ticket, ttl = issue_stream_ticket(current_admin_id(), get_jwt().get('ver'))
+    return jsonify({"ticket": ticket, "expires_in": ttl}), 201
+
+
+# ✅ STREAM registration and payment events as they are committed (server-sent events)
+@admin_bp.route('/events', methods=['GET'])
+def stream_events():
+    # EventSource cannot set headers, so browsers open the stream with ?ticket= from POST /events/ticket
+    # instead of putting the access token in the URL, where access and proxy logs would keep it.
+    # A ticket opens one connection; fetch a new one to reconnect.
+    ticket = request.args.get('ticket')
+    if ticket is None:
+        verify_jwt_in_request()
+    elif redeem_stream_ticket(ticket) is None:
+        return jsonify({"error": "Invalid or expired stream ticket"}), 401
+    broker = current_app.extensions['events']
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+
+    # Under the ASGI bridge the stream waits on the event loop instead of a thread
+    loop = bridge_loop()
+    subscriber = broker.subscribe(request.args.get('meeting_id', type=int), last_event_id, loop=loop)
+    if subscriber is None:
+        response = jsonify({"error": "Too many live dashboards are connected. Please try again shortly."})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    heartbeat = current_app.config['EVENT_STREAM_HEARTBEAT']
+    body = stream(subscriber, heartbeat) if loop is None else stream_async(async_stream(subscriber, heartbeat))
+    response = Response(body, mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(lambda: broker.unsubscribe(subscriber))
+    return response
+
+
+# ✅ READ live event subscriber and publish counters for this worker
+@admin_bp.route('/events/stats', methods=['GET'])
+@login_required
+def get_event_stats():
+    return jsonify(current_app.extensions['events'].stats()), 200
+
+
+# -------------------------------
+# LOCATION IMPORT
+# -------------------------------
+
+# ✅ IMPORT stations, districts and churches from a station,district,church CSV
+@admin_bp.route('/locations/import', methods=['POST'])
+@login_required
+def import_locations_route():
+    upload = request.files.get('file')
+    stream = upload.stream if upload is not None else request.stream
+    lines = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    dry_run = request.args.get('dry_run', '').lower() in ('1', 'true', 'yes')
+    report_limit = request.args.get('report_limit', DEFAULT_REPORT_LIMIT, type=int)
+
+    try:
+        report = import_locations(lines, dry_run=dry_run, report_limit=max(report_limit, 0),
+                                  max_rows=current_app.config.get('LOCATION_IMPORT_MAX_ROWS', DEFAULT_MAX_ROWS))
+    except LocationImportTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    except (csv.Error, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Could not read the CSV: {e}"}), 400
+    finally:
+        lines.detach()
+
+    if not dry_run:
+        invalidate_location_tree()
+    return jsonify(report), 200
+
+
+# -------------------------------
+# ATTENDEE SEARCH
+# -------------------------------
+
+# ✅ SEARCH attendees by name, leader, phone, invoice number or church
+@admin_bp.route('/search/attendees', methods=['GET'])
+@login_required
+def search_attendees_route():
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "q is required"}), 400
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    results, mode = search_attendees(query, min(limit, MAX_LIMIT))
+    return jsonify({"results": results, "match": mode}), 200
+
+
+# -------------------------------
+# DASHBOARD STATS
+# -------------------------------
+
+# ✅ READ registration totals from the precomputed rollups
+@admin_bp.route('/stats', methods=['GET'])
+@login_required
+def get_stats():
+    group_by = request.args.get('by', 'station')
+    if group_by not in ('station', 'district', 'church', 'age_band'):
+        return jsonify({"error": "by must be station, district, church or age_band"}), 400
+
+    filters = {f: request.args[f] for f in ('station', 'district', 'church') if request.args.get(f)}
+
+    totals_query = db.session.query(
+        func.coalesce(func.sum(RegistrationRollup.registrations), 0),
+        func.coalesce(func.sum(RegistrationRollup.attendees), 0),
+        func.coalesce(func.sum(RegistrationRollup.amount_invoiced), 0.0),
+        func.coalesce(func.sum(RegistrationRollup.amount_paid), 0.0),
+    ).filter(*(getattr(RegistrationRollup, f) == v for f, v in filters.items()))
+    registrations, attendees, invoiced, paid = totals_query.one()
+
+    if group_by == 'age_band':
+        rows = (
+            db.session.query(AttendeeAgeRollup.age_band, func.sum(AttendeeAgeRollup.attendees))
+            .filter(*(getattr(AttendeeAgeRollup, f) == v for f, v in filters.items()))
+            .group_by(AttendeeAgeRollup.age_band)
+            .order_by(AttendeeAgeRollup.age_band)
+            .all()
+        )
+        breakdown = [{"age_band": band, "attendees": count} for band, count in rows]
+    else:
+        key = getattr(RegistrationRollup, group_by)
+        rows = (
+            db.session.query(
+                key,
+                func.sum(RegistrationRollup.registrations),
+                func.sum(RegistrationRollup.attendees),
+                func.sum(RegistrationRollup.amount_invoiced),
+                func.sum(RegistrationRollup.amount_paid),
+            )
+            .filter(*(getattr(RegistrationRollup, f) == v for f, v in filters.items()))
+            .group_by(key)
+            .order_by(key)
+            .all()
+        )
+        breakdown = [{
+            group_by: name,
+            "registrations": r,
+            "attendees": a,
+            "amount_invoiced": i,
+            "amount_paid": p
+        } for name, r, a, i, p in rows]
+
+    return jsonify({
+        "totals": {
+            "registrations": registrations,
+            "attendees": attendees,
+            "amount_invoiced": invoiced,
+            "amount_paid": paid
+        },
+        "by": group_by,
+        "breakdown": breakdown
+    }), 200
+
+
+# -------------------------------
+# PERFORMANCE STATS
+# -------------------------------
+
+# ✅ READ per-route request time and SQL query stats for this worker
+@admin_bp.route('/perf', methods=['GET'])
+@login_required
+def get_perf_stats():
+    routes = current_app.extensions['route_stats'].snapshot()
+    sort_key = request.args.get('sort', 'avg_queries')
+    if sort_key not in ('avg_queries', 'avg_ms', 'avg_db_ms', 'max_ms', 'requests'):
+        return jsonify({"error": "Unknown sort key"}), 400
+    ordered = sorted(routes.items(), key=lambda item: item[1][sort_key], reverse=True)
+    return jsonify([{"route": route, **stats} for route, stats in ordered]), 200
+
+
+# ✅ RESET the per-route stats
+@admin_bp.route('/perf', methods=['DELETE'])
+@login_required
+def reset_perf_stats():
+    current_app.extensions['route_stats'].reset()
+    return jsonify({"message": "Performance stats reset"}), 200
+
+
+# ✅ READ response cache hit, miss and eviction counters for this worker
+@admin_bp.route('/cache', methods=['GET'])
+@login_required
+def get_cache_stats():
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **cache.stats()}), 200
+
+
+# ✅ CLEAR the response cache (and the shared store, if any)
+@admin_bp.route('/cache', methods=['DELETE'])
+@login_required
+def clear_cache():
+    cache = current_app.extensions.get('response_cache')
+    if cache is not None:
+        cache.clear()
+    return jsonify({"message": "Response cache cleared"}), 200
+
+
+# -------------------------------
+# CLI COMMANDS
+# -------------------------------
+
+@admin_bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute the dashboard rollup tables from registrations and attendees."""
+    rebuild_rollups()
+    print("Registration rollups rebuilt.")
+
+
+@admin_bp.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the attendee search index from the attendee and registration tables."""
+    rebuild_search_index()
+    print("Attendee search index rebuilt.")
@@ -1,24 +1,158 @@
-from flask import Blueprint, request, jsonify, session
-from config import db, app
-from models import Admin
-from flask_bcrypt import Bcrypt
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import delete
+from config import db, jwt
+from models import Admin, StreamTicket
+from passwords import PasswordHasherBusy, hash_password, check_password
+from ratelimit import rate_limited
+from serialization import serialize_admin
+from flask_jwt_extended import (
+    create_access_token, create_refresh_token, get_jwt, get_jwt_identity, jwt_required, verify_jwt_in_request
+)
 from functools import wraps
 from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from jobs import enqueue
 
-bcrypt = Bcrypt(app)
 admin_auth_bp = Blueprint('admin_auth', __name__)
 
-# Serializer for password reset tokens
-serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+AdminState = namedtuple('AdminState', 'role is_active token_version')
+DEFAULT_STREAM_TICKET_TTL = 30
+
+
+class AdminStateCache:
+    """Small TTL/LRU cache of the admin fields authorization depends on"""
+
+    def __init__(self, maxsize=1024, ttl=30):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, admin_id):
+        """Cached state for an admin, loading it on a miss; None if the admin is gone"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(admin_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(admin_id)
+                return entry[1]
+
+        row = db.session.query(Admin.role, Admin.is_active, Admin.token_version).filter_by(id=admin_id).first()
+        state = AdminState(row.role, bool(row.is_active), row.token_version) if row else None
+
+        with self._lock:
+            self._entries[admin_id] = (now + self.ttl, state)
+            self._entries.move_to_end(admin_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return state
+
+    def invalidate(self, admin_id):
+        with self._lock:
+            self._entries.pop(admin_id, None)
+
+
+@admin_auth_bp.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    response = jsonify({"error": "Server is busy. Please try again shortly."})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+
+@admin_auth_bp.record_once
+def setup_admin_cache(state):
+    state.app.extensions['admin_state_cache'] = AdminStateCache(
+        maxsize=state.app.config.get('ADMIN_CACHE_SIZE', 1024),
+        ttl=state.app.config.get('ADMIN_CACHE_TTL', 30)
+    )
 
 
 # --------------- Helpers -----------------
+def get_serializer():
+    """Serializer for password reset tokens, keyed on the running app's secret"""
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
+
+
+def admin_cache():
+    return current_app.extensions['admin_state_cache']
+
+
+def issue_tokens(admin):
+    """Access and refresh tokens carrying the claims role checks need"""
+    claims = {"role": admin.role, "is_active": bool(admin.is_active), "ver": admin.token_version}
+    identity = str(admin.id)
+    return {
+        "access_token": create_access_token(identity=identity, additional_claims=claims),
+        "refresh_token": create_refresh_token(identity=identity, additional_claims=claims),
+    }
+
+
+def current_admin_id():
+    return int(get_jwt_identity())
+
+
+def hash_ticket(ticket):
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+
+def issue_stream_ticket(admin_id, token_version):
+    """Store a single-use event stream ticket for the admin; returns (ticket, seconds it is valid)"""
+    ttl = current_app.config.get('STREAM_TICKET_TTL', DEFAULT_STREAM_TICKET_TTL)
+    ticket = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    # Tickets that were never redeemed go with the next issue
+    db.session.execute(delete(StreamTicket).where(StreamTicket.expires_at < now))
+    db.session.add(StreamTicket(ticket_hash=hash_ticket(ticket), admin_id=admin_id, token_version=token_version,
+                                expires_at=now + timedelta(seconds=ttl)))
+    db.session.commit()
+    return ticket, ttl
+
+
+def redeem_stream_ticket(ticket):
+    """Consume a ticket and return its admin id; None if it is unknown, used, expired or its admin was revoked"""
+    row = db.session.execute(
+        delete(StreamTicket)
+        .where(StreamTicket.ticket_hash == hash_ticket(ticket), StreamTicket.expires_at >= datetime.utcnow())
+        .returning(StreamTicket.admin_id, StreamTicket.token_version)
+    ).first()
+    state = admin_cache().get(row.admin_id) if row else None
+    db.session.commit()
+    if state is None or not state.is_active or state.token_version != row.token_version:
+        return None
+    return row.admin_id
+
+
+@jwt.token_in_blocklist_loader
+def is_token_revoked(jwt_header, jwt_payload):
+    """Reject tokens of deleted or deactivated admins and tokens issued before a password change"""
+    try:
+        admin_id = int(jwt_payload["sub"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    state = admin_cache().get(admin_id)
+    return state is None or not state.is_active or state.token_version != jwt_payload.get("ver")
+
+
+@jwt.revoked_token_loader
+def revoked_token_response(jwt_header, jwt_payload):
+    return jsonify({"error": "Session expired. Please log in again."}), 401
+
+
+@jwt.unauthorized_loader
+def missing_token_response(reason):
+    return jsonify({"error": "Unauthorized. Please log in."}), 401
+
+
 def login_required(f):
     """Restrict access to logged-in admins"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'admin_id' not in session:
-            return jsonify({"error": "Unauthorized. Please log in."}), 401
+        verify_jwt_in_request()
         return f(*args, **kwargs)
     return decorated_function
 
@@ -27,13 +161,11 @@ def super_admin_required(f):
     """Restrict access to super admin only"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        admin_id = session.get('admin_id')
-
-        if not admin_id:
-            return jsonify({"error": "Unauthorized. Please log in."}), 401
+        verify_jwt_in_request()
 
-        admin = Admin.query.get(admin_id)
-        if not admin or not admin.is_super_admin:
+        # The blocklist check has already loaded this admin's cached state
+        state = admin_cache().get(current_admin_id())
+        if not state or state.role != 'super_admin':
             return jsonify({"error": "Forbidden. Super admin access only."}), 403
         return f(*args, **kwargs)
     return decorated_function
@@ -43,23 +175,36 @@ def super_admin_required(f):
 
 # Admin Login
 @admin_auth_bp.route('/admin/login', methods=['POST'])
+@rate_limited
 def admin_login():
     data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     email = data.get('email')
     password = data.get('password')
 
     admin = Admin.query.filter_by(email=email).first()
-    if not admin or not bcrypt.check_password_hash(admin.password_hash, password):
+    if not admin or not check_password(admin.password_hash, password):
         return jsonify({"error": "Invalid email or password"}), 401
 
     if not admin.is_active:
         return jsonify({"error": "Account is deactivated. Contact your super admin."}), 403
 
-    session['admin_id'] = admin.id
-    session['is_super_admin'] = admin.is_super_admin
     return jsonify({
         "message": "Login successful",
-        "admin": admin.serialize()
+        "admin": serialize_admin(admin),
+        **issue_tokens(admin)
+    }), 200
+
+
+# Refresh Access Token
+@admin_auth_bp.route('/admin/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh_token():
+    state = admin_cache().get(current_admin_id())
+    claims = {"role": state.role, "is_active": state.is_active, "ver": state.token_version}
+    return jsonify({
+        "access_token": create_access_token(identity=get_jwt_identity(), additional_claims=claims)
     }), 200
 
 
@@ -67,7 +212,7 @@ def admin_login():
 @admin_auth_bp.route('/admin/logout', methods=['POST'])
 @login_required
 def admin_logout():
-    session.clear()
+    # Tokens are stateless; the client discards them
     return jsonify({"message": "Logged out successfully"}), 200
 
 
@@ -75,13 +220,12 @@ def admin_logout():
 @admin_auth_bp.route('/admin/profile', methods=['GET'])
 @login_required
 def admin_profile():
-    admin_id = session.get('admin_id')
-    admin = Admin.query.get(admin_id)
+    admin = Admin.query.get(current_admin_id())
 
     if not admin:
         return jsonify({"error": "Admin not found"}), 404
 
-    return jsonify(admin.serialize()), 200
+    return jsonify(serialize_admin(admin)), 200
 
 
 # --------------- SUPER ADMIN ROUTES -----------------
@@ -108,17 +252,17 @@ def create_admin():
     new_admin = Admin(
         username=username,
         email=email,
-        is_super_admin=False,
+        role='admin',
         is_active=True
     )
-    new_admin.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+    new_admin.password_hash = hash_password(password)
 
     db.session.add(new_admin)
     db.session.commit()
 
     return jsonify({
         "message": "New admin created successfully",
-        "admin": new_admin.serialize()
+        "admin": serialize_admin(new_admin)
     }), 201
 
 
@@ -127,7 +271,7 @@ def create_admin():
 @super_admin_required
 def get_all_admins():
     admins = Admin.query.all()
-    return jsonify([admin.serialize() for admin in admins]), 200
+    return jsonify([serialize_admin(admin) for admin in admins]), 200
 
 
 # Deactivate or Reactivate Admin
@@ -139,11 +283,12 @@ def toggle_admin(admin_id):
     if not admin:
         return jsonify({"error": "Admin not found"}), 404
 
-    if admin.is_super_admin:
+    if admin.is_super_admin():
         return jsonify({"error": "Cannot deactivate the super admin"}), 403
 
     admin.is_active = not admin.is_active
     db.session.commit()
+    admin_cache().invalidate(admin.id)
 
     status = "activated" if admin.is_active else "deactivated"
     return jsonify({"message": f"Admin {status} successfully"}), 200
@@ -158,11 +303,12 @@ def delete_admin(admin_id):
     if not admin:
         return jsonify({"error": "Admin not found"}), 404
 
-    if admin.is_super_admin:
+    if admin.is_super_admin():
         return jsonify({"error": "Cannot delete the super admin"}), 403
 
     db.session.delete(admin)
     db.session.commit()
+    admin_cache().invalidate(admin_id)
 
     return jsonify({"message": "Admin deleted successfully"}), 200
 
@@ -188,8 +334,10 @@ def super_reset_password(admin_id):
     if new_password != confirm_password:
         return jsonify({"error": "Passwords do not match"}), 400
 
-    admin.password_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
+    admin.password_hash = hash_password(new_password)
+    admin.token_version += 1
     db.session.commit()
+    admin_cache().invalidate(admin.id)
 
     return jsonify({"message": f"Password updated for {admin.username}"}), 200
 
@@ -198,7 +346,7 @@ def super_reset_password(admin_id):
 @admin_auth_bp.route('/admin/change_password', methods=['PUT'])
 @login_required
 def change_own_password():
-    admin = Admin.query.get(session['admin_id'])
+    admin = Admin.query.get(current_admin_id())
     data = request.get_json()
 
     old_password = data.get('old_password')
@@ -211,39 +359,49 @@ def change_own_password():
     if new_password != confirm_password:
         return jsonify({"error": "Passwords do not match"}), 400
 
-    if old_password and not bcrypt.check_password_hash(admin.password_hash, old_password):
+    if old_password and not check_password(admin.password_hash, old_password):
         return jsonify({"error": "Old password is incorrect"}), 401
 
-    admin.password_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
+    admin.password_hash = hash_password(new_password)
+    admin.token_version += 1
     db.session.commit()
+    admin_cache().invalidate(admin.id)
 
-    return jsonify({"message": "Password changed successfully"}), 200
+    # The caller's own tokens were just revoked, so hand out fresh ones
+    return jsonify({"message": "Password changed successfully", **issue_tokens(admin)}), 200
 
 
 # ----------------- Forgot Password -----------------
 
 @admin_auth_bp.route('/admin/forgot_password', methods=['POST'])
+@rate_limited
 def forgot_password():
     data = request.get_json()
+    if not isinstance(data, dict):
+        return jsonify({"error": "Request body must be a JSON object"}), 400
     email = data.get('email')
 
     admin = Admin.query.filter_by(email=email).first()
     if not admin:
         return jsonify({"error": "Email not found"}), 404
 
-    token = serializer.dumps(email, salt='password-reset-salt')
-    reset_link = f"http://localhost:5000/admin/reset_password/{token}"
+    token = get_serializer().dumps(email, salt='password-reset-salt')
+    reset_link = current_app.config['PASSWORD_RESET_URL'].format(token=token)
 
-    # For dev: print reset link to console
-    print(f"Password reset link: {reset_link}")
+    # Sent by a job worker; without MAIL_SERVER it is printed to the console
+    enqueue('send_email', {
+        "to": email,
+        "subject": "Reset your password",
+        "body": f"Use this link within an hour to reset your password:\n\n{reset_link}\n",
+    })
 
-    return jsonify({"message": "Password reset link generated (check console)"}), 200
+    return jsonify({"message": "Password reset link sent"}), 200
 
 
 @admin_auth_bp.route('/admin/reset_password/<token>', methods=['POST'])
 def reset_password(token):
     try:
-        email = serializer.loads(token, salt='password-reset-salt', max_age=3600)
+        email = get_serializer().loads(token, salt='password-reset-salt', max_age=3600)
     except SignatureExpired:
         return jsonify({"error": "Token expired"}), 400
     except BadSignature:
@@ -263,8 +421,10 @@ def reset_password(token):
     if not admin:
         return jsonify({"error": "Admin not found"}), 404
 
-    admin.password_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
+    admin.password_hash = hash_password(new_password)
+    admin.token_version += 1
     db.session.commit()
+    admin_cache().invalidate(admin.id)
 
     return jsonify({"message": "Password reset successfully"}), 200
 
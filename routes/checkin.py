@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint, current_app, jsonify, request
+from checkin import (
+    DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT, MAX_PUSH_BATCH,
+    build_snapshot, change_log_supported, changes_since, current_version, parse_timestamp, prune_changes,
+    record_check_ins
+)
+from routes.admin_auth import current_admin_id, login_required
+
+checkin_bp = Blueprint('checkin', __name__)
+
+
+def change_log_unavailable():
+    """501 response when this database has no change log triggers, else None"""
+    if change_log_supported():
+        return None
+    return jsonify({"error": "Check-in sync needs the change log, which this database does not support"}), 501
+
+
+def parse_push_item(item, now):
+    """Return (item, error) for one pushed check-in"""
+    if not isinstance(item, dict):
+        return None, "Each check-in must be an object"
+    try:
+        attendee_id = int(item.get('attendee_id'))
+    except (TypeError, ValueError):
+        return None, "attendee_id must be an integer"
+    try:
+        checked_in_at = parse_timestamp(item.get('checked_in_at'), now)
+    except ValueError:
+        return None, f"Invalid checked_in_at for attendee {attendee_id}"
+    return {"attendee_id": attendee_id, "checked_in_at": checked_in_at, "undo": bool(item.get('undo'))}, None
+
+
+# -------------------------------
+# DELTA SYNC
+# -------------------------------
+
+# ✅ GET full snapshot (download once, then pull changes)
+@checkin_bp.route('/checkin/snapshot', methods=['GET'])
+@login_required
+def get_snapshot():
+    unavailable = change_log_unavailable()
+    if unavailable:
+        return unavailable
+    return current_app.json.response(build_snapshot(request.args.get('meeting_id', type=int)))
+
+
+# ✅ GET changes after a version
+@checkin_bp.route('/checkin/changes', methods=['GET'])
+@login_required
+def get_changes():
+    unavailable = change_log_unavailable()
+    if unavailable:
+        return unavailable
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({"error": "since must be a version from a snapshot or an earlier pull"}), 400
+    limit = max(1, min(request.args.get('limit', DEFAULT_CHANGES_LIMIT, type=int), MAX_CHANGES_LIMIT))
+
+    changes = changes_since(since, limit, request.args.get('meeting_id', type=int))
+    if changes is None:
+        return jsonify({"error": "Version too old, download a new snapshot", "version": current_version()}), 410
+    return current_app.json.response(changes)
+
+
+# ✅ POST a batch of check-ins from a device
+@checkin_bp.route('/checkin/check-ins', methods=['POST'])
+@login_required
+def push_check_ins():
+    data = request.get_json(silent=True) or {}
+    items = data.get('check_ins') if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return jsonify({"error": "check_ins must be a list"}), 400
+    if len(items) > MAX_PUSH_BATCH:
+        return jsonify({"error": f"At most {MAX_PUSH_BATCH} check-ins per request"}), 413
+
+    now = datetime.utcnow()
+    parsed = []
+    for item in items:
+        check_in, error = parse_push_item(item, now)
+        if error:
+            return jsonify({"error": error}), 400
+        parsed.append(check_in)
+
+    device_id = str(data.get('device_id') or '')[:64] or None
+    result = record_check_ins(parsed, device_id=device_id, admin_id=current_admin_id())
+    result["version"] = current_version()
+    return jsonify(result), 200
+
+
+# -------------------------------
+# CLI COMMANDS
+# -------------------------------
+
+@checkin_bp.cli.command('prune-changes')
+@click.option('--days', default=30, type=int, help='Keep changes from the last N days.')
+def prune_changes_command(days):
+    """Trim the check-in change log; devices further behind must re-snapshot"""
+    removed = prune_changes(datetime.utcnow() - timedelta(days=days))
+    print(f"Removed {removed} change log entries older than {days} days")
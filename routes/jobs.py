@@ -0,0 +1,117 @@
+import time
+from datetime import datetime, timedelta
+import click
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy import func
+from config import db
+from jobs import FAILED, QUEUED, TASKS, JobWorkers, enqueue, purge_jobs, run_pending, wake_workers
+from models import Job
+from serialization import serialize_job
+from routes.admin_auth import login_required, super_admin_required
+
+jobs_bp = Blueprint('jobs', __name__)
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+# -------------------------------
+# JOB STATUS
+# -------------------------------
+
+# ✅ GET queue counts and the most recent jobs
+@jobs_bp.route('/jobs', methods=['GET'])
+@login_required
+def get_jobs():
+    limit = max(1, min(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), MAX_PAGE_SIZE))
+    query = Job.query
+    if request.args.get('status'):
+        query = query.filter(Job.status == request.args['status'])
+    if request.args.get('name'):
+        query = query.filter(Job.name == request.args['name'])
+
+    counts = dict(db.session.query(Job.status, func.count()).group_by(Job.status).all())
+    due = db.session.query(func.count()).filter(Job.status == QUEUED, Job.run_at <= datetime.utcnow()).scalar()
+    jobs = query.order_by(Job.id.desc()).limit(limit).all()
+    return jsonify({
+        "counts": counts,
+        "due": due,
+        "tasks": sorted(name for name, entry in TASKS.items() if entry.admin),
+        "jobs": [serialize_job(job) for job in jobs],
+    }), 200
+
+
+# ✅ GET one job
+@jobs_bp.route('/jobs/<int:id>', methods=['GET'])
+@login_required
+def get_job(id):
+    job = db.session.get(Job, id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(serialize_job(job)), 200
+
+
+# ✅ POST start a maintenance task
+@jobs_bp.route('/jobs', methods=['POST'])
+@super_admin_required
+def create_job():
+    data = request.get_json(silent=True) or {}
+    entry = TASKS.get(data.get('task'))
+    if entry is None or not entry.admin:
+        return jsonify({"error": "Unknown task",
+                        "tasks": sorted(name for name, entry in TASKS.items() if entry.admin)}), 400
+
+    job = enqueue(entry.name)
+    return jsonify({"message": "Job queued", "id": job.id}), 202
+
+
+# ✅ POST retry a failed job now
+@jobs_bp.route('/jobs/<int:id>/retry', methods=['POST'])
+@super_admin_required
+def retry_job(id):
+    job = db.session.get(Job, id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status != FAILED:
+        return jsonify({"error": "Only failed jobs can be retried"}), 409
+
+    job.status = QUEUED
+    job.attempts = 0
+    job.run_at = datetime.utcnow()
+    job.finished_at = None
+    db.session.commit()
+    wake_workers()
+    return jsonify({"message": "Job queued", "id": job.id}), 202
+
+
+# -------------------------------
+# CLI COMMANDS
+# -------------------------------
+
+@jobs_bp.cli.command('work')
+@click.option('--threads', default=None, type=int, help='Worker threads (default JOB_WORKER_THREADS).')
+@click.option('--drain', is_flag=True, help='Run the jobs that are due now, then exit.')
+def work_command(threads, drain):
+    """Run queued jobs in this process; use with JOB_WORKER_ENABLED=0 on the web servers"""
+    if drain:
+        print(f"Ran {run_pending('cli')} jobs")
+        return
+
+    workers = JobWorkers(current_app._get_current_object(), threads or current_app.config['JOB_WORKER_THREADS'],
+                         current_app.config['JOB_POLL_INTERVAL'])
+    workers.start()
+    print(f"Running jobs with {len(workers.threads)} threads, Ctrl-C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        workers.stop()
+        workers.join()
+
+
+@jobs_bp.cli.command('purge')
+@click.option('--days', default=30, type=int, help='Keep finished jobs from the last N days.')
+def purge_command(days):
+    """Delete succeeded and failed jobs that finished more than N days ago"""
+    removed = purge_jobs(datetime.utcnow() - timedelta(days=days))
+    print(f"Removed {removed} finished jobs older than {days} days")
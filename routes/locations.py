@@ -1,11 +1,88 @@
-from flask import Blueprint, jsonify, request
+import hashlib
+import json
+import time
+from threading import Lock
+import click
+from flask import Blueprint, jsonify, request, current_app
 from config import db
 from models import Station, District, Church
+from location_import import DEFAULT_BATCH_SIZE, DEFAULT_MAX_ROWS, LocationImportTooLarge, import_locations
+from location_index import detach_churches, invalidate_church_index, location_cache_stale, location_version
+from response_cache import cached, invalidate
+from serialization import serialize_location
 from flask_jwt_extended import jwt_required, get_jwt_identity 
 
 
 locations_bp = Blueprint('locations', __name__)
 
+# Serialized Station -> District -> Church tree, shared by every request in this process
+_tree_cache = {"body": None, "etag": None, "version": None, "built_at": float('-inf')}
+_tree_lock = Lock()
+
+
+# --------------- Helpers -----------------
+def build_location_tree():
+    """Build the full hierarchy from a single joined query"""
+    rows = (
+        db.session.query(Station.id, Station.name, District.id, District.name, Church.id, Church.name)
+        .outerjoin(District, District.station_id == Station.id)
+        .outerjoin(Church, Church.district_id == District.id)
+        .order_by(Station.id, District.id, Church.id)
+        .all()
+    )
+
+    stations = {}
+    districts = {}
+    for station_id, station_name, district_id, district_name, church_id, church_name in rows:
+        station = stations.get(station_id)
+        if station is None:
+            station = stations[station_id] = {"id": station_id, "name": station_name, "districts": []}
+        if district_id is None:
+            continue
+        district = districts.get(district_id)
+        if district is None:
+            district = districts[district_id] = {"id": district_id, "name": district_name, "churches": []}
+            station["districts"].append(district)
+        if church_id is not None:
+            district["churches"].append({"id": church_id, "name": church_name})
+    return list(stations.values())
+
+
+def get_location_tree():
+    """Return the cached (body, etag) pair, rebuilding it after a location write by any worker"""
+    version = location_version()
+    with _tree_lock:
+        if _tree_cache["body"] is None or location_cache_stale(_tree_cache, version):
+            body = current_app.json.dumps_bytes(build_location_tree())
+            _tree_cache["body"] = body
+            _tree_cache["etag"] = hashlib.sha1(body).hexdigest()
+            _tree_cache["version"] = version
+            _tree_cache["built_at"] = time.monotonic()
+        return _tree_cache["body"], _tree_cache["etag"]
+
+
+def invalidate_location_tree():
+    """Drop the cached tree and name index; call after any station, district or church commit"""
+    with _tree_lock:
+        _tree_cache["body"] = None
+        _tree_cache["etag"] = None
+    invalidate_church_index()
+
+
+# -------------------------------
+# LOCATION TREE
+# -------------------------------
+
+# ✅ READ the whole Station -> District -> Church hierarchy
+@locations_bp.route('/locations/tree', methods=['GET'])
+@jwt_required()
+def get_location_tree_route():
+    body, etag = get_location_tree()
+    response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
 
 # -------------------------------
 # CRUD ROUTES FOR STATIONS
@@ -16,7 +93,7 @@ locations_bp = Blueprint('locations', __name__)
 @jwt_required()
 def get_stations():
     stations = Station.query.all()
-    return jsonify([{"id": s.id, "name": s.name} for s in stations]), 200
+    return jsonify([serialize_location(s) for s in stations]), 200
 
 
 # ✅ CREATE new station
@@ -27,10 +104,11 @@ def add_station():
     if not data.get('name'):
         return jsonify({"error": "Station name is required"}), 400
 
-        new_station = Station(name=data['name'])
-        db.session.add(new_station)
-        db.session.commit()
-        return jsonify({"message": "Station added successfully", "id": new_station.id}), 201
+    new_station = Station(name=data['name'])
+    db.session.add(new_station)
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "Station added successfully", "id": new_station.id}), 201
 
 
 # ✅ UPDATE station
@@ -41,10 +119,11 @@ def update_station(id):
     if not station:
         return jsonify({"error": "Station not found"}), 404
 
-        data = request.get_json()
-        station.name = data.get('name', station.name)
-        db.session.commit()
-        return jsonify({"message": "Station updated successfully"}), 200
+    data = request.get_json()
+    station.name = data.get('name', station.name)
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "Station updated successfully"}), 200
 
 
 # ✅ DELETE station
@@ -55,9 +134,13 @@ def delete_station(id):
     if not station:
         return jsonify({"error": "Station not found"}), 404
 
-        db.session.delete(station)
-        db.session.commit()
-        return jsonify({"message": "Station deleted successfully"}), 200
+    # The cascade takes the station's districts and their church lists with it
+    invalidate(f"station:{id}", *(f"district:{district.id}" for district in station.districts))
+    detach_churches(church.id for district in station.districts for church in district.churches)
+    db.session.delete(station)
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "Station deleted successfully"}), 200
 
 
 # -------------------------------
@@ -72,18 +155,21 @@ def add_district(station_id):
     if not data.get('name'):
         return jsonify({"error": "District name is required"}), 400
 
-        new_district = District(name=data['name'], station_id=station_id)
-        db.session.add(new_district)
-        db.session.commit()
-        return jsonify({"message": "District added successfully", "id": new_district.id}), 201
+    new_district = District(name=data['name'], station_id=station_id)
+    db.session.add(new_district)
+    invalidate(f"station:{station_id}")
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "District added successfully", "id": new_district.id}), 201
 
 
 # ✅ READ all districts in a station
-@locations_bp.route('/stations/<int;station_id>/districts', methods=['GET'])
+@locations_bp.route('/stations/<int:station_id>/districts', methods=['GET'])
 @jwt_required()
+@cached(tags=lambda station_id: [f"station:{station_id}"])
 def get_districts(station_id):
     districts = District.query.filter_by(station_id=station_id).all()
-    return jsonify([{"id": d.id, "name": d.name} for d in districts]), 200
+    return jsonify([serialize_location(d) for d in districts]), 200
 
 
 # ✅ UPDATE district
@@ -94,10 +180,12 @@ def update_district(id):
     if not district:
         return jsonify({"error": "District not found"}), 404
 
-        data = request.get_json()
-        district.name = data.get('name', district.name)
-        db.session.commit()
-        return jsonify({"message": "District updated successfully"}), 200
+    data = request.get_json()
+    district.name = data.get('name', district.name)
+    invalidate(f"station:{district.station_id}")
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "District updated successfully"}), 200
 
 
 # ✅ DELETE district
@@ -108,9 +196,12 @@ def delete_district(id):
     if not district:
         return jsonify({"error": "District not found"}), 404
 
-        db.session.delete(district)
-        db.session.commit()
-        return jsonify({"message": "District deleted successfully"}), 200
+    invalidate(f"station:{district.station_id}", f"district:{id}")
+    detach_churches(church.id for church in district.churches)
+    db.session.delete(district)
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "District deleted successfully"}), 200
 
 
 # -------------------------------
@@ -125,18 +216,21 @@ def add_church(district_id):
     if not data.get('name'):
         return jsonify({"error": "Church name is required"}), 400
 
-        new_church = Church(name=data['name'], district_id=district_id)
-        db.session.add(new_church)
-        db.session.commit()
-        return jsonify({"message": "Church added successfully", "id": new_church.id}), 201
+    new_church = Church(name=data['name'], district_id=district_id)
+    db.session.add(new_church)
+    invalidate(f"district:{district_id}")
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "Church added successfully", "id": new_church.id}), 201
 
 
 # ✅ READ all churches in a district
 @locations_bp.route('/districts/<int:district_id>/churches', methods=['GET'])
 @jwt_required()
+@cached(tags=lambda district_id: [f"district:{district_id}"])
 def get_churches(district_id):
     churches = Church.query.filter_by(district_id=district_id).all()
-    return jsonify([{"id": c.id, "name": c.name} for c in churches]), 200
+    return jsonify([serialize_location(c) for c in churches]), 200
 
 
 # ✅ UPDATE church
@@ -147,10 +241,12 @@ def update_church(id):
     if not church:
         return jsonify({"error": "Church not found"}), 404
 
-        data = request.get_json()
-        church.name = data.get('name', church.name)
-        db.session.commit()
-        return jsonify({"message": "Church updated successfully"}), 200
+    data = request.get_json()
+    church.name = data.get('name', church.name)
+    invalidate(f"district:{church.district_id}")
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "Church updated successfully"}), 200
 
 
 # ✅ DELETE church
@@ -161,6 +257,41 @@ def delete_church(id):
     if not church:
         return jsonify({"error": "Church not found"}), 404
 
-        db.session.delete(church)
-        db.session.commit()
-        return jsonify({"message": "Church deleted successfully"}), 200
\ No newline at end of file
+    invalidate(f"district:{church.district_id}")
+    detach_churches([id])
+    db.session.delete(church)
+    db.session.commit()
+    invalidate_location_tree()
+    return jsonify({"message": "Church deleted successfully"}), 200
+
+# -------------------------------
+# CLI COMMANDS
+# -------------------------------
+
+@locations_bp.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--dry-run', is_flag=True, help='Report what would be created without writing anything.')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, type=int, help='Rows per INSERT and commit.')
+@click.option('--report', 'report_path', default=None, help='Write the full JSON report to this file.')
+def import_locations_command(path, dry_run, batch_size, report_path):
+    """Add the stations, districts and churches in a station,district,church CSV."""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        try:
+            report = import_locations(f, dry_run=dry_run, batch_size=batch_size,
+                                      report_limit=None if report_path else 0,
+                                      max_rows=current_app.config.get('LOCATION_IMPORT_MAX_ROWS', DEFAULT_MAX_ROWS))
+        except LocationImportTooLarge as e:
+            raise click.ClickException(str(e))
+    if not dry_run:
+        invalidate_location_tree()
+
+    prefix = "Would create" if dry_run else "Created"
+    print(f"Read {report['rows']} rows ({report['duplicate_rows']} duplicates, {len(report['errors'])} errors).")
+    for level in ("stations", "districts", "churches"):
+        print(f"{prefix} {report[level]['created']} {level}, {report[level]['unchanged']} already existed.")
+    for error in report["errors"][:20]:
+        print(f"Line {error['line']}: {error['error']}")
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {report_path}")
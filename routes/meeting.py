@@ -1,50 +1,158 @@
-from flask import Blueprint, jsonify, request
+import base64
+import re
+import click
+from datetime import datetime, timezone
+from flask import Blueprint, jsonify, request, current_app, redirect, send_file
+from sqlalchemy import tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+from archive import DEFAULT_ARCHIVE_AFTER_DAYS, archive_past_meetings, restore_meeting
 from config import db
 from models import Meeting
+from serialization import MEETING_FIELDS, meeting_serializer, serialize_meeting
+from posters import PosterError, regenerate_thumbnails, store_poster
+from response_cache import cached, invalidate
+from seats import detach_meeting, largest_waitlisted_group, lock_meeting, promote_waitlist, seat_writes
+from storage import asset_store
+from tasks import schedule_registration_close, unschedule_registration_close
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 meeting_bp = Blueprint('meeting', __name__)
 
+# Serialized fields that are computed from other columns
+DERIVED_FIELD_COLUMNS = {"poster_thumbnails": ("poster_asset", "poster_thumbnails_ready")}
+ASSET_KEY = re.compile(r'^posters/[0-9a-f]{24}(-w\d+\.webp|\.(jpg|png|webp|gif))$')
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+# --------------- Helpers -----------------
+def is_true(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def parse_fields(raw):
+    """Parse ?fields=a,b into a set of meeting columns; id is always returned"""
+    if not raw:
+        return set(MEETING_FIELDS), None
+    fields = {f.strip() for f in raw.split(',') if f.strip()}
+    unknown = fields - set(MEETING_FIELDS)
+    if unknown:
+        return None, f"Unknown fields: {', '.join(sorted(unknown))}"
+    return fields | {"id"}, None
+
+
+def field_columns(fields):
+    """Meeting columns to load for a set of serialized fields"""
+    columns = {"id", "date"}
+    for field in fields:
+        columns.update(DERIVED_FIELD_COLUMNS.get(field, (field,)))
+    return [getattr(Meeting, c) for c in columns]
+
+
+def parse_datetime(value):
+    """ISO 8601 string (or datetime) as a naive UTC datetime; raises ValueError otherwise"""
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def parse_capacity(value):
+    """None (unlimited) or a non-negative integer; raises ValueError otherwise"""
+    if value in (None, ""):
+        return None
+    capacity = int(value)
+    if capacity < 0:
+        raise ValueError
+    return capacity
+
+
+def encode_cursor(meeting):
+    """Opaque keyset cursor for the (date, id) position of a meeting"""
+    raw = f"{meeting.date.isoformat()}|{meeting.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        date, meeting_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(date), int(meeting_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
 # -------------------------------
 # CRUD ROUTES FOR MEETING (ADMIN ONLY)
 # -------------------------------
 
-# ✅ READ all meetings
+# ✅ READ meetings, one keyset page at a time
 @meeting_bp.route('/meetings', methods=['GET'])
 @jwt_required()
+@cached(tags=["meetings"])
 def get_meetings():
-    meetings = Meeting.query.all()
-    if not meetings:
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit < 1:
+        return jsonify({"error": "limit must be positive"}), 400
+
+    fields, error = parse_fields(request.args.get('fields'))
+    if error:
+        return jsonify({"error": error}), 400
+
+    descending = request.args.get('order', 'asc').lower() == 'desc'
+    query = Meeting.query.options(load_only(*field_columns(fields)))
+
+    now = datetime.utcnow()
+    if is_true(request.args.get('upcoming')):
+        query = query.filter(Meeting.date >= now)
+    if is_true(request.args.get('open')):
+        query = query.filter(Meeting.deadline >= now)
+
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            cursor_date, cursor_id = decode_cursor(cursor)
+        except ValueError:
+            return jsonify({"error": "Invalid cursor"}), 400
+        if descending:
+            query = query.filter(tuple_(Meeting.date, Meeting.id) < (cursor_date, cursor_id))
+        else:
+            query = query.filter(tuple_(Meeting.date, Meeting.id) > (cursor_date, cursor_id))
+
+    if descending:
+        query = query.order_by(Meeting.date.desc(), Meeting.id.desc())
+    else:
+        query = query.order_by(Meeting.date, Meeting.id)
+
+    meetings = query.limit(limit + 1).all()
+    has_more = len(meetings) > limit
+    meetings = meetings[:limit]
+
+    if not meetings and not cursor:
         return jsonify({"message": "No meetings found"}), 404
-    return jsonify([
-        {
-            "id": m.id,
-            "title": m.title,
-            "date": m.date,
-            "deadline": m.deadline,
-            "registration_amount": m.registration_amount,
-            "poster_url": m.poster_url,
-            "description": m.description
-        } for m in meetings
-    ]), 200
+
+    serialize = meeting_serializer(fields)
+    return jsonify({
+        "meetings": [serialize(m) for m in meetings],
+        "next_cursor": encode_cursor(meetings[-1]) if has_more else None
+    }), 200
 
 
 # ✅ READ one meeting
 @meeting_bp.route('/meetings/<int:id>', methods=['GET'])
 @jwt_required()
+@cached(tags=lambda id: [f"meeting:{id}"])
 def get_meeting(id):
     meeting = Meeting.query.get(id)
     if not meeting:
         return jsonify({"message": "Meeting not found"}), 404
-    return jsonify({
-        "id": meeting.id,
-        "title": meeting.title,
-        "date": meeting.date,
-        "deadline": meeting.deadline,
-        "registration_amount": meeting.registration_amount,
-        "poster_url": meeting.poster_url,
-        "description": meeting.description
-    }), 200
+    return jsonify(serialize_meeting(meeting)), 200
 
 
 # ✅ CREATE a new meeting
@@ -57,16 +165,28 @@ def create_meeting():
     for field in required_fields:
         if not data.get(field):
             return jsonify({"error": f"{field} is required"}), 400
+    try:
+        date, deadline = parse_datetime(data["date"]), parse_datetime(data["deadline"])
+    except ValueError:
+        return jsonify({"error": "date and deadline must be ISO 8601 datetimes"}), 400
+    try:
+        capacity = parse_capacity(data.get("capacity"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "capacity must be a non-negative integer"}), 400
 
     meeting = Meeting(
         title=data["title"],
-        date=data["date"],
-        deadline=data["deadline"],
+        date=date,
+        deadline=deadline,
         registration_amount=data.get("registration_amount", 0.0),
         poster_url=data.get("poster_url"),
-        description=data.get("description")
+        description=data.get("description"),
+        capacity=capacity
     )
     db.session.add(meeting)
+    db.session.flush()
+    schedule_registration_close(meeting)
+    invalidate("meetings")
     db.session.commit()
 
     return jsonify({"message": "Meeting created successfully", "id": meeting.id}), 201
@@ -81,13 +201,35 @@ def update_meeting(id):
         return jsonify({"error": "Meeting not found"}), 404
 
     data = request.get_json()
+    deadline = meeting.deadline
     meeting.title = data.get('title', meeting.title)
-    meeting.date = data.get('date', meeting.date)
-    meeting.deadline = data.get('deadline', meeting.deadline)
+    try:
+        meeting.date = parse_datetime(data['date']) if data.get('date') else meeting.date
+        meeting.deadline = parse_datetime(data['deadline']) if data.get('deadline') else meeting.deadline
+    except ValueError:
+        return jsonify({"error": "date and deadline must be ISO 8601 datetimes"}), 400
     meeting.registration_amount = data.get('registration_amount', meeting.registration_amount)
     meeting.poster_url = data.get('poster_url', meeting.poster_url)
     meeting.description = data.get('description', meeting.description)
+    if 'capacity' in data:
+        try:
+            meeting.capacity = parse_capacity(data['capacity'])
+        except (TypeError, ValueError):
+            return jsonify({"error": "capacity must be a non-negative integer"}), 400
+        db.session.flush()
+        lock_meeting(id)
+        # A queued group that no longer fits could never be promoted, and would hold up everyone behind it
+        largest = largest_waitlisted_group(id)
+        if meeting.capacity is not None and largest is not None and largest > meeting.capacity:
+            db.session.rollback()
+            return jsonify({"error": f"A waitlisted group needs {largest} seats; "
+                                     f"cancel it or keep capacity at {largest} or more"}), 409
+        # Extra seats go to the waitlist straight away
+        promote_waitlist(id)
+    if meeting.deadline != deadline:
+        schedule_registration_close(meeting)
 
+    invalidate("meetings", f"meeting:{id}")
     db.session.commit()
     return jsonify({"message": "Meeting updated successfully"}), 200
 
@@ -100,6 +242,117 @@ def delete_meeting(id):
     if not meeting:
         return jsonify({"error": "Meeting not found"}), 404
 
-    db.session.delete(meeting)
-    db.session.commit()
+    with seat_writes([id]):
+        lock_meeting(id)
+        detach_meeting(id)
+        db.session.delete(meeting)
+        unschedule_registration_close(id)
+        invalidate("meetings", f"meeting:{id}")
+        db.session.commit()
     return jsonify({"message": "Meeting deleted successfully"}), 200
+
+
+# -------------------------------
+# POSTERS
+# -------------------------------
+
+# ✅ UPLOAD a meeting poster; thumbnails are built in the background
+@meeting_bp.route('/meetings/<int:id>/poster', methods=['POST'])
+@jwt_required()
+def upload_poster(id):
+    meeting = Meeting.query.get(id)
+    if not meeting:
+        return jsonify({"error": "Meeting not found"}), 404
+
+    # Reject oversized bodies before the form parser spools them
+    if request.content_length and request.content_length > current_app.config['MAX_POSTER_BYTES'] + 64 * 1024:
+        return jsonify({"error": "Poster is too large"}), 413
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({"error": "An image is required in the 'file' field"}), 400
+
+    try:
+        store_poster(meeting, upload)
+    except PosterError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({
+        "message": "Poster uploaded; thumbnails are being generated",
+        "poster_url": meeting.poster_url
+    }), 202
+
+
+# ✅ SERVE a stored poster or thumbnail (content-addressed, cached for a year)
+@meeting_bp.route('/assets/<path:key>', methods=['GET'])
+def get_asset(key):
+    if not ASSET_KEY.match(key):
+        return jsonify({"error": "Asset not found"}), 404
+
+    store = asset_store()
+    url = store.url(key)
+    if url:
+        return redirect(url, code=301)
+    if not store.exists(key):
+        return jsonify({"error": "Asset not found"}), 404
+
+    # send_file handles Range/If-None-Match and uses X-Sendfile when USE_X_SENDFILE is on
+    response = send_file(store.path(key), conditional=True, etag=True,
+                         max_age=current_app.config['ASSET_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+# -------------------------------
+# CLI COMMANDS
+# -------------------------------
+
+@meeting_bp.cli.command('generate-thumbnails')
+def generate_thumbnails_command():
+    """Build thumbnails for uploaded posters that do not have them yet."""
+    print(f"Generated thumbnails for {regenerate_thumbnails()} posters.")
+
+
+@meeting_bp.cli.command('schedule-closes')
+def schedule_closes_command():
+    """Schedule the registration-close job for every meeting whose deadline is still ahead."""
+    meetings = Meeting.query.filter(Meeting.deadline > datetime.utcnow()).all()
+    for meeting in meetings:
+        schedule_registration_close(meeting)
+    db.session.commit()
+    print(f"Scheduled registration close for {len(meetings)} meetings.")
+
+
+@meeting_bp.cli.command('archive')
+@click.option('--days', default=None, type=int,
+              help='Archive meetings that took place more than N days ago (default ARCHIVE_AFTER_DAYS).')
+@click.option('--dry-run', is_flag=True, help='List the meetings that would be archived.')
+def archive_meetings_command(days, dry_run):
+    """Move past meetings' registrations, attendees and check-ins into the yearly archive tables."""
+    if days is None:
+        days = current_app.config.get('ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    results = archive_past_meetings(days, dry_run=dry_run)
+    for result in results:
+        if dry_run:
+            print(f"Meeting {result['meeting_id']}: {result['registrations']} registrations "
+                  f"would go to partition {result['partition']}.")
+        else:
+            print(f"Meeting {result['meeting_id']}: archived {result['registrations']} registrations, "
+                  f"{result['attendees']} attendees and {result['check_ins']} check-ins "
+                  f"to partition {result['partition']}.")
+    print(f"{'Would archive' if dry_run else 'Archived'} {len(results)} meetings.")
+
+
+@meeting_bp.cli.command('restore')
+@click.argument('meeting_id', type=int)
+def restore_meeting_command(meeting_id):
+    """Move an archived meeting's registrations back into the live tables."""
+    try:
+        result = restore_meeting(meeting_id)
+    except IntegrityError as e:
+        db.session.rollback()
+        raise click.ClickException(f"Nothing restored; a live row conflicts with the archive: {e.orig}")
+    if result is None:
+        raise click.ClickException(f"Meeting {meeting_id} is not archived.")
+    print(f"Restored {result['registrations']} registrations, {result['attendees']} attendees and "
+          f"{result['check_ins']} check-ins for meeting {meeting_id}.")
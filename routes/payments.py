@@ -0,0 +1,137 @@
+import codecs
+import csv
+import hmac
+import click
+from flask import Blueprint, jsonify, request, current_app
+from sqlalchemy import func
+from config import db
+from models import PaymentCallback
+from reconciliation import enqueue_callbacks, process_batch, wake_worker, ENQUEUE_CHUNK
+from routes.admin_auth import login_required
+
+payments_bp = Blueprint('payments', __name__)
+
+
+def parse_callback(item):
+    """Return (callback, error) for one incoming payment confirmation"""
+    if not isinstance(item, dict):
+        return None, "Each callback must be an object"
+    invoice_number = str(item.get('invoice_number') or '').strip()
+    if not invoice_number:
+        return None, "invoice_number is required"
+    amount = item.get('amount')
+    if amount not in (None, ''):
+        try:
+            amount = float(amount)
+        except (TypeError, ValueError):
+            return None, f"Invalid amount for {invoice_number}"
+    else:
+        amount = None
+    reference = item.get('reference')
+    return {
+        "invoice_number": invoice_number,
+        "amount": amount,
+        "reference": str(reference)[:120] if reference else None,
+    }, None
+
+
+def webhook_authorized():
+    secret = current_app.config.get('PAYMENT_WEBHOOK_SECRET')
+    if not secret:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Webhook-Secret', ''), secret)
+
+
+# -------------------------------
+# PAYMENT CALLBACKS
+# -------------------------------
+
+# ✅ POST payment callbacks (webhook, one object or a list)
+@payments_bp.route('/payments/callbacks', methods=['POST'])
+def receive_callbacks():
+    if not webhook_authorized():
+        return jsonify({"error": "Invalid webhook secret"}), 401
+
+    data = request.get_json(silent=True)
+    items = data if isinstance(data, list) else [data]
+    callbacks = []
+    for item in items:
+        callback, error = parse_callback(item)
+        if error:
+            return jsonify({"error": error}), 400
+        callbacks.append(callback)
+
+    queued = enqueue_callbacks(callbacks, source='webhook')
+    wake_worker(current_app._get_current_object())
+    return jsonify({"message": "Callbacks queued", "queued": queued}), 202
+
+
+# ✅ POST a payment statement file (CSV with invoice_number, amount, reference)
+@payments_bp.route('/payments/statements', methods=['POST'])
+@login_required
+def upload_statement():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({"error": "A CSV file is required in the 'file' field"}), 400
+
+    # Read the upload line by line so large statements never sit in memory whole
+    reader = csv.DictReader(codecs.iterdecode(upload.stream, 'utf-8-sig'))
+    if not reader.fieldnames or 'invoice_number' not in reader.fieldnames:
+        return jsonify({"error": "Statement must have an invoice_number column"}), 400
+
+    queued = 0
+    rejected = []
+    chunk = []
+    for line_number, row in enumerate(reader, start=2):
+        callback, error = parse_callback(row)
+        if error:
+            rejected.append({"line": line_number, "error": error})
+            continue
+        chunk.append(callback)
+        if len(chunk) >= ENQUEUE_CHUNK:
+            queued += enqueue_callbacks(chunk, source='statement')
+            chunk = []
+    if chunk:
+        queued += enqueue_callbacks(chunk, source='statement')
+
+    wake_worker(current_app._get_current_object())
+    return jsonify({
+        "message": "Statement queued",
+        "queued": queued,
+        "rejected": rejected[:100],
+        "rejected_count": len(rejected)
+    }), 202
+
+
+# ✅ GET queue status
+@payments_bp.route('/payments/queue', methods=['GET'])
+@login_required
+def queue_status():
+    counts = dict(
+        db.session.query(PaymentCallback.status, func.count(PaymentCallback.id))
+        .group_by(PaymentCallback.status)
+        .all()
+    )
+    return jsonify(counts), 200
+
+
+# -------------------------------
+# CLI COMMANDS
+# -------------------------------
+
+@payments_bp.cli.command('process')
+@click.option('--batch-size', default=None, type=int, help='Callbacks per batch.')
+@click.option('--drain/--once', default=True, help='Keep going until the queue is empty.')
+def process_payments_command(batch_size, drain):
+    """Apply queued payment callbacks to registrations."""
+    batch_size = batch_size or current_app.config.get('PAYMENT_BATCH_SIZE', 500)
+    totals = {}
+    while True:
+        result = process_batch(batch_size)
+        if result is None:
+            break
+        for key, value in result.items():
+            totals[key] = totals.get(key, 0) + value
+        if not drain:
+            break
+    print(f"Processed payment callbacks: {totals or 'queue empty'}")
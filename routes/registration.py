@@ -0,0 +1,365 @@
+import click
+from datetime import datetime
+from flask import Blueprint, jsonify, request, current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from config import db
+from events import publish, registration_event
+from models import Registration, Attendee
+from rollups import record_bulk_registrations
+from idempotency import idempotent, purge_expired_keys
+from invoices import allocate_invoice_numbers, reserved_invoice_number
+from location_index import get_church_index, backfill_church_ids, BACKFILL_BATCH_SIZE
+from seats import (
+    CANCELLED, CONFIRMED, SeatsExceedCapacity, assign_seats, cancel_registration, meeting_terms, recount_seats,
+    reserve_seats, seat_writes, seats_for
+)
+from flask_jwt_extended import jwt_required
+
+registration_bp = Blueprint('registration', __name__)
+
+REQUIRED_FIELDS = ["leader_name", "leader_phone"]
+LOCATION_FIELDS = ["station", "district", "church"]
+DEFAULT_BULK_BATCH_SIZE = 500
+DEFAULT_BULK_MAX_ITEMS = 10000
+
+
+# --------------- Helpers -----------------
+def validate_registration(item, meetings=None, churches=None):
+    """Validate one registration and return (row, attendees, error)
+
+    A missing invoice_number is left as None for the allocator to fill in; a
+    supplied one may not take the allocator's prefix-and-digits form. The
+    location is given either as church_id or as station/district/church names;
+    both forms end up stored, with church_id None for names that match no church.
+    A registration for a meeting must arrive before its deadline and defaults its
+    amount to the meeting's fee per seat; ``meetings`` caches lookups across a bulk request,
+    and a bulk request passes the church index it fetched once as ``churches``.
+    """
+    if not isinstance(item, dict):
+        return None, None, "Registration must be an object"
+
+    for field in REQUIRED_FIELDS:
+        if item.get(field) in (None, ""):
+            return None, None, f"{field} is required"
+
+    index = churches if churches is not None else get_church_index()
+    if item.get("church_id") not in (None, ""):
+        try:
+            church_id = int(item["church_id"])
+        except (TypeError, ValueError):
+            return None, None, "church_id must be an integer"
+        names = index.names(church_id)
+        if names is None:
+            return None, None, f"Church {church_id} not found"
+        station, district, church = names
+    else:
+        for field in LOCATION_FIELDS:
+            if item.get(field) in (None, ""):
+                return None, None, f"{field} is required"
+        station, district, church = item["station"], item["district"], item["church"]
+        church_id = index.resolve(station, district, church)
+
+    meeting = None
+    if item.get("meeting_id") not in (None, ""):
+        try:
+            meeting_id = int(item["meeting_id"])
+        except (TypeError, ValueError):
+            return None, None, "meeting_id must be an integer"
+        meeting = meeting_terms(meeting_id, meetings)
+        if meeting is None:
+            return None, None, f"Meeting {meeting_id} not found"
+        if meeting.deadline is not None and meeting.deadline < datetime.utcnow():
+            return None, None, f"Registration for meeting {meeting_id} has closed"
+
+    attendees = item.get("attendees") or []
+    if not isinstance(attendees, list):
+        return None, None, "attendees must be a list"
+
+    attendee_rows = []
+    for position, attendee in enumerate(attendees):
+        if not isinstance(attendee, dict) or not attendee.get("name"):
+            return None, None, f"attendees[{position}].name is required"
+        try:
+            age = int(attendee.get("age"))
+        except (TypeError, ValueError):
+            return None, None, f"attendees[{position}].age must be an integer"
+        attendee_rows.append({"name": attendee["name"], "age": age})
+    seats = seats_for(attendee_rows)
+    if meeting is not None and meeting.capacity is not None and seats > meeting.capacity:
+        return None, None, f"Meeting {meeting.id} has {meeting.capacity} seats; this group needs {seats}"
+
+    if item.get("amount") in (None, ""):
+        if meeting is None:
+            return None, None, "amount is required"
+        amount = (meeting.registration_amount or 0.0) * seats
+    else:
+        try:
+            amount = float(item["amount"])
+        except (TypeError, ValueError):
+            return None, None, "amount must be a number"
+    invoice_number = str(item["invoice_number"]) if item.get("invoice_number") not in (None, "") else None
+    if invoice_number is not None and reserved_invoice_number(invoice_number):
+        return None, None, (f"Invoice number {invoice_number} has the form the server assigns; "
+                            f"leave invoice_number out to be given one")
+
+    # bool("false") is True, so only JSON booleans are accepted
+    paid = item.get("paid", False)
+    if paid is None:
+        paid = False
+    if not isinstance(paid, bool):
+        return None, None, "paid must be true or false"
+
+    row = {
+        "station": station,
+        "district": district,
+        "church": church,
+        "church_id": church_id,
+        "leader_name": item["leader_name"],
+        "leader_phone": str(item["leader_phone"]),
+        "amount": amount,
+        "invoice_number": invoice_number,
+        "paid": paid,
+        "meeting_id": meeting.id if meeting is not None else None,
+        "seats": seats,
+    }
+    return row, attendee_rows, None
+
+
+def read_bulk_items():
+    """Yield raw items from a JSON array body or an NDJSON stream"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield current_app.json.loads(line)
+            except ValueError:
+                yield ValueError("Invalid JSON line")
+        return
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('registrations')
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array or an NDJSON stream of registrations")
+    yield from data
+
+
+def existing_invoice_numbers(invoice_numbers, chunk_size):
+    """Return the subset of invoice numbers already stored, queried in chunks"""
+    found = set()
+    invoice_numbers = list(invoice_numbers)
+    for start in range(0, len(invoice_numbers), chunk_size):
+        chunk = invoice_numbers[start:start + chunk_size]
+        found.update(
+            number for (number,) in db.session.query(Registration.invoice_number)
+            .filter(Registration.invoice_number.in_(chunk))
+        )
+    return found
+
+
+def insert_batch(batch):
+    """Insert a batch of (index, row, attendees) with multi-row INSERTs in one transaction
+
+    RETURNING rows are matched back to the batch by invoice number, which is
+    unique: asking SQLAlchemy to keep parameter order would need a sentinel
+    column, and without one it sends an INSERT per row.
+    """
+    assign_seats([row for _, row, _ in batch])
+    ids = {number: registration_id for registration_id, number in db.session.execute(
+        insert(Registration).returning(Registration.id, Registration.invoice_number),
+        [row for _, row, _ in batch]
+    )}
+    created = [ids[row["invoice_number"]] for _, row, _ in batch]
+
+    attendee_rows = []
+    for registration_id, (_, _, attendees) in zip(created, batch):
+        attendee_rows.extend({**attendee, "registration_id": registration_id} for attendee in attendees)
+    if attendee_rows:
+        db.session.execute(insert(Attendee), attendee_rows)
+    for registration_id, (_, row, _) in zip(created, batch):
+        publish("registration.created", registration_event(row, id=registration_id))
+
+    record_bulk_registrations(db.session.connection(), [(row, attendees) for _, row, attendees in batch])
+    db.session.commit()
+    return created
+
+
+def insert_batch_row(row, attendees):
+    row["status"] = reserve_seats(row["meeting_id"], row["seats"]) if row["meeting_id"] is not None else CONFIRMED
+    registration_id = db.session.execute(insert(Registration).returning(Registration.id), row).scalar_one()
+    if attendees:
+        db.session.execute(insert(Attendee), [{**a, "registration_id": registration_id} for a in attendees])
+    record_bulk_registrations(db.session.connection(), [(row, attendees)])
+    return registration_id
+
+
+def insert_rows_individually(batch, results):
+    """Fallback for a batch that hit a constraint: isolate the bad rows with savepoints"""
+    for index, row, attendees in batch:
+        try:
+            with db.session.begin_nested():
+                registration_id = insert_batch_row(row, attendees)
+            publish("registration.created", registration_event(row, id=registration_id))
+            results[index] = {"index": index, "status": "created", "id": registration_id,
+                              "invoice_number": row["invoice_number"], "registration_status": row["status"]}
+        except IntegrityError:
+            results[index] = {"index": index, "status": "conflict", "invoice_number": row["invoice_number"],
+                              "error": "Invoice number already exists"}
+        except SeatsExceedCapacity as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+    db.session.commit()
+
+
+# --------------- REGISTRATION Routes -----------------
+
+# ✅ CREATE one registration with its attendees
+@registration_bp.route('/registrations', methods=['POST'])
+@jwt_required()
+@idempotent
+def create_registration():
+    row, attendees, error = validate_registration(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
+
+    if row["invoice_number"] is None:
+        row["invoice_number"] = allocate_invoice_numbers()[0]
+
+    registration = Registration(**row, attendees=[Attendee(**attendee) for attendee in attendees])
+    with seat_writes([row["meeting_id"]]):
+        # The seat UPDATE is the transaction's first write, so it rolls back with a failed insert
+        if row["meeting_id"] is not None:
+            try:
+                registration.status = reserve_seats(row["meeting_id"], row["seats"])
+            except SeatsExceedCapacity as e:
+                db.session.rollback()
+                return jsonify({"error": str(e)}), 400
+        db.session.add(registration)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"error": "Invoice number already exists"}), 409
+
+    return jsonify({
+        "message": "Registration created successfully" if registration.status == CONFIRMED
+        else "Meeting is full; registration added to the waitlist",
+        "id": registration.id,
+        "invoice_number": registration.invoice_number,
+        "status": registration.status
+    }), 201
+
+
+# ✅ CANCEL a registration; freed seats go to the waitlist
+@registration_bp.route('/registrations/<int:id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_registration_route(id):
+    result = cancel_registration(id)
+    if result is None:
+        return jsonify({"error": "Registration not found"}), 404
+    previous, promoted = result
+    if previous == CANCELLED:
+        return jsonify({"message": "Registration already cancelled", "promoted": []}), 200
+    return jsonify({"message": "Registration cancelled", "promoted": promoted}), 200
+
+
+# ✅ BULK CREATE registrations with nested attendees
+@registration_bp.route('/registrations/bulk', methods=['POST'])
+@jwt_required()
+@idempotent
+def bulk_create_registrations():
+    batch_size = current_app.config.get('BULK_BATCH_SIZE', DEFAULT_BULK_BATCH_SIZE)
+    max_items = current_app.config.get('BULK_MAX_ITEMS', DEFAULT_BULK_MAX_ITEMS)
+
+    results = {}
+    valid = []
+    seen_invoices = set()
+    meetings = {}
+    churches = get_church_index()
+    try:
+        for index, item in enumerate(read_bulk_items()):
+            if index >= max_items:
+                return jsonify({"error": f"A bulk request may contain at most {max_items} registrations"}), 413
+            if isinstance(item, Exception):
+                results[index] = {"index": index, "status": "error", "error": str(item)}
+                continue
+
+            row, attendees, error = validate_registration(item, meetings, churches)
+            if error:
+                results[index] = {"index": index, "status": "error", "error": error}
+                continue
+
+            if row["invoice_number"] is not None and row["invoice_number"] in seen_invoices:
+                results[index] = {"index": index, "status": "conflict", "invoice_number": row["invoice_number"],
+                                  "error": "Duplicate invoice number in request"}
+                continue
+            seen_invoices.add(row["invoice_number"])
+            valid.append((index, row, attendees))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    seen_invoices.discard(None)
+    unnumbered = [row for _, row, _ in valid if row["invoice_number"] is None]
+    for row, number in zip(unnumbered, allocate_invoice_numbers(len(unnumbered)) if unnumbered else []):
+        row["invoice_number"] = number
+        seen_invoices.add(number)
+
+    taken = existing_invoice_numbers(seen_invoices, batch_size)
+    pending = []
+    for index, row, attendees in valid:
+        if row["invoice_number"] in taken:
+            results[index] = {"index": index, "status": "conflict", "invoice_number": row["invoice_number"],
+                              "error": "Invoice number already exists"}
+        else:
+            pending.append((index, row, attendees))
+
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        with seat_writes([row["meeting_id"] for _, row, _ in batch]):
+            try:
+                ids = insert_batch(batch)
+            except (IntegrityError, SeatsExceedCapacity):
+                # A concurrent writer claimed one of the invoice numbers, or lowered a
+                # meeting's capacity, since the checks above
+                db.session.rollback()
+                insert_rows_individually(batch, results)
+                continue
+        for (index, row, _), registration_id in zip(batch, ids):
+            results[index] = {"index": index, "status": "created", "id": registration_id,
+                              "invoice_number": row["invoice_number"], "registration_status": row["status"]}
+
+    ordered = [results[index] for index in sorted(results)]
+    created = sum(1 for r in ordered if r["status"] == "created")
+    return jsonify({
+        "message": "Bulk registration processed",
+        "created": created,
+        "failed": len(ordered) - created,
+        "results": ordered
+    }), 200
+
+
+# -------------------------------
+# CLI COMMANDS
+# -------------------------------
+
+@registration_bp.cli.command('purge-idempotency-keys')
+def purge_idempotency_keys_command():
+    """Delete stored Idempotency-Key responses whose TTL has passed."""
+    print(f"Deleted {purge_expired_keys(force=True)} expired idempotency keys.")
+
+
+@registration_bp.cli.command('backfill-church-ids')
+@click.option('--batch-size', default=BACKFILL_BATCH_SIZE, type=int, help='Registrations per transaction.')
+@click.option('--rescan', is_flag=True, help='Re-resolve rows that already have a church_id.')
+def backfill_church_ids_command(batch_size, rescan):
+    """Link registrations to churches by resolving their location names."""
+    resolved, unresolved = backfill_church_ids(batch_size, rescan)
+    print(f"Linked {resolved} registrations to churches; {unresolved} names did not match any church.")
+
+
+@registration_bp.cli.command('recount-seats')
+def recount_seats_command():
+    """Rebuild meeting seat and waitlist counters from registrations and promote waitlists."""
+    print(f"Recounted seats for {recount_seats()} meetings.")
@@ -0,0 +1,317 @@
+import re
+import unicodedata
+from sqlalchemy import DDL, Boolean, event, func, or_, select, text, update
+from checkin import current_version, oldest_version
+from config import db
+from models import Attendee, CacheVersion, Registration, SyncChange
+
+SEARCH_TABLE = 'attendee_search'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+FUZZY_MIN_LENGTH = 4
+# Only the first RANK_WINDOW hits of a broad query are scored and sorted
+RANK_WINDOW = 200
+TERMS_CHUNK = 5000
+# cache_versions row holding the last change log version folded into the typo table
+TERMS_WATERMARK = 'search_terms'
+
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+# One FTS5 row per attendee (rowid = attendees.id), kept in step by triggers so
+# Core bulk inserts, ORM writes and raw SQL all update it the same way.
+SEARCH_DDL = (
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        name, leader_name, leader_phone, invoice_number, church,
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}_vocab USING fts5vocab({SEARCH_TABLE}, 'row')",
+    # Symmetric-delete index over the vocabulary: each word is stored under itself and
+    # every one-letter deletion of it, so near misses are found with a few key lookups
+    f"""CREATE TABLE IF NOT EXISTS {SEARCH_TABLE}_terms (
+        variant TEXT NOT NULL, term TEXT NOT NULL, PRIMARY KEY (variant, term)
+    ) WITHOUT ROWID""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_attendee_insert AFTER INSERT ON attendees BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_attendee_update AFTER UPDATE OF name, registration_id ON attendees BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        INSERT INTO {SEARCH_TABLE}(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT new.id, new.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM (SELECT 1) LEFT JOIN registrations r ON r.id = new.registration_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_attendee_delete AFTER DELETE ON attendees BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_registration_update
+    AFTER UPDATE OF leader_name, leader_phone, invoice_number, church ON registrations BEGIN
+        DELETE FROM {SEARCH_TABLE} WHERE rowid IN (SELECT id FROM attendees WHERE registration_id = new.id);
+        INSERT INTO {SEARCH_TABLE}(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT a.id, a.name, new.leader_name, new.leader_phone, new.invoice_number, new.church
+        FROM attendees a WHERE a.registration_id = new.id;
+    END""",
+)
+
+DROP_DDL = (
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_registration_update",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_attendee_delete",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_attendee_update",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_attendee_insert",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}_terms",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}_vocab",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+)
+
+# db.create_all() (seeding, benchmarks) gets the index too; migrations run SEARCH_DDL themselves
+for statement in SEARCH_DDL:
+    event.listen(Attendee.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+for statement in DROP_DDL:
+    event.listen(Attendee.__table__, 'before_drop', DDL(statement).execute_if(dialect='sqlite'))
+
+
+def rebuild_search_index():
+    """Refill the index from attendees and registrations in one INSERT ... SELECT"""
+    db.session.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+    db.session.execute(text(
+        f"""INSERT INTO {SEARCH_TABLE}(rowid, name, leader_name, leader_phone, invoice_number, church)
+        SELECT a.id, a.name, r.leader_name, r.leader_phone, r.invoice_number, r.church
+        FROM attendees a LEFT JOIN registrations r ON r.id = a.registration_id"""
+    ))
+    db.session.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+    refresh_search_terms()
+
+
+def tokenize(value):
+    """Lower-cased words with accents stripped, close to FTS5's unicode61 tokenizer"""
+    folded = unicodedata.normalize('NFKD', str(value or '').casefold())
+    return TOKEN.findall(''.join(c for c in folded if not unicodedata.combining(c)))
+
+
+def quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def deletions(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def is_fuzzy_term(term):
+    return len(term) >= FUZZY_MIN_LENGTH and term.isalpha()
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it is known to exceed limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def max_edits(term):
+    return 1 if len(term) < 7 else 2
+
+
+def insert_terms(terms):
+    """Store each word under itself and its one-letter deletions"""
+    rows = []
+    for term in terms:
+        rows.extend({"variant": variant, "term": term} for variant in deletions(term) | {term})
+        if len(rows) >= TERMS_CHUNK:
+            db.session.execute(text(f"INSERT OR IGNORE INTO {SEARCH_TABLE}_terms (variant, term) "
+                                    "VALUES (:variant, :term)"), rows)
+            rows = []
+    if rows:
+        db.session.execute(text(f"INSERT OR IGNORE INTO {SEARCH_TABLE}_terms (variant, term) "
+                                "VALUES (:variant, :term)"), rows)
+
+
+def terms_watermark():
+    return db.session.execute(
+        select(CacheVersion.version).where(CacheVersion.name == TERMS_WATERMARK)
+    ).scalar()
+
+
+def set_terms_watermark(version):
+    """Move the watermark forward; a concurrent refresh that got further is kept"""
+    db.session.execute(text("INSERT OR IGNORE INTO cache_versions (name, version) VALUES (:name, 0)"),
+                       {"name": TERMS_WATERMARK})
+    db.session.execute(
+        update(CacheVersion).where(CacheVersion.name == TERMS_WATERMARK)
+        .values(version=func.max(CacheVersion.version, version))
+    )
+
+
+def refresh_search_terms():
+    """Add vocabulary words missing from the symmetric-delete table; returns how many"""
+    version = current_version()
+    known = set(db.session.execute(text(f"SELECT term FROM {SEARCH_TABLE}_terms WHERE variant = term")).scalars())
+    vocabulary = db.session.execute(text(f"SELECT term FROM {SEARCH_TABLE}_vocab")).scalars()
+    new_terms = [term for term in vocabulary if term not in known and is_fuzzy_term(term)]
+    insert_terms(new_terms)
+    set_terms_watermark(version)
+    db.session.commit()
+    return len(new_terms)
+
+
+def catch_up_search_terms():
+    """Add the words of attendees and registrations written since the last refresh; returns how many
+
+    Reads the change log from the watermark on, so a typo search right after new
+    registrations finds their words at the cost of the changes alone. Falls back
+    to a full refresh_search_terms() when there is no watermark yet or the log
+    has been pruned past it.
+    """
+    watermark = terms_watermark()
+    oldest = oldest_version()
+    if watermark is None or (oldest is not None and oldest > watermark + 1):
+        return refresh_search_terms()
+    version = current_version()
+    if version <= watermark:
+        return 0
+
+    changed = {"attendee": set(), "registration": set()}
+    for entity, entity_id in db.session.execute(
+        select(SyncChange.entity, SyncChange.entity_id).where(
+            SyncChange.version > watermark, SyncChange.version <= version,
+            SyncChange.entity.in_(changed), SyncChange.op == 'upsert')
+    ):
+        changed[entity].add(entity_id)
+    values = []
+    values += db.session.scalars(select(Attendee.name).where(Attendee.id.in_(changed["attendee"]))).all()
+    for row in db.session.execute(
+        select(Registration.leader_name, Registration.leader_phone, Registration.invoice_number, Registration.church)
+        .where(Registration.id.in_(changed["registration"]))
+    ):
+        values.extend(row)
+    terms = {term for value in values for term in tokenize(value) if is_fuzzy_term(term)}
+    insert_terms(terms)
+    set_terms_watermark(version)
+    db.session.commit()
+    return len(terms)
+
+
+def similar_terms(token):
+    """Indexed words within max_edits of token, found through the symmetric-delete table"""
+    keys = sorted(deletions(token) | {token})
+    placeholders = ", ".join(f":k{i}" for i in range(len(keys)))
+    candidates = db.session.execute(
+        text(f"SELECT DISTINCT term FROM {SEARCH_TABLE}_terms WHERE variant IN ({placeholders})"),
+        {f"k{i}": key for i, key in enumerate(keys)}
+    ).scalars()
+    limit = max_edits(token)
+    return [term for term in candidates if term != token and edit_distance(token, term, limit) <= limit]
+
+
+def prefix_expression(tokens):
+    return ' AND '.join(f"{quote(t)}*" for t in tokens)
+
+
+def fuzzy_expression(tokens):
+    """Each token may match itself as a prefix or any indexed word close to it"""
+    groups = []
+    for token in tokens:
+        alternatives = [f"{quote(token)}*"]
+        if is_fuzzy_term(token):
+            alternatives.extend(quote(t) for t in similar_terms(token))
+        groups.append('(' + ' OR '.join(alternatives) + ')')
+    return ' AND '.join(groups)
+
+
+RESULT_SQL = f"""
+    SELECT a.id, a.name, a.age, r.id AS registration_id, r.leader_name, r.leader_phone,
+           r.invoice_number, r.church, r.paid
+    FROM (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :expression LIMIT :window) s
+    JOIN attendees a ON a.id = s.rowid
+    LEFT JOIN registrations r ON r.id = a.registration_id
+"""
+
+# How much a query word found in each field counts towards a result's score
+FIELD_WEIGHTS = (("name", 4), ("leader_name", 2), ("invoice_number", 2), ("leader_phone", 1), ("church", 1))
+
+
+def score(row, tokens):
+    """Whole-word hits beat prefix hits; hits on the attendee's own name beat the rest"""
+    total = 0
+    for field, weight in FIELD_WEIGHTS:
+        words = tokenize(row[field])
+        for token in tokens:
+            if token in words:
+                total += 2 * weight
+            elif any(word.startswith(token) for word in words):
+                total += weight
+    return total
+
+
+def run_match(expression, tokens, limit):
+    # bm25 counts every document containing each query word before scoring, which
+    # costs a full doclist scan for common words ("inv", a popular surname). The
+    # first RANK_WINDOW hits are scored here instead.
+    params = {"expression": expression, "window": max(limit, RANK_WINDOW)}
+    # Typed, so paid comes back as a bool like it does from invoice_search
+    rows = [dict(row._mapping) for row in db.session.execute(text(RESULT_SQL).columns(paid=Boolean), params)]
+    rows.sort(key=lambda row: (-score(row, tokens), row["id"]))
+    return rows[:limit]
+
+
+def search_attendees(query, limit=DEFAULT_LIMIT):
+    """Return (results, mode): prefix matches first, typo-tolerant matches when none are found"""
+    tokens = tokenize(query)
+    if not tokens:
+        return [], None
+    if db.engine.dialect.name != 'sqlite':
+        return like_search(tokens, limit), 'like'
+
+    # A whole invoice number goes straight to the unique index; through FTS its
+    # prefix word ("inv") would be ANDed against nearly every row
+    query = query.strip()
+    if any(c.isdigit() for c in query) and not any(c.isspace() for c in query):
+        results = invoice_search(query, limit)
+        if results:
+            return results, 'invoice'
+
+    results = run_match(prefix_expression(tokens), tokens, limit)
+    if results:
+        return results, 'prefix'
+    catch_up_search_terms()
+    expression = fuzzy_expression(tokens)
+    if expression == prefix_expression(tokens):
+        return [], 'fuzzy'
+    return run_match(expression, tokens, limit), 'fuzzy'
+
+
+def result_query():
+    return db.session.query(
+        Attendee.id, Attendee.name, Attendee.age, Registration.id.label('registration_id'),
+        Registration.leader_name, Registration.leader_phone, Registration.invoice_number,
+        Registration.church, Registration.paid
+    )
+
+
+def invoice_search(invoice_number, limit):
+    query = result_query().join(Registration, Registration.id == Attendee.registration_id) \
+        .filter(Registration.invoice_number.in_({invoice_number, invoice_number.upper()})) \
+        .order_by(Attendee.id)
+    return [dict(row._mapping) for row in query.limit(limit)]
+
+
+def like_search(tokens, limit):
+    """Fallback for databases without FTS5: every token must appear in some field"""
+    query = result_query().outerjoin(Registration, Registration.id == Attendee.registration_id)
+    fields = (Attendee.name, Registration.leader_name, Registration.leader_phone,
+              Registration.invoice_number, Registration.church)
+    for token in tokens:
+        query = query.filter(or_(*(field.ilike(f"%{token}%") for field in fields)))
+    return [dict(row._mapping) for row in query.limit(limit)]
+
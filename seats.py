@@ -0,0 +1,305 @@
+import threading
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from sqlalchemy import func, or_, select, update
+from config import db
+from events import registration_status_changed
+from models import Meeting, Registration
+from response_cache import invalidate
+from rollups import record_status_change
+
+CONFIRMED = 'confirmed'
+WAITLISTED = 'waitlisted'
+CANCELLED = 'cancelled'
+
+UNSYNCED = {"synchronize_session": False}
+
+
+class SeatsExceedCapacity(Exception):
+    """A group larger than the meeting's capacity, which could never be promoted from the waitlist"""
+
+
+_meeting_locks = defaultdict(threading.Lock)
+_meeting_locks_guard = threading.Lock()
+
+
+def seats_for(attendees):
+    """Seats a registration needs: one per attendee, and at least one for the group"""
+    return max(1, len(attendees))
+
+
+@contextmanager
+def seat_writes(meeting_ids):
+    """Queue this process's seat transactions for the same meetings behind a lock
+
+    The database already keeps the counters right; this only stops hundreds of
+    requests for one popular meeting from all waiting on the database lock at
+    once, where SQLite's busy handler polls with sleeps of up to 100 ms. Wrap the
+    whole transaction, commit included. Locks are taken in id order.
+    """
+    with _meeting_locks_guard:
+        locks = [_meeting_locks[meeting_id] for meeting_id in sorted(set(meeting_ids) - {None})]
+    with ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+        yield
+
+
+def meeting_changed(meeting_id):
+    """Evict the meeting's cached responses, whose seat counters are about to change, on commit"""
+    invalidate("meetings", f"meeting:{meeting_id}")
+
+
+def meeting_terms(meeting_id, cache=None):
+    """(id, deadline, registration_amount, capacity) for a meeting, or None; ``cache`` is a per-request dict"""
+    if cache is not None and meeting_id in cache:
+        return cache[meeting_id]
+    terms = db.session.execute(
+        select(Meeting.id, Meeting.deadline, Meeting.registration_amount, Meeting.capacity)
+        .where(Meeting.id == meeting_id)
+    ).first()
+    if cache is not None:
+        cache[meeting_id] = terms
+    return terms
+
+
+def take_seats(meeting_id, seats):
+    """Claim seats with one conditional UPDATE; False when they do not fit
+
+    Nobody jumps the queue: while anyone is waitlisted, new registrations wait too.
+    """
+    taken = db.session.execute(
+        update(Meeting)
+        .where(Meeting.id == meeting_id, Meeting.waitlist_count == 0,
+               or_(Meeting.capacity.is_(None), Meeting.seats_taken + seats <= Meeting.capacity))
+        .values(seats_taken=Meeting.seats_taken + seats),
+        execution_options=UNSYNCED
+    ).rowcount == 1
+    if taken:
+        meeting_changed(meeting_id)
+    return taken
+
+
+def reserve_seats(meeting_id, seats):
+    """Return the status for a new registration, updating the meeting's counters
+
+    Runs in the caller's transaction, so a failed insert gives the seats back.
+    Raises SeatsExceedCapacity rather than queueing a group that can never fit,
+    which would hold up everyone behind it.
+    """
+    if take_seats(meeting_id, seats):
+        return CONFIRMED
+    # Joining the waitlist writes the same row, so it serializes with cancellations and capacity changes
+    joined = db.session.execute(
+        update(Meeting)
+        .where(Meeting.id == meeting_id, or_(Meeting.capacity.is_(None), Meeting.capacity >= seats))
+        .values(waitlist_count=Meeting.waitlist_count + 1),
+        execution_options=UNSYNCED
+    ).rowcount
+    if not joined:
+        raise SeatsExceedCapacity(f"A group of {seats} is larger than the meeting's capacity")
+    meeting_changed(meeting_id)
+    return WAITLISTED
+
+
+def assign_seats(rows):
+    """Set status on registration row dicts, reserving seats in row order
+
+    Each meeting is tried with a single UPDATE for the whole batch first; only a
+    meeting that is filling up falls back to one UPDATE per row. Meetings are
+    locked in id order so concurrent batches cannot deadlock.
+    """
+    by_meeting = defaultdict(list)
+    for row in rows:
+        if row.get("meeting_id") is None:
+            row["status"] = CONFIRMED
+        else:
+            by_meeting[row["meeting_id"]].append(row)
+
+    for meeting_id in sorted(by_meeting):
+        group = by_meeting[meeting_id]
+        if take_seats(meeting_id, sum(row["seats"] for row in group)):
+            for row in group:
+                row["status"] = CONFIRMED
+            continue
+        for row in group:
+            row["status"] = reserve_seats(meeting_id, row["seats"])
+
+
+def lock_meeting(meeting_id):
+    """Take the meeting's row lock (a whole-database write lock on SQLite) for this transaction"""
+    return db.session.execute(
+        update(Meeting).where(Meeting.id == meeting_id).values(seats_taken=Meeting.seats_taken),
+        execution_options=UNSYNCED
+    ).rowcount == 1
+
+
+def promote_waitlist(meeting_id):
+    """Confirm waitlisted registrations in arrival order while their seats fit
+
+    The caller must hold the meeting lock. Promotion stops at the first group
+    that does not fit rather than letting smaller, later groups overtake it.
+    Promoted registrations join the rollups. Returns their ids.
+    """
+    meeting = db.session.execute(
+        select(Meeting.capacity, Meeting.seats_taken).where(Meeting.id == meeting_id)
+    ).first()
+    if meeting is None:
+        return []
+
+    free = None if meeting.capacity is None else meeting.capacity - meeting.seats_taken
+    promoted, seats = [], 0
+    waiting = db.session.execute(
+        select(Registration.id, Registration.seats)
+        .where(Registration.meeting_id == meeting_id, Registration.status == WAITLISTED)
+        .order_by(Registration.id)
+    )
+    for registration_id, needed in waiting:
+        if free is not None and seats + needed > free:
+            break
+        promoted.append(registration_id)
+        seats += needed
+    waiting.close()
+
+    if promoted:
+        db.session.execute(
+            update(Registration).where(Registration.id.in_(promoted)).values(status=CONFIRMED),
+            execution_options=UNSYNCED
+        )
+        registration_status_changed(promoted, meeting_id, CONFIRMED)
+        record_status_change(promoted, 1)
+        db.session.execute(
+            update(Meeting).where(Meeting.id == meeting_id).values(
+                seats_taken=Meeting.seats_taken + seats,
+                waitlist_count=Meeting.waitlist_count - len(promoted),
+            ),
+            execution_options=UNSYNCED
+        )
+        meeting_changed(meeting_id)
+    return promoted
+
+
+def largest_waitlisted_group(meeting_id):
+    """Seats needed by the biggest group waiting for a meeting, or None when nobody is"""
+    return db.session.execute(
+        select(func.max(Registration.seats))
+        .where(Registration.meeting_id == meeting_id, Registration.status == WAITLISTED)
+    ).scalar()
+
+
+def cancel_registration(registration_id):
+    """Cancel a registration and hand its seats to the waitlist, then commit
+
+    A confirmed registration leaves the rollups in the same transaction.
+    Returns None if the registration does not exist, otherwise
+    (previous_status, promoted_ids).
+    """
+    registration = db.session.execute(
+        select(Registration.status, Registration.meeting_id, Registration.seats).where(Registration.id == registration_id)
+    ).first()
+    if registration is None:
+        return None
+    if registration.status == CANCELLED:
+        return CANCELLED, []
+
+    meeting_id = registration.meeting_id
+    with seat_writes([meeting_id]):
+        if meeting_id is not None:
+            lock_meeting(meeting_id)
+        # Conditional on the status read above, so a concurrent promotion or cancel cannot be counted twice
+        changed = db.session.execute(
+            update(Registration)
+            .where(Registration.id == registration_id, Registration.status == registration.status)
+            .values(status=CANCELLED, cancelled_at=datetime.utcnow()),
+            execution_options=UNSYNCED
+        ).rowcount
+        if not changed:
+            db.session.rollback()
+        else:
+            registration_status_changed([registration_id], meeting_id, CANCELLED)
+            if registration.status == CONFIRMED:
+                record_status_change([registration_id], -1)
+            promoted = []
+            if meeting_id is not None:
+                if registration.status == CONFIRMED:
+                    released = {"seats_taken": Meeting.seats_taken - registration.seats}
+                else:
+                    released = {"waitlist_count": Meeting.waitlist_count - 1}
+                db.session.execute(update(Meeting).where(Meeting.id == meeting_id).values(**released),
+                                   execution_options=UNSYNCED)
+                meeting_changed(meeting_id)
+                promoted = promote_waitlist(meeting_id)
+            db.session.commit()
+            return registration.status, promoted
+    return cancel_registration(registration_id)
+
+
+def detach_meeting(meeting_id):
+    """Cancel a meeting's registrations and clear their meeting_id before the meeting is deleted
+
+    SQLite does not enforce the foreign key's ON DELETE SET NULL here, and a
+    deleted meeting's id can be handed to the next meeting created. The caller
+    must hold the meeting lock. Confirmed registrations leave the rollups.
+    """
+    confirmed = db.session.scalars(
+        select(Registration.id).where(Registration.meeting_id == meeting_id, Registration.status == CONFIRMED)
+    ).all()
+    record_status_change(confirmed, -1)
+    cancelled = db.session.execute(
+        update(Registration)
+        .where(Registration.meeting_id == meeting_id, Registration.status != CANCELLED)
+        .values(status=CANCELLED, cancelled_at=datetime.utcnow())
+        .returning(Registration.id),
+        execution_options=UNSYNCED
+    ).scalars().all()
+    registration_status_changed(cancelled, meeting_id, CANCELLED)
+    db.session.execute(
+        update(Registration).where(Registration.meeting_id == meeting_id).values(meeting_id=None),
+        execution_options=UNSYNCED
+    )
+    return cancelled
+
+
+def recount_seats():
+    """Recompute every meeting's seat and waitlist counters from its registrations"""
+    meeting_ids = db.session.scalars(select(Meeting.id).order_by(Meeting.id)).all()
+    for meeting_id in meeting_ids:
+        lock_meeting(meeting_id)
+        counts = {status: (seats, registrations) for status, seats, registrations in db.session.execute(
+            select(Registration.status, func.sum(Registration.seats), func.count())
+            .where(Registration.meeting_id == meeting_id)
+            .group_by(Registration.status)
+        )}
+        db.session.execute(
+            update(Meeting).where(Meeting.id == meeting_id).values(
+                seats_taken=counts.get(CONFIRMED, (0, 0))[0],
+                waitlist_count=counts.get(WAITLISTED, (0, 0))[1],
+            ),
+            execution_options=UNSYNCED
+        )
+        meeting_changed(meeting_id)
+        promote_waitlist(meeting_id)
+        db.session.commit()
+    return len(meeting_ids)
+
+
+def close_waitlist(meeting_id):
+    """Cancel everyone still waitlisted for a meeting, then commit; returns how many were cancelled"""
+    with seat_writes([meeting_id]):
+        if not lock_meeting(meeting_id):
+            db.session.rollback()
+            return 0
+        cancelled = db.session.execute(
+            update(Registration)
+            .where(Registration.meeting_id == meeting_id, Registration.status == WAITLISTED)
+            .values(status=CANCELLED, cancelled_at=datetime.utcnow())
+            .returning(Registration.id),
+            execution_options=UNSYNCED
+        ).scalars().all()
+        registration_status_changed(cancelled, meeting_id, CANCELLED)
+        db.session.execute(update(Meeting).where(Meeting.id == meeting_id).values(waitlist_count=0),
+                           execution_options=UNSYNCED)
+        meeting_changed(meeting_id)
+        db.session.commit()
+    return len(cancelled)
@@ -0,0 +1,135 @@
+import dataclasses
+import decimal
+import json
+import math
+import uuid
+from datetime import date, datetime, time
+from functools import lru_cache
+from operator import attrgetter
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+
+# --------------- JSON provider -----------------
+def default(value):
+    """Types neither encoder handles natively, rendered the same way by both"""
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return dataclasses.asdict(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def stdlib_default(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return default(value)
+
+
+def finite(value):
+    """Replace NaN/Infinity with None, as orjson does, so both encoders agree"""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {k: finite(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [finite(v) for v in value]
+    return value
+
+
+class FastJSONProvider(JSONProvider):
+    """JSON provider backed by orjson, falling back to the stdlib encoder
+
+    Datetimes are ISO 8601 (naive values stay naive) and non-finite floats
+    become null, whichever encoder is in use.
+    """
+
+    sort_keys = False
+    mimetype = 'application/json'
+
+    def dumps_bytes(self, obj):
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS
+            if self.sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=default, option=option)
+        return json.dumps(finite(obj), default=stdlib_default, separators=(',', ':'), allow_nan=False,
+                          sort_keys=self.sort_keys, ensure_ascii=False).encode('utf-8')
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            kwargs.setdefault('default', stdlib_default)
+            return json.dumps(finite(obj), **kwargs)
+        return self.dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
+
+
+# --------------- Model serializers -----------------
+def model_serializer(fields):
+    """Return a function mapping an object to a dict of ``fields``
+
+    One attrgetter fetches every field in C per row, zipped with the names.
+    """
+    fields = tuple(fields)
+    for field in fields:
+        if not field.isidentifier():
+            raise ValueError(f"Invalid field name: {field!r}")
+    if not fields:
+        return lambda obj: {}
+    if len(fields) == 1:
+        # attrgetter with a single name returns the bare value, not a 1-tuple
+        field, getter = fields[0], attrgetter(fields[0])
+        return lambda obj: {field: getter(obj)}
+    getter = attrgetter(*fields)
+    return lambda obj: dict(zip(fields, getter(obj)))
+
+
+@lru_cache(maxsize=128)
+def cached_serializer(fields):
+    return model_serializer(fields)
+
+
+MEETING_FIELDS = ("id", "title", "date", "deadline", "registration_amount", "poster_url", "poster_thumbnails",
+                  "description", "capacity", "seats_taken", "waitlist_count")
+LOCATION_FIELDS = ("id", "name")
+ADMIN_FIELDS = ("id", "username", "email", "role", "is_active", "created_at")
+JOB_FIELDS = ("id", "name", "key", "status", "attempts", "max_attempts", "run_at", "created_at", "started_at",
+              "finished_at", "worker", "last_error")
+
+serialize_meeting = model_serializer(MEETING_FIELDS)
+serialize_location = model_serializer(LOCATION_FIELDS)
+serialize_admin = model_serializer(ADMIN_FIELDS)
+serialize_job_fields = model_serializer(JOB_FIELDS)
+
+
+def serialize_job(job):
+    """Job fields plus its payload and result decoded from their JSON columns"""
+    data = serialize_job_fields(job)
+    data["payload"] = json.loads(job.payload or '{}')
+    data["result"] = json.loads(job.result) if job.result else None
+    return data
+
+
+def meeting_serializer(fields):
+    """Serializer for a subset of MEETING_FIELDS, kept in the canonical order"""
+    return cached_serializer(tuple(f for f in MEETING_FIELDS if f in fields))
+
+
+def init_json(app):
+    app.json = FastJSONProvider(app)
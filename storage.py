@@ -0,0 +1,75 @@
+import importlib
+import os
+import shutil
+import tempfile
+from flask import current_app
+
+
+class LocalStore:
+    """Keeps assets under a directory on local disk
+
+    Other stores (S3, GCS, ...) implement the same methods; ``url`` returns a
+    public URL for the key, or None when the app should serve the bytes itself,
+    and ``path`` is only needed by stores the app serves from local disk.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid asset key: {key!r}")
+        return path
+
+    def save(self, key, source_path):
+        """Copy ``source_path`` to ``key`` atomically; an existing key is left alone"""
+        path = self.path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.upload-')
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def open(self, key):
+        return open(self.path(key), 'rb')
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def url(self, key):
+        return None
+
+
+def load_store(spec, app):
+    """Build the store named by ASSET_STORE: 'local' or 'package.module:Class'
+
+    A custom class is constructed with the app so it can read its own config.
+    """
+    if spec == 'local':
+        return LocalStore(app.config['ASSET_STORE_ROOT'])
+    module_name, _, class_name = spec.partition(':')
+    return getattr(importlib.import_module(module_name), class_name)(app)
+
+
+def init_storage(app):
+    app.config.setdefault('ASSET_STORE', os.environ.get('ASSET_STORE', 'local'))
+    app.config.setdefault('ASSET_STORE_ROOT', os.environ.get('ASSET_STORE_ROOT')
+                          or os.path.join(app.instance_path, 'uploads'))
+    app.extensions['asset_store'] = load_store(app.config['ASSET_STORE'], app)
+
+
+def asset_store():
+    return current_app.extensions['asset_store']
@@ -0,0 +1,67 @@
+import archive
+import mailer
+import rollups
+import search
+import seats
+from datetime import datetime
+from flask import current_app
+from config import db
+from jobs import schedule, task, unschedule
+from models import Meeting
+
+
+@task()
+def send_email(to, subject, body):
+    mailer.send_email(to, subject, body)
+
+
+@task(admin=True)
+def rebuild_rollups():
+    rollups.rebuild_rollups()
+
+
+@task(admin=True)
+def rebuild_search_index():
+    search.rebuild_search_index()
+
+
+@task(admin=True)
+def recount_seats():
+    return {"meetings": seats.recount_seats()}
+
+
+@task(admin=True)
+def archive_past_meetings():
+    days = current_app.config.get('ARCHIVE_AFTER_DAYS', archive.DEFAULT_ARCHIVE_AFTER_DAYS)
+    return {"archived": archive.archive_past_meetings(days)}
+
+
+# -------------------------------
+# SCHEDULED JOBS
+# -------------------------------
+
+def close_registration_key(meeting_id):
+    return f"close-registration:{meeting_id}"
+
+
+@task()
+def close_registration(meeting_id):
+    """At a meeting's deadline, release its waitlist; new registrations are already refused"""
+    meeting = db.session.get(Meeting, meeting_id)
+    if meeting is None:
+        return None
+    if meeting.deadline > datetime.utcnow():
+        # The deadline moved after this run was claimed
+        schedule_registration_close(meeting)
+        return {"rescheduled": meeting.deadline.isoformat()}
+    return {"waitlist_cancelled": seats.close_waitlist(meeting_id)}
+
+
+def schedule_registration_close(meeting):
+    """Queue close_registration for the meeting's deadline in the caller's transaction"""
+    schedule('close_registration', close_registration_key(meeting.id), meeting.deadline,
+             {"meeting_id": meeting.id}, commit=False)
+
+
+def unschedule_registration_close(meeting_id):
+    unschedule(close_registration_key(meeting_id), commit=False)